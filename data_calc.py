@@ -1,45 +1,53 @@
 import numpy as np
-import random
+
+from lazy_seq import LazySeq
+from word_sampler import WordSampler
 
 
 class DataCalc(object):
-    def __init__(self, n_words=100, max_num=10, n_answer_tpls=3, n_simple_qa_pairs=7, percent_qa=0.0):
-        self.vocab = ["w%.3d" % i for i in range(n_words)]
+    def __init__(self, n_words=100, max_num=10, n_answer_tpls=3, n_simple_qa_pairs=7, percent_qa=0.0, random_state=None):
+        # Random state (np.random.RandomState) used for the vocabulary and by
+        # default for the generated data; the global numpy one if None.
+        self.random_state = random_state if random_state is not None else np.random
+
+        self.words = ["w%.3d" % i for i in range(n_words)]
         self.max_num = max_num
         self.percent_qa = percent_qa
 
-        p_w = np.zeros((len(self.vocab), ))
+        p_w = np.zeros((n_words, ))
         for i in range(len(p_w)):
-            word_id = np.random.randint(len(p_w))
+            word_id = self.random_state.randint(len(p_w))
             p_w[word_id] = 1.0 / (i + 1)
 
         p_w /= p_w.sum()
 
         self.vocab_p = p_w
+        self.word_sampler = WordSampler(p_w)
+        self.n_words = n_words
 
-        self.db = []
-        for i in range(self.max_num):
-            for y in range(self.max_num):
-                self.vocab.append('%d+%d' % (i, y, ))
-                self.vocab.append('%d' % (i + y))
-                self.db.append(("%d+%d" % (i, y, ), "%d" % (i + y)))
+        # Vocabulary: the random words, the questions 'a+b' (position
+        # n_words + a * max_num + b) and the answers '0'..'2 * (max_num - 1)'
+        # (each once). It and the facts are generated on access.
+        self.n_sums = max(2 * max_num - 1, 0)
+        self.vocab = LazySeq(n_words + max_num ** 2 + self.n_sums, self._vocab_word, self._iter_vocab)
+        self.db = LazySeq(max_num ** 2, self._fact, self._iter_facts)
 
         a_tpls = []
         for i in range(n_answer_tpls):
-            gen_n_words = np.random.poisson(3) + 1
-            a_tpl = self._gen_seq(gen_n_words)
-            a_tpl_pos = np.random.randint(len(a_tpl))
+            gen_n_words = self.random_state.poisson(3) + 1
+            a_tpl = self._gen_seq(gen_n_words, self.random_state)
+            a_tpl_pos = self.random_state.randint(len(a_tpl))
             a_tpls.append((a_tpl, a_tpl_pos, ))
 
         self.a_tpls = a_tpls
 
         self.simple_qa_pairs = []
         for i in range(n_simple_qa_pairs):
-            gen_n_words = np.random.poisson(3) + 1
-            q = self._gen_seq(gen_n_words)
-            gen_n_words = np.random.poisson(3) + 1
-            a = self._gen_seq(gen_n_words)
-            a.append('[EOS]')
+            gen_n_words = self.random_state.poisson(3) + 1
+            q = self._gen_seq(gen_n_words, self.random_state)
+            gen_n_words = self.random_state.poisson(3) + 1
+            a = self._gen_seq(gen_n_words, self.random_state)
+            a.append(self._eos_pos())
 
             self.simple_qa_pairs.append((q, a))
 
@@ -48,6 +56,63 @@ class DataCalc(object):
 
 
 
+    def _eos_pos(self):
+        """Position of [EOS] in the generated sequences (one past the vocabulary)."""
+        return len(self.vocab)
+
+    def _q_pos(self, a, b):
+        """Position of the question token 'a+b' in the vocabulary."""
+        return self.n_words + a * self.max_num + b
+
+    def _a_pos(self, a, b):
+        """Position of the answer token 'a+b' evaluates to in the vocabulary."""
+        return self.n_words + self.max_num ** 2 + a + b
+
+    def _vocab_word(self, pos):
+        if pos < self.n_words:
+            return self.words[pos]
+
+        pos -= self.n_words
+        if pos < self.max_num ** 2:
+            return '%d+%d' % divmod(pos, self.max_num)
+
+        return '%d' % (pos - self.max_num ** 2)
+
+    def _word(self, pos):
+        """Word at the position in the generated sequences."""
+        return '[EOS]' if pos == self._eos_pos() else self.vocab[pos]
+
+    def _fact(self, i):
+        a, b = divmod(i, self.max_num)
+        return ('%d+%d' % (a, b, ), '%d' % (a + b))
+
+    def _iter_vocab(self):
+        nums = ['%d' % i for i in xrange(self.n_sums)]
+        for word in self.words:
+            yield word
+        for a in xrange(self.max_num):
+            for b in xrange(self.max_num):
+                yield nums[a] + '+' + nums[b]
+        for num in nums:
+            yield num
+
+    def _iter_facts(self):
+        nums = ['%d' % i for i in xrange(self.n_sums)]
+        for a in xrange(self.max_num):
+            for b in xrange(self.max_num):
+                yield (nums[a] + '+' + nums[b], nums[a + b])
+
+    def decoder(self, vocab=None):
+        """Function converting sequences of vocabulary positions (as generated
+        internally) into lists of words, or into arrays of ids in `vocab`
+        (word -> id mapping, e.g. `DB.vocab`)."""
+        if vocab is None:
+            return lambda seq: [self._word(i) for i in seq]
+
+        ids = np.fromiter((vocab[word] for word in self.vocab), dtype=int, count=len(self.vocab))
+        ids = np.append(ids, vocab['[EOS]'])
+        return lambda seq: ids[seq]
+
     def get_vocab(self):
         return self.vocab
 
@@ -55,21 +120,27 @@ class DataCalc(object):
         return self.db
 
 
-    def gen_data(self, test_data=False, simple_answer=False, simple_question=False):
+    def gen_data(self, test_data=False, simple_answer=False, simple_question=False, vocab=None, random_state=None):
+        """Generate (question, answer) pairs forever. They are lists of words, or
+        with `vocab` arrays of ids in it (see `decoder`).
+        They are drawn from `random_state` (`self.random_state` if None)."""
+        random_state = random_state if random_state is not None else self.random_state
+        decode = self.decoder(vocab)
         while True:
-            if np.random.random() < self.percent_qa:
-                yield random.choice(self.simple_qa_pairs)
+            if random_state.random_sample() < self.percent_qa:
+                q, a = self.simple_qa_pairs[random_state.randint(len(self.simple_qa_pairs))]
+                yield (decode(q), decode(a))
             else:
-                a = np.random.randint(1, self.max_num)
-                b = np.random.randint(a)
+                a = random_state.randint(1, self.max_num)
+                b = random_state.randint(a)
 
                 if test_data:
                     tmp = a
                     a = b
                     b = tmp
 
-                n_words = np.random.poisson(3) + 1
-                seq_q = self._gen_seq(n_words)
+                n_words = random_state.poisson(3) + 1
+                seq_q = self._gen_seq(n_words, random_state)
 
                 # if a + b < 10:
                 #     tpl_ndx = 0
@@ -80,13 +151,13 @@ class DataCalc(object):
                 tpl_ndx = 1
 
                 a_tpl, a_tpl_pos = self.a_tpls[tpl_ndx]
-                seq_a = list(a_tpl) + ['[EOS]']
+                seq_a = list(a_tpl) + [self._eos_pos()]
 
 
-                q = "%d+%d" % (a, b, )
-                seq_q.insert(np.random.randint(len(seq_q)), q)
+                q = self._q_pos(a, b)
+                seq_q.insert(random_state.randint(len(seq_q)), q)
 
-                a = "%d" % (a + b, )
+                a = self._a_pos(a, b)
                 seq_a.insert(a_tpl_pos, a)
 
                 if simple_answer:
@@ -99,11 +170,8 @@ class DataCalc(object):
                 else:
                     res_q = seq_q
 
-                yield (res_q, res_a)
-
-    def _gen_seq(self, n_words):
-        seq = []
-        for i in range(n_words):
-            seq.append(np.random.choice(self.vocab[:len(self.vocab_p)], p=self.vocab_p))
+                yield (decode(res_q), decode(res_a))
 
-        return seq
\ No newline at end of file
+    def _gen_seq(self, n_words, random_state):
+        """List of positions of `n_words` random words in the vocabulary."""
+        return list(self.word_sampler.sample(n_words, random_state))
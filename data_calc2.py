@@ -1,71 +1,115 @@
 import numpy as np
-import random
+
+from lazy_seq import LazySeq
+from word_sampler import WordSampler
 
 
 class DataCalc2(object):
-    def __init__(self, n_words=100, max_num=10, n_answer_tpls=3, n_simple_qa_pairs=7, percent_qa=0.0):
-        self.vocab = ["w%.3d" % i for i in range(n_words)]
+    def __init__(self, n_words=100, max_num=10, n_answer_tpls=3, n_simple_qa_pairs=7, percent_qa=0.0, random_state=None):
+        # Random state (np.random.RandomState) used for the vocabulary and by
+        # default for the generated data; the global numpy one if None.
+        self.random_state = random_state if random_state is not None else np.random
+
+        self.words = ["w%.3d" % i for i in range(n_words)]
         self.max_num = max_num
         self.percent_qa = percent_qa
 
-        p_w = np.zeros((len(self.vocab), ))
+        p_w = np.zeros((n_words, ))
         for i in range(len(p_w)):
-            word_id = np.random.randint(len(p_w))
+            word_id = self.random_state.randint(len(p_w))
             p_w[word_id] = 1.0 / (i + 1)
 
         p_w /= p_w.sum()
 
         self.vocab_p = p_w
+        self.word_sampler = WordSampler(p_w)
+        self.n_words = n_words
 
-        self.db = []
-        for i in range(self.max_num):
-            for y in range(self.max_num):
-                self.vocab.append('%d' % (i,))
-                self.vocab.append('%d' % (y,))
-                self.vocab.append('%d' % (i + y))
-
-                self.db.append((str(i), str(y), str(i + y), ))
+        # Vocabulary: the random words and the numbers '0'..'2 * (max_num - 1)'
+        # (each once, at position n_words + number). The facts (i, y, i + y)
+        # are generated on access.
+        self.vocab = self.words + ['%d' % i for i in range(max(2 * max_num - 1, 0))]
+        self.db = LazySeq(max_num ** 2, self._fact, self._iter_facts)
 
         a_tpls = []
         for i in range(n_answer_tpls):
-            gen_n_words = np.random.poisson(3) + 1
-            a_tpl = self._gen_seq(gen_n_words)
-            a_tpl_pos = np.random.randint(len(a_tpl))
+            gen_n_words = self.random_state.poisson(3) + 1
+            a_tpl = self._gen_seq(gen_n_words, self.random_state)
+            a_tpl_pos = self.random_state.randint(len(a_tpl))
             a_tpls.append((a_tpl, a_tpl_pos, ))
 
         self.a_tpls = a_tpls
 
         self.simple_qa_pairs = []
         for i in range(n_simple_qa_pairs):
-            gen_n_words = np.random.poisson(3) + 1
-            q = self._gen_seq(gen_n_words)
-            gen_n_words = np.random.poisson(3) + 1
-            a = self._gen_seq(gen_n_words)
-            a.append('[EOS]')
+            gen_n_words = self.random_state.poisson(3) + 1
+            q = self._gen_seq(gen_n_words, self.random_state)
+            gen_n_words = self.random_state.poisson(3) + 1
+            a = self._gen_seq(gen_n_words, self.random_state)
+            a.append(self._eos_pos())
 
             self.simple_qa_pairs.append((q, a))
 
+    def _eos_pos(self):
+        """Position of [EOS] in the generated sequences (one past the vocabulary)."""
+        return len(self.vocab)
+
+    def _num_pos(self, num):
+        """Position of the number in the vocabulary."""
+        return self.n_words + num
+
+    def _word(self, pos):
+        """Word at the position in the generated sequences."""
+        return '[EOS]' if pos == self._eos_pos() else self.vocab[pos]
+
+    def _fact(self, n):
+        i, y = divmod(n, self.max_num)
+        return ('%d' % i, '%d' % y, '%d' % (i + y), )
+
+    def _iter_facts(self):
+        nums = self.vocab[self.n_words:]
+        for i in xrange(self.max_num):
+            for y in xrange(self.max_num):
+                yield (nums[i], nums[y], nums[i + y], )
+
+    def decoder(self, vocab=None):
+        """Function converting sequences of vocabulary positions (as generated
+        internally) into lists of words, or into arrays of ids in `vocab`
+        (word -> id mapping, e.g. `DB2.vocab`)."""
+        if vocab is None:
+            return lambda seq: [self._word(i) for i in seq]
+
+        ids = np.fromiter((vocab[word] for word in self.vocab), dtype=int, count=len(self.vocab))
+        ids = np.append(ids, vocab['[EOS]'])
+        return lambda seq: ids[seq]
+
     def get_vocab(self):
         return self.vocab
 
     def get_db(self):
         return self.db
 
-    def gen_data(self, test_data=False):
+    def gen_data(self, test_data=False, vocab=None, random_state=None):
+        """Generate (question, answer) pairs forever. They are lists of words, or
+        with `vocab` arrays of ids in it (see `decoder`).
+        They are drawn from `random_state` (`self.random_state` if None)."""
+        random_state = random_state if random_state is not None else self.random_state
+        decode = self.decoder(vocab)
         while True:
-            if np.random.random() < self.percent_qa:
-                yield random.choice(self.simple_qa_pairs)
+            if random_state.random_sample() < self.percent_qa:
+                q, a = self.simple_qa_pairs[random_state.randint(len(self.simple_qa_pairs))]
+                yield (decode(q), decode(a))
             else:
-                a = np.random.randint(1, self.max_num)
-                b = np.random.randint(a)
+                a = random_state.randint(1, self.max_num)
+                b = random_state.randint(a)
 
                 if test_data:
                     tmp = a
                     a = b
                     b = tmp
 
-                n_words = np.random.poisson(3) + 1
-                seq_q = self._gen_seq(n_words)
+                n_words = random_state.poisson(3) + 1
+                seq_q = self._gen_seq(n_words, random_state)
 
                 # if a + b < 10:
                 #     tpl_ndx = 0
@@ -76,25 +120,22 @@ class DataCalc2(object):
                 tpl_ndx = 1
 
                 a_tpl, a_tpl_pos = self.a_tpls[tpl_ndx]
-                seq_a = list(a_tpl) + ['[EOS]']
+                seq_a = list(a_tpl) + [self._eos_pos()]
 
                 #q = "%d+%d" % (a, b, )
-                rand_loc = np.random.randint(len(seq_q))
-                seq_q.insert(rand_loc, str(a))
-                rand_loc = np.random.randint(len(seq_q))
-                seq_q.insert(rand_loc, str(b))
+                rand_loc = random_state.randint(len(seq_q))
+                seq_q.insert(rand_loc, self._num_pos(a))
+                rand_loc = random_state.randint(len(seq_q))
+                seq_q.insert(rand_loc, self._num_pos(b))
 
-                a = "%d" % (a + b, )
+                a = self._num_pos(a + b)
                 seq_a.insert(a_tpl_pos, a)
 
                 res_a = seq_a
                 res_q = seq_q
 
-                yield (res_q, res_a)
-
-    def _gen_seq(self, n_words):
-        seq = []
-        for i in range(n_words):
-            seq.append(np.random.choice(self.vocab[:len(self.vocab_p)], p=self.vocab_p))
+                yield (decode(res_q), decode(res_a))
 
-        return seq
\ No newline at end of file
+    def _gen_seq(self, n_words, random_state):
+        """List of positions of `n_words` random words in the vocabulary."""
+        return list(self.word_sampler.sample(n_words, random_state))
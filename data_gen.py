@@ -5,7 +5,8 @@ Database:
 
 """
 import numpy as np
-import random
+
+from word_sampler import WordSampler
 
 PLACEHOLDER = "[]"
 question_tpls = [
@@ -31,33 +32,32 @@ answer_tpls = [
 
 class DataGenerator(object):
     @staticmethod
-    def generate(n_words, n_db_entries, n_examples):
+    def generate(n_words, n_db_entries, n_examples, random_state=np.random):
         words = ["w%.3d" % i for i in range(n_words)]
         db = [("q%.3d" % i, "q%.3d" % i) for i in range(n_db_entries)]
 
         p_w = np.zeros((len(words), ))
         for i in range(len(words)):
-            word_id = np.random.randint(len(words))
+            word_id = random_state.randint(len(words))
             p_w[word_id] = 1.0 / (i + 1)
 
         p_w_zeros = p_w[p_w == 0.0]
-        p_w_zeros += np.abs(np.random.randn(*p_w_zeros.shape)) * p_w.min()
+        p_w_zeros += np.abs(random_state.randn(*p_w_zeros.shape)) * p_w.min()
         p_w /= p_w.sum()
+        word_sampler = WordSampler(p_w)
 
         sentences = []
         for i in range(n_examples * 2):
-            gen_words = np.random.poisson(5)
+            gen_words = random_state.poisson(5)
 
-            sent = []
-            for y in range(gen_words):
-                sent.append(np.random.choice(words, p=p_w))
+            sent = [words[word_id] for word_id in word_sampler.sample(gen_words, random_state)]
 
             sentences.append(sent)
 
         for s1, s2 in zip(sentences[::2], sentences[1::2]):
-            q, a = np.random.choice(db)
-            q_ndx = np.random.randint(len(s1))
-            a_ndx = np.random.randint(len(s2))
+            q, a = db[random_state.randint(len(db))]
+            q_ndx = random_state.randint(len(s1))
+            a_ndx = random_state.randint(len(s2))
 
             s1.insert(q_ndx, q)
             s2.insert(a_ndx, a)
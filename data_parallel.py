@@ -0,0 +1,60 @@
+"""
+Reproducible data generation in parallel processes.
+
+Every generator draws from an explicit `np.random.RandomState` of a stream
+derived from a single seed by `stream_random_state`. The work is split into
+chunks, chunk k is generated from stream k, so the generated data depends
+only on the seed and the chunk size, not on the number of processes or the
+order in which they finish.
+"""
+import multiprocessing
+
+import numpy as np
+
+
+def stream_random_state(seed, stream_id):
+    """Random state of stream `stream_id` of `seed`.
+
+    The pair is used as the seed key of the Mersenne Twister (init_by_array),
+    so streams of different (seed, stream_id) pairs are unrelated (unlike
+    states seeded with `seed + stream_id`, where stream 1 of seed 0 would be
+    stream 0 of seed 1)."""
+    return np.random.RandomState([seed, stream_id])
+
+
+_make_data = None  # Set before the pool forks, so it need not be picklable.
+
+
+def gen_chunk((seed, chunk_id, n_examples)):
+    """List of `n_examples` examples from `make_data(random_state)` of the
+    chunk's stream."""
+    data = _make_data(stream_random_state(seed, chunk_id))
+    return [next(data) for i in xrange(n_examples)]
+
+
+def gen_examples(make_data, n_examples, seed=0, n_workers=4, chunk_size=1000):
+    """List of `n_examples` examples generated in `n_workers` processes.
+
+    `make_data(random_state)` returns an iterator of examples drawing only from
+    `random_state`, e.g.
+    `lambda rs: calc.gen_data(vocab=db.vocab, random_state=rs)`."""
+    global _make_data
+
+    chunks = [(seed, chunk_id, min(chunk_size, n_examples - start))
+              for chunk_id, start in enumerate(xrange(0, n_examples, chunk_size))]
+
+    _make_data = make_data
+    try:
+        if n_workers > 1:
+            pool = multiprocessing.Pool(n_workers)
+            try:
+                res = pool.map(gen_chunk, chunks, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            res = map(gen_chunk, chunks)
+    finally:
+        _make_data = None
+
+    return [example for chunk in res for example in chunk]
@@ -0,0 +1,190 @@
+"""
+Prefetching of training data in background processes.
+
+Each worker process generates examples (as arrays of token ids, see
+`DataCalc.gen_data(vocab=...)`) from its own random stream
+`stream_random_state(seed, worker_id)`, groups them into batches of similar
+question lengths, pads them and puts the batches into its own bounded queue.
+The trainer takes the batches from the worker queues in round-robin order,
+so the stream of batches depends only on the seed and the number of workers,
+not on the timing of the workers.
+
+Processes (instead of threads) are used because the generators are pure
+Python code that would hold the GIL.
+"""
+import multiprocessing
+from collections import namedtuple
+
+import numpy as np
+
+from data_parallel import stream_random_state
+from metrics import pad
+
+
+PAD = -1
+
+Batch = namedtuple('Batch', 'q q_lens a a_lens')
+PackedBatch = namedtuple('PackedBatch', 'tokens segments resets')
+
+
+def make_batch(examples, pad_value=PAD):
+    """Pad the questions and answers of (x_q, x_a) examples into a `Batch`."""
+    q, q_lens = pad([x_q for x_q, _ in examples], pad_value)
+    a, a_lens = pad([x_a for _, x_a in examples], pad_value)
+
+    return Batch(q=q, q_lens=q_lens, a=a, a_lens=a_lens)
+
+
+def unbatch(batch):
+    """Yield the (x_q, x_a) examples of the batch without padding."""
+    for i in range(len(batch.q)):
+        yield (batch.q[i, :batch.q_lens[i]], batch.a[i, :batch.a_lens[i]])
+
+
+def bucketed_batches(data, batch_size, n_bucket_batches, random_state=np.random):
+    """Take n_bucket_batches * batch_size examples from `data` at a time,
+    sort them by question length and cut them into padded batches. The batches
+    of each such bucket are yielded in random order."""
+    while True:
+        examples = [next(data) for i in range(batch_size * n_bucket_batches)]
+        examples.sort(key=lambda (x_q, x_a): len(x_q))  # Stable, so deterministic.
+
+        starts = range(0, len(examples), batch_size)
+        random_state.shuffle(starts)
+        for start in starts:
+            yield make_batch(examples[start:start + batch_size])
+
+
+class BucketBatchSampler(object):
+    """Batches of example indices with lengths from the same bucket.
+
+    `boundaries` are the sorted bucket boundaries: bucket k contains lengths l
+    with boundaries[k - 1] <= l < boundaries[k]. In every epoch (iteration over
+    the sampler) the examples of each bucket are shuffled and cut into batches
+    and the batches of all buckets are shuffled."""
+    def __init__(self, lengths, boundaries, batch_size, seed=0):
+        self.buckets = np.searchsorted(boundaries, lengths, side='right')
+        self.batch_size = batch_size
+        self.random_state = np.random.RandomState(seed)
+
+    def __iter__(self):
+        batches = []
+        for bucket in np.unique(self.buckets):
+            ids = self.random_state.permutation(np.nonzero(self.buckets == bucket)[0])
+            batches.extend(ids[start:start + self.batch_size] for start in range(0, len(ids), self.batch_size))
+
+        for i in self.random_state.permutation(len(batches)):
+            yield batches[i]
+
+
+def pack_sequences(seqs, max_len, pad_value=PAD):
+    """Pack sequences one after another into rows of at most `max_len` tokens
+    (first fit, longest sequences first).
+
+    Returns `PackedBatch` of (n_rows, row_len) arrays: tokens, segments (index of
+    the sequence each token comes from, -1 for padding) and resets (True at the
+    first token of each sequence, see the `resets` of `LSTM.forward`). The
+    attention of sequence k can be restricted with mask `segments[row] == k`."""
+    rows = []
+    free = []
+    for i in sorted(range(len(seqs)), key=lambda i: -len(seqs[i])):
+        assert len(seqs[i]) <= max_len, 'Sequence longer than max_len.'
+        for row_id, row_free in enumerate(free):
+            if row_free >= len(seqs[i]):
+                break
+        else:
+            row_id = len(rows)
+            rows.append([])
+            free.append(max_len)
+
+        rows[row_id].append(i)
+        free[row_id] -= len(seqs[i])
+
+    row_len = max_len - min(free) if free else 0
+    tokens = np.empty((len(rows), row_len), dtype=int)
+    tokens.fill(pad_value)
+    segments = -np.ones((len(rows), row_len), dtype=int)
+    resets = np.zeros((len(rows), row_len), dtype=bool)
+    for row_id, row in enumerate(rows):
+        pos = 0
+        for i in row:
+            tokens[row_id, pos:pos + len(seqs[i])] = seqs[i]
+            segments[row_id, pos:pos + len(seqs[i])] = i
+            if len(seqs[i]):
+                resets[row_id, pos] = True
+            pos += len(seqs[i])
+
+    return PackedBatch(tokens=tokens, segments=segments, resets=resets)
+
+
+def _worker(make_data, random_state, queue, batch_size, n_bucket_batches, batched):
+    data = make_data(random_state)
+    if batched:
+        for batch in bucketed_batches(data, batch_size, n_bucket_batches, random_state):
+            queue.put(batch)
+    else:
+        while True:
+            queue.put([next(data) for i in xrange(batch_size)])
+
+
+class Prefetcher(object):
+    """Iterator over batches prepared by `n_workers` background processes.
+
+    `make_data(random_state)` is called in each worker with the worker's random
+    state and returns an iterator of (x_q, x_a) examples drawn from it. Each
+    worker keeps at most `queue_size` batches ready. Call `close` to stop the
+    workers.
+
+    With `batched` the batches are bucketed and padded `Batch`es. Without it
+    they are plain lists of `batch_size` examples in the order generated,
+    for a trainer that takes one example at a time (see `examples`)."""
+    def __init__(self, make_data, n_workers=2, batch_size=32, n_bucket_batches=10, queue_size=8, seed=0, batched=True):
+        self.n_workers = n_workers
+        self.batch_size = batch_size
+        self.batched = batched
+
+        self._queues = []
+        self._workers = []
+        for worker_id in range(n_workers):
+            queue = multiprocessing.Queue(maxsize=queue_size)
+            worker = multiprocessing.Process(
+                target=_worker,
+                args=(make_data, stream_random_state(seed, worker_id), queue, batch_size, n_bucket_batches, batched)
+            )
+            worker.daemon = True
+            worker.start()
+
+            self._queues.append(queue)
+            self._workers.append(worker)
+
+        self._next_worker = 0
+
+    def __iter__(self):
+        return self
+
+    def next(self):
+        batch = self._queues[self._next_worker].get()
+        self._next_worker = (self._next_worker + 1) % self.n_workers
+
+        return batch
+
+    def examples(self):
+        """Iterator over the single examples of the batches."""
+        for batch in self:
+            for example in (unbatch(batch) if self.batched else batch):
+                yield example
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stop the worker processes."""
+        for worker in self._workers:
+            worker.terminate()
+            worker.join()
+
+        self._queues = []
+        self._workers = []
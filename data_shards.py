@@ -0,0 +1,231 @@
+"""
+Pre-generated datasets stored as binary shards.
+
+A dataset is a directory of shards. Shard k consists of four .npy files:
+  %05d.q_tokens.npy, %05d.a_tokens.npy    -- int32 tokens of all questions/answers concatenated
+  %05d.q_offsets.npy, %05d.a_offsets.npy  -- int64, example i is tokens[offsets[i]:offsets[i + 1]]
+
+`write_shards` generates the shards in parallel processes (shard k from the
+random stream `stream_random_state(seed, k)`, so the dataset is
+reproducible). `ShardReader` memory-maps them and serves examples by index
+for shuffling, bucketing and multi-epoch iteration without generating
+anything.
+"""
+import glob
+import multiprocessing
+import os
+
+import numpy as np
+
+from data_parallel import stream_random_state
+from data_pipeline import Batch, PAD
+
+
+PARTS = ['q_tokens', 'q_offsets', 'a_tokens', 'a_offsets']
+
+
+def shard_file(path, shard_id, part):
+    return os.path.join(path, '%05d.%s.npy' % (shard_id, part))
+
+
+def pack(seqs):
+    """Concatenate sequences into (int32 tokens, int64 offsets)."""
+    offsets = np.zeros((len(seqs) + 1, ), dtype=np.int64)
+    offsets[1:] = np.cumsum([len(seq) for seq in seqs])
+    tokens = np.zeros((offsets[-1], ), dtype=np.int32)
+    for seq, start, end in zip(seqs, offsets[:-1], offsets[1:]):
+        tokens[start:end] = seq
+
+    return tokens, offsets
+
+
+def write_shard(make_data, n_examples, path, shard_id, seed):
+    """Generate `n_examples` (x_q, x_a) examples from `make_data(random_state)`
+    with the shard's random stream and write them as shard `shard_id`."""
+    data = make_data(stream_random_state(seed, shard_id))
+    examples = [next(data) for i in xrange(n_examples)]
+
+    q_tokens, q_offsets = pack([x_q for x_q, _ in examples])
+    a_tokens, a_offsets = pack([x_a for _, x_a in examples])
+    arrays = dict(q_tokens=q_tokens, q_offsets=q_offsets, a_tokens=a_tokens, a_offsets=a_offsets)
+
+    for part in PARTS:
+        np.save(shard_file(path, shard_id, part), arrays[part])
+
+
+def write_shards(make_data, n_examples, path, n_shards=8, n_workers=4, seed=0):
+    """Write `n_examples` examples split into `n_shards` shards into directory
+    `path`, using up to `n_workers` processes."""
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    workers = []
+    running = []
+    for shard_id in range(n_shards):
+        shard_examples = n_examples // n_shards + (1 if shard_id < n_examples % n_shards else 0)
+        worker = multiprocessing.Process(
+            target=write_shard,
+            args=(make_data, shard_examples, path, shard_id, seed)
+        )
+        worker.start()
+        workers.append(worker)
+        running.append(worker)
+
+        if len(running) == n_workers:
+            running.pop(0).join()
+
+    for worker in running:
+        worker.join()
+
+    for shard_id, worker in enumerate(workers):
+        assert worker.exitcode == 0, 'Generating shard %d failed.' % shard_id
+
+
+class ShardReader(object):
+    """Read-only access to the examples of a sharded dataset (memory-mapped)."""
+    def __init__(self, path):
+        self.path = path
+
+        n_shards = len(glob.glob(os.path.join(path, '*.%s.npy' % PARTS[-1])))
+        assert n_shards > 0, 'No shards in: %s' % path
+
+        self.shards = []
+        for shard_id in range(n_shards):
+            # Plain ndarray views of the memory maps (indexing np.memmap objects is slower).
+            self.shards.append(dict((part, np.asarray(np.load(shard_file(path, shard_id, part), mmap_mode='r'))) for part in PARTS))
+
+        # Global index of the first example of each shard.
+        self.shard_starts = np.cumsum([0] + [len(shard['q_offsets']) - 1 for shard in self.shards])
+
+    def __len__(self):
+        return self.shard_starts[-1]
+
+    def task(self):
+        """Parameters of the generator of the examples (as written by `main`,
+        e.g. {'max_num': 100, 'task_seed': 0}), or None if not stored."""
+        task_file = os.path.join(self.path, 'task.txt')
+        if not os.path.exists(task_file):
+            return None
+
+        with open(task_file) as f_in:
+            return dict((name, int(val)) for name, val in (line.split() for line in f_in))
+
+    def vocab(self):
+        """Words of the token ids (as written by `main`), or None if not stored."""
+        vocab_file = os.path.join(self.path, 'vocab.txt')
+        if not os.path.exists(vocab_file):
+            return None
+
+        with open(vocab_file) as f_in:
+            return f_in.read().splitlines()
+
+    def __getitem__(self, i):
+        """Example i as (x_q, x_a) arrays of token ids."""
+        shard_id = np.searchsorted(self.shard_starts, i, side='right') - 1
+        shard = self.shards[shard_id]
+        i -= self.shard_starts[shard_id]
+
+        x_q = shard['q_tokens'][shard['q_offsets'][i]:shard['q_offsets'][i + 1]]
+        x_a = shard['a_tokens'][shard['a_offsets'][i]:shard['a_offsets'][i + 1]]
+
+        return np.array(x_q, dtype=int), np.array(x_a, dtype=int)
+
+    def take(self, indices, pad_value=PAD):
+        """`Batch` of the examples with the given indices, gathered directly from
+        the token arrays of the shards."""
+        indices = np.asarray(indices)
+        shard_ids = np.searchsorted(self.shard_starts, indices, side='right') - 1
+
+        res = {}
+        for part in ['q', 'a']:
+            starts = np.zeros((len(indices), ), dtype=np.int64)
+            lens = np.zeros((len(indices), ), dtype=np.int64)
+            for shard_id in np.unique(shard_ids):
+                sel = shard_ids == shard_id
+                offsets = self.shards[shard_id]['%s_offsets' % part]
+                local = indices[sel] - self.shard_starts[shard_id]
+                starts[sel] = offsets[local]
+                lens[sel] = offsets[local + 1] - starts[sel]
+
+            cols = np.arange(lens.max() if len(lens) else 0)
+            mask = cols < lens[:, np.newaxis]
+            positions = np.where(mask, starts[:, np.newaxis] + cols, 0)
+
+            padded = np.empty(mask.shape, dtype=int)
+            padded.fill(pad_value)
+            for shard_id in np.unique(shard_ids):
+                sel = (shard_ids == shard_id)[:, np.newaxis] & mask
+                padded[sel] = self.shards[shard_id]['%s_tokens' % part][positions[sel]]
+
+            res[part] = (padded, lens)
+
+        return Batch(q=res['q'][0], q_lens=res['q'][1], a=res['a'][0], a_lens=res['a'][1])
+
+    def q_lens(self):
+        """Lengths of all questions."""
+        return np.concatenate([np.diff(shard['q_offsets']) for shard in self.shards])
+
+    def examples(self, n_epochs=None, shuffle=True, seed=0):
+        """Iterate over the examples `n_epochs` times (forever if None), in
+        a new random order in each epoch if `shuffle`."""
+        random_state = np.random.RandomState(seed)
+        epoch = 0
+        while n_epochs is None or epoch < n_epochs:
+            order = random_state.permutation(len(self)) if shuffle else np.arange(len(self))
+            for i in order:
+                yield self[i]
+
+            epoch += 1
+
+    def batches(self, batch_size, n_epochs=None, seed=0):
+        """Iterate over padded batches of examples with similar question lengths.
+        In each epoch the examples are sorted by question length (ties broken
+        randomly), cut into batches and the batches are shuffled."""
+        random_state = np.random.RandomState(seed)
+        q_lens = self.q_lens()
+        epoch = 0
+        while n_epochs is None or epoch < n_epochs:
+            order = np.lexsort((random_state.random_sample(len(self)), q_lens))
+            starts = np.arange(0, len(self), batch_size)
+            for start in random_state.permutation(starts):
+                yield self.take(order[start:start + batch_size])
+
+            epoch += 1
+
+
+def main(path, n_examples, n_shards, n_workers, max_num, test_data, seed, task_seed):
+    from data_calc import DataCalc
+    from db import DB
+
+    # The task (the answer templates of DataCalc) is drawn from `task_seed`, the
+    # examples from the streams of `seed`.
+    calc = DataCalc(max_num=max_num, random_state=np.random.RandomState(task_seed))
+    db = DB(calc.get_db(), calc.get_vocab())
+
+    write_shards(lambda random_state: calc.gen_data(test_data=test_data, vocab=db.vocab, random_state=random_state), n_examples, path, n_shards=n_shards, n_workers=n_workers, seed=seed)
+
+    with open(os.path.join(path, 'vocab.txt'), 'w') as f_out:
+        for i in range(len(db.vocab)):
+            print >>f_out, db.vocab.rev(i)
+
+    with open(os.path.join(path, 'task.txt'), 'w') as f_out:
+        print >>f_out, 'max_num', max_num
+        print >>f_out, 'task_seed', task_seed
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Generate DataCalc examples into binary shards.')
+    parser.add_argument('path')
+    parser.add_argument('n_examples', type=int)
+    parser.add_argument('--n_shards', type=int, default=8)
+    parser.add_argument('--n_workers', type=int, default=4)
+    parser.add_argument('--max_num', type=int, default=100)
+    parser.add_argument('--test_data', action='store_true')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random streams of the examples.')
+    parser.add_argument('--task_seed', type=int, default=0, help='Seed of the task (answer templates); must match the one of nton.py.')
+
+    args = parser.parse_args()
+
+    main(**vars(args))
@@ -1,7 +1,6 @@
 import numpy as np
-from collections import defaultdict
 
-from nn import Block, Vars, Dot, Softmax
+from nn import Block, Dot, Softmax, aux_record
 
 from vocab import Vocab
 from nn.utils import timeit
@@ -17,6 +16,71 @@ tavern is not bad
 .
 """
 
+DBAux = aux_record('DBAux', 'x w w_aux result_aux Ax Ax_aux')
+DBNoSoftAux = aux_record('DBNoSoftAux', 'x w w_aux Ax Ax_aux')
+DBFastAux = aux_record('DBFastAux', 'w')
+DBOldAux = aux_record('DBOldAux', 'x w result_aux Ax Ax_aux p1_aux')
+
+
+def build_vocab(words):
+    """`Vocab` of [EOS] (id 0) followed by the words."""
+    vocab = Vocab()
+    vocab.add('[EOS]')
+
+    for word in words:
+        vocab.add(word)
+
+    return vocab
+
+
+def build_facts(content, vocab):
+    """Arrays of the ids of the keys and of the results of the (key, result)
+    facts."""
+    keys = np.fromiter((vocab[food] for food, restaurant in content), dtype=np.int64, count=len(content))
+    results = np.fromiter((vocab[restaurant] for food, restaurant in content), dtype=np.int64, count=len(content))
+
+    return keys, results
+
+
+def pairs_to_csr(rows, cols, n):
+    """CSR arrays (indptr, indices) of the (row, col) id pairs of an n x n
+    map. Duplicate pairs are dropped, because `w[ids] += val` adds each index
+    only once; the ids of each row are sorted."""
+    pairs = np.unique(rows * n + cols)
+
+    indptr = np.zeros((n + 1, ), dtype=np.int64)
+    indptr[1:] = np.cumsum(np.bincount(pairs // n, minlength=n))
+
+    return indptr, pairs % n
+
+
+def build_maps(keys, results, n):
+    """Maps of the fast lookup of the facts in CSR form: key id -> ids of its
+    results (a result also maps to itself) and result id -> ids of its keys
+    (and itself)."""
+    fwd = pairs_to_csr(np.concatenate([keys, results]), np.concatenate([results, results]), n)
+    rev = pairs_to_csr(np.concatenate([results, results]), np.concatenate([keys, results]), n)
+
+    return fwd, rev
+
+
+def csr_apply(indptr, indices, x):
+    """Sum of `x[i]` over the rows i of the map into each of their ids."""
+    # bincount accumulates in the order of `indices`, i.e. by increasing row as
+    # a loop over the rows does.
+    weights = np.repeat(x, np.diff(indptr))
+    return np.bincount(indices, weights=weights, minlength=len(x)).astype(x.dtype)
+
+
+def dense_entries(ids_lists, n):
+    """Dense (n_facts, n) matrix with ones at the ids of each fact."""
+    entries = np.zeros((len(ids_lists[0]), n))
+    for ids in ids_lists:
+        entries[np.arange(len(ids)), ids] = 1.0
+
+    return entries
+
+
 class DB(Block):
     # content = [
     #     ('chinese', 'chong'),
@@ -28,40 +92,20 @@ class DB(Block):
     def __init__(self, content, vocab, impl='fast'):
         self.content = content
 
-        self.vocab = Vocab()
-        self.vocab.add('[EOS]')
-
-        for word in vocab:
-            self.vocab.add(word)
-
-        self.db_map = defaultdict(list)
-        self.db_map_rev = defaultdict(list)
-
-        entries_a = []
-        for food, restaurant in self.content:
-            entry = self.get_vector(food, restaurant)
-            entries_a.append(entry)
+        self.vocab = build_vocab(vocab)
+        self.keys, self.results = build_facts(self.content, self.vocab)
 
-        self.entries_a = np.array(entries_a)
+        n = len(self.vocab)
+        (self.fwd_indptr, self.fwd_indices), (self.rev_indptr, self.rev_indices) = build_maps(self.keys, self.results, n)
 
-        entries_c = []
-        for food, restaurant in self.content:
-            entry = self.get_vector(restaurant)
-            #f_id = self.vocab[food]
-            #entry[f_id] = -1
-            entries_c.append(entry)
+        self._entries_a = None
+        self._entries_c = None
 
-            self.db_map[self.vocab[food]].append(self.vocab[restaurant])
-            self.db_map[self.vocab[restaurant]].append(self.vocab[restaurant])
-            #self.db_map[self.vocab[food]].append(self.vocab[food])
-            self.db_map_rev[self.vocab[restaurant]].append(self.vocab[food])
-            self.db_map_rev[self.vocab[restaurant]].append(self.vocab[restaurant])
-
-        self.db_map = dict(self.db_map)
-        self.db_map_rev = dict(self.db_map_rev)
-
-        self.entries_c = np.array(entries_c)
+        self.set_impl(impl)
 
+    def set_impl(self, impl):
+        """Select the implementation of `forward` and `backward`: 'fast' (lookup
+        through the maps) or 'normal' (through the dense entries)."""
         if impl == 'fast':
             self.forward = self.forward_nosoft_fast
             self.backward = self.backward_nosoft_fast
@@ -71,12 +115,26 @@ class DB(Block):
         else:
             assert False, 'Unknown implementation type: %s' % impl
 
-    def words_to_ids(self, words):
-        res = []
-        for word in words:
-            res.append(self.vocab.add(word))
+    @property
+    def entries_a(self):
+        """Dense entries (one-hot of key and result per fact) of the 'normal'
+        implementation. Built on first use: they take n_facts * len(vocab)
+        floats."""
+        if self._entries_a is None:
+            self._entries_a = dense_entries([self.keys, self.results], len(self.vocab))
+
+        return self._entries_a
 
-        return np.array(res)
+    @property
+    def entries_c(self):
+        """Dense entries (one-hot of result per fact), built on first use."""
+        if self._entries_c is None:
+            self._entries_c = dense_entries([self.results], len(self.vocab))
+
+        return self._entries_c
+
+    def words_to_ids(self, words):
+        return self.vocab.add_words(words)
 
     def get_vector(self, *words):
         res = np.zeros((len(self.vocab), ))
@@ -105,7 +163,7 @@ class DB(Block):
 
         ((result, ), result_aux) = Softmax.forward((w, ))
 
-        aux = Vars(
+        aux = DBAux(
             x=x,
             w=w,
             w_aux=w_aux,
@@ -146,7 +204,7 @@ class DB(Block):
 
         #((result, ), result_aux) = Softmax.forward((w, ))
 
-        aux = Vars(
+        aux = DBNoSoftAux(
             x=x,
             w=w,
             w_aux=w_aux,
@@ -157,23 +215,16 @@ class DB(Block):
         return ((w, ), aux)
 
     def forward_nosoft_fast(self, (x, )):
-        w = np.zeros_like(x)
-        for i, val in enumerate(x):
-            if i in self.db_map:
-                #print 'adding', self.vocab.rev(i), val, [self.vocab.rev(aa) for aa in self.db_map[i]]
-                w[self.db_map[i]] += val
+        w = csr_apply(self.fwd_indptr, self.fwd_indices, x)
 
-        aux = Vars(
+        aux = DBFastAux(
             w=w
         )
 
         return ((w, ), aux)
 
     def backward_nosoft_fast(self, aux, (dy, )):
-        dx = np.zeros_like(dy)
-        for i, val in enumerate(dy):
-            if i in self.db_map_rev:
-                dx[self.db_map_rev[i]] += val
+        dx = csr_apply(self.rev_indptr, self.rev_indices, dy)
 
         return (dx, )
 
@@ -202,7 +253,7 @@ class DB(Block):
         ((result, ), result_aux) = Softmax.forward((w, ))
 
 
-        aux = Vars(
+        aux = DBOldAux(
             x=x,
             w=w,
             result_aux=result_aux,
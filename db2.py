@@ -1,7 +1,7 @@
 import numpy as np
 from collections import defaultdict
 
-from nn import Block, Vars, Dot, Softmax
+from nn import Block, Dot, Softmax, aux_record
 
 from vocab import Vocab
 from nn.utils import timeit
@@ -17,6 +17,9 @@ tavern is not bad
 .
 """
 
+DB2Aux = aux_record('DB2Aux', 'e1 r')
+
+
 class DB2(Block):
     def __init__(self, content, vocab):
         self.content = content
@@ -36,11 +39,7 @@ class DB2(Block):
         self.map = dict(self.map)
 
     def words_to_ids(self, words):
-        res = []
-        for word in words:
-            res.append(self.vocab.add(word))
-
-        return np.array(res)
+        return self.vocab.add_words(words)
 
     def get_vector(self, *words):
         res = np.zeros((len(self.vocab), ))
@@ -76,7 +75,7 @@ class DB2(Block):
                     e2[i] += e1[e1_dim] * r[r_dim]
 
 
-        aux = Vars(
+        aux = DB2Aux(
             e1=e1,
             r=r
         )
@@ -0,0 +1,155 @@
+"""
+Database served by several shard processes.
+
+Every shard owns a partition of the facts and computes a partial result of
+the lookup. Only the non-zero ids of the query vector (`Ids`) and their
+values are sent to the shards; their partial results (in shared memory) are
+summed in the calling process.
+
+To give exactly the same results as `DB` the facts are partitioned twice:
+for the forward pass by the result token and for the backward pass by the key
+token. This way each element of the output is accumulated by exactly one shard
+in the same order as `DB.forward_nosoft_fast`/`DB.backward_nosoft_fast` do it.
+"""
+import multiprocessing
+
+import numpy as np
+
+from nn import Block, Ids
+
+from db import DBFastAux, build_vocab, build_facts, build_maps
+
+
+CMD_FORWARD = 'fwd'
+CMD_BACKWARD = 'bwd'
+CMD_STOP = None
+
+
+def split_csr((indptr, indices), n_shards):
+    """Split a map in CSR form into `n_shards` maps in CSR form. Each id is
+    sent to the shard `id % n_shards`; the order of ids within each row is
+    preserved."""
+    rows = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+    shards = []
+    for shard_id in range(n_shards):
+        mask = indices % n_shards == shard_id
+        shard_indptr = np.zeros_like(indptr)
+        shard_indptr[1:] = np.cumsum(np.bincount(rows[mask], minlength=len(indptr) - 1))
+        shards.append((shard_indptr, indices[mask]))
+
+    return shards
+
+
+def _shard_worker(conn, shard_id, n_shards, n, fwd_map, bwd_map, out_buf):
+    out = np.frombuffer(out_buf, dtype=np.float64).reshape((n_shards, n))[shard_id]
+
+    while True:
+        msg = conn.recv()
+        if msg is CMD_STOP:
+            break
+
+        cmd, x_ids, x_vals = msg
+        if cmd == CMD_FORWARD:
+            mapping = fwd_map
+        elif cmd == CMD_BACKWARD:
+            mapping = bwd_map
+        else:
+            assert False, 'Unknown command: %s' % cmd
+
+        # The ids are increasing, so the results are accumulated in the same order as in `DB`.
+        indptr, indices = mapping
+        out[:] = 0.0
+        for i, val in zip(x_ids.ids, x_vals):
+            out[indices[indptr[i]:indptr[i + 1]]] += val
+
+        conn.send(cmd)
+
+    conn.close()
+
+
+class ShardedDB(Block):
+    """Drop-in replacement of `DB` (with impl='fast') whose lookups are served by
+    `n_shards` worker processes. Call `close` to stop the workers."""
+    def __init__(self, content, vocab, n_shards=2):
+        self.content = content
+        self.n_shards = n_shards
+
+        self.vocab = build_vocab(vocab)
+        keys, results = build_facts(self.content, self.vocab)
+
+        n = len(self.vocab)
+        fwd_map, bwd_map = build_maps(keys, results, n)
+        fwd_maps = split_csr(fwd_map, n_shards)
+        bwd_maps = split_csr(bwd_map, n_shards)
+
+        self._out_buf = multiprocessing.RawArray('d', n_shards * n)
+        self._out = np.frombuffer(self._out_buf, dtype=np.float64).reshape((n_shards, n))
+
+        self._conns = []
+        self._workers = []
+        for shard_id in range(n_shards):
+            conn, worker_conn = multiprocessing.Pipe()
+            worker = multiprocessing.Process(
+                target=_shard_worker,
+                args=(worker_conn, shard_id, n_shards, n, fwd_maps[shard_id], bwd_maps[shard_id], self._out_buf)
+            )
+            worker.daemon = True
+            worker.start()
+
+            self._conns.append(conn)
+            self._workers.append(worker)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stop the shard processes."""
+        for conn in self._conns:
+            conn.send(CMD_STOP)
+        for worker in self._workers:
+            worker.join()
+
+        self._conns = []
+        self._workers = []
+
+    def words_to_ids(self, words):
+        return self.vocab.add_words(words)
+
+    def get_vector(self, *words):
+        res = np.zeros((len(self.vocab), ))
+
+        for w in words:
+            q_id = self.vocab[w]
+            res[q_id] = 1.0
+
+        return res
+
+    def _scatter_gather(self, cmd, x):
+        """Send the non-zero ids and values of `x` to all shards and sum their
+        partial results."""
+        x_ids = Ids(np.flatnonzero(x), len(x))
+        msg = (cmd, x_ids, x[x_ids.ids])
+        for conn in self._conns:
+            conn.send(msg)
+        for conn in self._conns:
+            conn.recv()
+
+        return self._out.sum(axis=0)
+
+    def forward(self, (x, )):
+        w = self._scatter_gather(CMD_FORWARD, x)
+
+        aux = DBFastAux(
+            w=w
+        )
+
+        return ((w, ), aux)
+
+    def backward(self, aux, (dy, )):
+        dx = self._scatter_gather(CMD_BACKWARD, dy)
+
+        return (dx, )
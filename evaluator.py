@@ -0,0 +1,97 @@
+"""
+Evaluation of parameter snapshots in a background process.
+
+The evaluator process is forked from the trainer, so it starts with its own
+copy of the model (copy-on-write). A snapshot of the parameters is one copy
+of the flat parameter buffer (see `ParametrizedBlock.flatten`) into shared
+memory; the evaluator copies it into its model and evaluates it while the
+trainer goes on training. At most one snapshot waits for the evaluator: if
+it is still pending, `submit` skips the new one instead of blocking.
+"""
+import multiprocessing
+import os
+import sys
+from Queue import Empty
+
+import numpy as np
+
+
+def _worker(model, evaluate, snapshot, pending, requests, results, quiet):
+    if quiet:
+        sys.stdout = open(os.devnull, 'w')  # Evaluation of the model prints its steps.
+
+    params = model.params.flat
+    while True:
+        step = requests.get()
+        if step is None:
+            break
+
+        params[:] = np.frombuffer(snapshot, dtype=np.float64)
+        pending.clear()  # The snapshot buffer may be overwritten now.
+
+        results.put((step, evaluate(model)))
+
+
+class BackgroundEvaluator(object):
+    """Evaluates snapshots of the parameters of `model` (flattened
+    `ParametrizedBlock`) with `evaluate(model)` in a background process.
+
+    `submit(step)` hands over the current parameters, `results()` returns
+    the (step, result) pairs of the finished evaluations. Call `close` to
+    stop the process."""
+    def __init__(self, model, evaluate, quiet=True):
+        assert model.params.flat is not None, 'The model must be flattened.'
+
+        self._snapshot = multiprocessing.RawArray('d', model.params.flat.size)
+        self._pending = multiprocessing.Event()
+        self._requests = multiprocessing.Queue()
+        self._results = multiprocessing.Queue()
+
+        self.model = model
+        self.n_submitted = 0
+        self.n_done = 0
+
+        self._worker = multiprocessing.Process(
+            target=_worker,
+            args=(model, evaluate, self._snapshot, self._pending, self._requests, self._results, quiet)
+        )
+        self._worker.daemon = True
+        self._worker.start()
+
+    def submit(self, step):
+        """Evaluate the current parameters (labeled by `step`) unless the
+        previous snapshot was not picked up yet. Returns whether submitted."""
+        if self._pending.is_set():
+            return False
+
+        np.frombuffer(self._snapshot, dtype=np.float64)[:] = self.model.params.flat
+        self._pending.set()
+        self._requests.put(step)
+        self.n_submitted += 1
+
+        return True
+
+    def results(self, wait=False):
+        """List of (step, result) of the evaluations finished so far (with
+        `wait` of all submitted ones)."""
+        res = []
+        while self.n_done < self.n_submitted:
+            try:
+                res.append(self._results.get(block=wait))
+            except Empty:
+                break
+
+            self.n_done += 1
+
+        return res
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Stop the evaluator process (evaluations in progress are dropped)."""
+        self._worker.terminate()
+        self._worker.join()
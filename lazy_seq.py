@@ -0,0 +1,30 @@
+from itertools import imap
+
+
+class LazySeq(object):
+    """Read-only sequence of `length` items computed by `get_item(i)` on access.
+
+    Used for generated vocabularies and fact lists that are only iterated or
+    indexed, so they need not be held in memory. `iter_items()`, if given,
+    returns an iterator over all items (faster than calling `get_item`)."""
+    def __init__(self, length, get_item, iter_items=None):
+        self.length = length
+        self.get_item = get_item
+        self.iter_items = iter_items
+
+    def __len__(self):
+        return self.length
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.length
+        if not 0 <= i < self.length:
+            raise IndexError(i)
+
+        return self.get_item(i)
+
+    def __iter__(self):
+        if self.iter_items is not None:
+            return self.iter_items()
+
+        return imap(self.get_item, xrange(self.length))
@@ -0,0 +1,151 @@
+"""
+Learning curve of the training: bounded history of the loss and plotting
+in a background process.
+
+matplotlib and seaborn are imported only by `plot` (in the plotting process),
+so importing this module (and nton.py) does not pay for them.
+"""
+import multiprocessing
+from Queue import Full
+
+import numpy as np
+
+
+class DecimatedHistory(object):
+    """History of at most `max_len` (index, value) points of a long series.
+
+    Every `stride` consecutive values are averaged into one point. When the
+    history is full, pairs of neighbouring points are merged and the stride
+    doubles, so memory is bounded and adding a value is O(1) amortized."""
+    def __init__(self, max_len=1000):
+        assert max_len >= 2 and max_len % 2 == 0, 'max_len must be even.'
+
+        self.max_len = max_len
+        self.stride = 1
+        self.index = np.zeros((max_len, ))   # Mean index of the values of each point.
+        self.values = np.zeros((max_len, ))
+        self.n_points = 0
+        self.n_added = 0
+
+        self._sum_index = 0.0  # The point being accumulated.
+        self._sum_value = 0.0
+        self._n = 0
+
+    def __len__(self):
+        return self.n_points
+
+    def add(self, value):
+        self._sum_index += self.n_added
+        self._sum_value += value
+        self._n += 1
+        self.n_added += 1
+
+        if self._n == self.stride:
+            self.index[self.n_points] = self._sum_index / self._n
+            self.values[self.n_points] = self._sum_value / self._n
+            self.n_points += 1
+
+            self._sum_index = self._sum_value = 0.0
+            self._n = 0
+
+            if self.n_points == self.max_len:
+                self._decimate()
+
+    def _decimate(self):
+        half = self.max_len // 2
+        self.index[:half] = self.index.reshape((half, 2)).mean(axis=1)
+        self.values[:half] = self.values.reshape((half, 2)).mean(axis=1)
+        self.n_points = half
+        self.stride *= 2
+
+    def points(self):
+        """Arrays of the indices and values of the points (copies)."""
+        return self.index[:self.n_points].copy(), self.values[:self.n_points].copy()
+
+
+def plot((loss_index, losses), eval_index, (train_wers, train_accs), (test_wers, test_accs), plot_filename):
+    """Plot learning curve."""
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sbt
+    sbt.set()
+
+    pal = sbt.color_palette()
+    col1 = pal[0]
+    col2 = pal[2]
+    fig, ax1 = plt.subplots(linewidth=1)
+
+    plots = []
+    plot_labels = []
+    plots.append(ax1.plot(loss_index, 2**np.array(losses), '-', linewidth=1, color=col1)[0])
+    plot_labels.append('Perplexity')
+    #ax1.set_xlabel('Example')
+    #ax1.set_ylabel('Avg loss', color=col1)
+    #ax1.legend()
+
+    ax2 = ax1.twinx()
+
+    #plots.append(ax2.plot(eval_index, train_wers, 'o-', label='Train WER', markersize=2, linewidth=1)[0])
+    #plot_labels.append('Train WER')
+    #plots.append(ax2.plot(eval_index, train_accs, 'o-', label='Train Acc', markersize=2, linewidth=1)[0])
+    #plot_labels.append('Train Acc')
+    plots.append(ax2.plot(eval_index, test_wers, 'o-', label='Test WER', markersize=2, linewidth=1)[0])
+    plot_labels.append('Test WER')
+    plots.append(ax2.plot(eval_index, test_accs, 'o-', label='Test Acc', markersize=2, linewidth=1)[0])
+    plot_labels.append('Test Acc')
+
+    #ax2.legend()
+
+    fig.legend(plots, plot_labels, 'upper right')
+    #legend = plt.legend(loc='upper right')
+
+    #ax1.set_ylim([0.0, 1.0])
+
+    #ax2 = ax1.twinx()
+    #ax2.plot(m_ppx, '-o', linewidth=1, color=col2)
+    #ax2.set_ylabel('Perplexity', color=col2)
+
+    plt.savefig(plot_filename)
+    plt.close(fig)
+
+
+def _writer(plot_fn, queue):
+    while True:
+        args = queue.get()
+        if args is None:
+            break
+
+        plot_fn(*args)
+
+
+class PlotWriter(object):
+    """Calls `plot_fn(*args)` for the arguments given to `update` in a
+    background process. At most one set of arguments waits for the process;
+    while it waits, `update` drops new ones instead of blocking. Call `close`
+    to finish the waiting plot and stop."""
+    def __init__(self, plot_fn=plot):
+        self._queue = multiprocessing.Queue(maxsize=1)
+        self._worker = multiprocessing.Process(target=_writer, args=(plot_fn, self._queue))
+        self._worker.daemon = True
+        self._worker.start()
+
+    def update(self, *args):
+        """Plot the arguments unless a previous plot is still waiting. Returns
+        whether the arguments were accepted."""
+        try:
+            self._queue.put_nowait(args)
+        except Full:
+            return False
+
+        return True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._queue.put(None)
+        self._worker.join()
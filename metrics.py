@@ -1,3 +1,5 @@
+import numpy
+
 
 def accuracy(ref, hyp):
     if len(ref) > len(hyp):
@@ -42,4 +44,201 @@ def calculate_wer(reference, hypothesis):
                 deletion     = d[i-1][j] + 1
                 d[i][j] = min(substitution, insertion, deletion)
 
-    return d[len(reference)][len(hypothesis)]/float(len(reference))
\ No newline at end of file
+    return d[len(reference)][len(hypothesis)]/float(len(reference))
+
+# Batched versions of the metrics above. They take lists of (reference,
+# hypothesis) token id sequences and process whole evaluation sets at once.
+
+def pad(seqs, fill, length=0):
+    """Stack integer sequences into a (len(seqs), max_len) matrix padded with `fill`.
+    Returns the matrix and the lengths of the sequences."""
+    lens = numpy.array([len(seq) for seq in seqs], dtype=numpy.int64)
+    length = max([length] + list(lens))
+
+    res = numpy.empty((len(seqs), length), dtype=numpy.int64)
+    res.fill(fill)
+    mask = numpy.arange(length) < lens[:, numpy.newaxis]
+    if mask.any():
+        res[mask] = numpy.concatenate([numpy.asarray(seq, dtype=numpy.int64).ravel() for seq in seqs])
+
+    return res, lens
+
+
+def edit_distances(references, hypotheses, batch_size=10000):
+    """Levenshtein distances of the pairs of token id sequences.
+
+    The dynamic programming matrices of a whole batch are computed one row at a
+    time. Within a row the insertions are resolved by a running minimum:
+    d[i][j] = min_k<=j (t[k] + j - k), where t are the costs of substitution
+    and deletion, so each row is a few vectorized operations over the batch."""
+    assert len(references) == len(hypotheses)
+
+    res = numpy.zeros((len(references), ), dtype=numpy.int64)
+
+    # Batches of references with similar lengths need fewer padded rows.
+    order = numpy.argsort([len(ref) for ref in references], kind='mergesort')
+    for start in range(0, len(order), batch_size):
+        batch = order[start:start + batch_size]
+        R, ref_lens = pad([references[k] for k in batch], -1)
+        H, hyp_lens = pad([hypotheses[k] for k in batch], -2)  # Padding never matches.
+
+        cols = numpy.arange(H.shape[1] + 1)
+        row = numpy.tile(cols, (len(batch), 1))
+        t = numpy.empty_like(row)
+        batch_res = numpy.where(ref_lens == 0, hyp_lens, 0)
+        for i in range(1, R.shape[1] + 1):
+            t[:, 0] = i
+            numpy.minimum(row[:, :-1] + (R[:, i - 1:i] != H), row[:, 1:] + 1, out=t[:, 1:])
+            t -= cols
+            row = numpy.minimum.accumulate(t, axis=1) + cols
+
+            at = numpy.nonzero(ref_lens == i)[0]
+            batch_res[at] = row[at, hyp_lens[at]]
+
+        res[batch] = batch_res
+
+    return res
+
+
+def calculate_wers(references, hypotheses):
+    """`calculate_wer` of each pair of token id sequences."""
+    lens = numpy.array([len(ref) for ref in references], dtype=float)
+
+    return edit_distances(references, hypotheses) / lens
+
+
+def corpus_wer(references, hypotheses):
+    """Total number of edits divided by the total length of the references."""
+    return edit_distances(references, hypotheses).sum() / float(sum(len(ref) for ref in references))
+
+
+def accuracies(references, hypotheses):
+    """`accuracy` of each pair of token id sequences (a shorter hypothesis
+    is padded with zeros as in `accuracy`)."""
+    R, ref_lens = pad(references, -1)
+    H, _ = pad([hyp[:R.shape[1]] for hyp in hypotheses], 0, length=R.shape[1])
+
+    mask = numpy.arange(R.shape[1]) < ref_lens[:, numpy.newaxis]
+    correct = ((R == H) & mask).sum(axis=1)
+
+    return correct * 1.0 / ref_lens
+
+
+def ngram_stats(references, hypotheses, max_n=4):
+    """Clipped n-gram matches and n-gram counts of each hypothesis for
+    n = 1..max_n (one reference per hypothesis).
+
+    Each n-gram together with the index of its sentence is packed into one
+    int64 key (exactly, in base max token id + 1) and the keys are counted by
+    sorting them, no per-sentence counters are built. If the keys would not
+    fit into 64 bits, the (sentence, tokens...) rows are sorted instead.
+    Returns (matches, totals), both of shape (len(hypotheses), max_n)."""
+    assert len(references) == len(hypotheses)
+    n_sents = len(hypotheses)
+
+    def flatten(seqs):
+        lens = numpy.array([len(seq) for seq in seqs], dtype=numpy.int64)
+        sent = numpy.repeat(numpy.arange(len(seqs)), lens)
+        pos = numpy.arange(lens.sum()) - numpy.repeat(numpy.cumsum(lens) - lens, lens)
+        if lens.sum():
+            tokens = numpy.concatenate([numpy.asarray(seq, dtype=numpy.int64).ravel() for seq in seqs])
+        else:
+            tokens = numpy.zeros((0, ), dtype=numpy.int64)
+
+        return tokens, sent, pos, lens
+
+    ref = flatten(references)
+    hyp = flatten(hypotheses)
+
+    all_tokens = numpy.concatenate([ref[0], hyp[0]])
+    low = all_tokens.min() if len(all_tokens) else 0
+    radix = int(all_tokens.max() - low + 1) if len(all_tokens) else 1
+
+    matches = numpy.zeros((n_sents, max_n), dtype=numpy.int64)
+    totals = numpy.zeros((n_sents, max_n), dtype=numpy.int64)
+    for n in range(1, max_n + 1):
+        # Columns (sentence, token 1, ..., token n) of the n-grams of the hypotheses and references.
+        hyp_starts = numpy.nonzero(hyp[2] + n <= hyp[3][hyp[1]])[0]
+        ref_starts = numpy.nonzero(ref[2] + n <= ref[3][ref[1]])[0]
+        cols = [numpy.concatenate([hyp[1][hyp_starts], ref[1][ref_starts]])]
+        for k in range(n):
+            cols.append(numpy.concatenate([hyp[0][hyp_starts + k], ref[0][ref_starts + k]]) - low)
+
+        sent = cols[0]
+        is_hyp = numpy.zeros((len(sent), ), dtype=numpy.int64)
+        is_hyp[:len(hyp_starts)] = 1
+
+        totals[:, n - 1] = numpy.bincount(sent[:len(hyp_starts)], minlength=n_sents)
+        if len(sent) == 0:
+            continue
+
+        # Group equal (sentence, n-gram) pairs and count them in hypothesis and reference.
+        if n_sents * radix**n < 2**63:
+            keys = cols[0]
+            for col in cols[1:]:
+                keys = keys * radix + col
+            order = numpy.argsort(keys)
+            keys = keys[order]
+            new_group = keys[1:] != keys[:-1]
+        else:
+            order = numpy.lexsort(cols[::-1])
+            new_group = numpy.zeros((len(sent) - 1, ), dtype=bool)
+            for col in cols:
+                col = col[order]
+                new_group |= col[1:] != col[:-1]
+
+        sent, is_hyp = sent[order], is_hyp[order]
+        starts = numpy.concatenate([[0], numpy.nonzero(new_group)[0] + 1])
+
+        hyp_counts = numpy.add.reduceat(is_hyp, starts)
+        ref_counts = numpy.diff(numpy.append(starts, len(sent))) - hyp_counts
+        matches[:, n - 1] = numpy.bincount(sent[starts], weights=numpy.minimum(hyp_counts, ref_counts), minlength=n_sents)
+
+    return matches, totals
+
+
+def corpus_bleu(references, hypotheses, max_n=4, smoothing='none', epsilon=0.1):
+    """Corpus-level BLEU of the hypotheses (one reference per hypothesis).
+
+    smoothing of the n-gram precisions (Chen & Cherry, 2014):
+      'none'    -- no smoothing, BLEU is 0 if some order has no match
+      'epsilon' -- epsilon is added to zero match counts
+      'add1'    -- 1 is added to matches and counts of orders n > 1
+      'exp'     -- the k-th order with no match gets precision 1 / (2^k * count)
+    """
+    matches, totals = ngram_stats(references, hypotheses, max_n)
+    matches = matches.sum(axis=0).astype(float)
+    totals = totals.sum(axis=0).astype(float)
+
+    if smoothing == 'none':
+        pass
+    elif smoothing == 'epsilon':
+        matches[matches == 0] = epsilon
+    elif smoothing == 'add1':
+        matches[1:] += 1
+        totals[1:] += 1
+    elif smoothing == 'exp':
+        zero = matches == 0
+        matches[zero] = 1.0 / 2**numpy.cumsum(zero)[zero]
+    else:
+        assert False, 'Unknown smoothing: %s' % smoothing
+
+    if (totals == 0).any() or (matches == 0).any():
+        return 0.0
+
+    hyp_len = float(sum(len(hyp) for hyp in hypotheses))
+    ref_len = float(sum(len(ref) for ref in references))
+    brevity_penalty = 1.0 if hyp_len > ref_len else numpy.exp(1 - ref_len / hyp_len)
+
+    return brevity_penalty * numpy.exp(numpy.mean(numpy.log(matches / totals)))
+
+
+def pers(references, hypotheses):
+    """Position-independent error rate of each pair of token id sequences:
+    the hypothesis is compared to the reference as a bag of words,
+    PER = 1 - (matches - max(0, len(hyp) - len(ref))) / len(ref)."""
+    matches, _ = ngram_stats(references, hypotheses, max_n=1)
+    ref_lens = numpy.array([len(ref) for ref in references], dtype=float)
+    hyp_lens = numpy.array([len(hyp) for hyp in hypotheses], dtype=float)
+
+    return 1 - (matches[:, 0] - numpy.maximum(0, hyp_lens - ref_lens)) / ref_lens
@@ -1,14 +1,17 @@
 import numpy as np
 
 from base import Block
-from vars import Vars
+from vars import aux_record
+
+
+ActivationAux = aux_record('ActivationAux', 'y')
 
 
 class Tanh(Block):
     @classmethod
     def forward(self, (x, )):
         y = np.tanh(x)
-        aux = Vars(y=y)
+        aux = ActivationAux(y=y)
 
         return ((y, ), aux)
 
@@ -25,7 +28,7 @@ class Sigmoid(Block):
     def forward(self, (x, )):
         y = 0.5 * (1 + np.tanh(0.5 * x))
 
-        aux = Vars(
+        aux = ActivationAux(
             y=y
         )
 
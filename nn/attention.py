@@ -1,16 +1,23 @@
 import numpy as np
 
 from base import ParametrizedBlock
-from vars import Vars
+from vars import Vars, aux_record
 from softmax import Softmax
 from activs import Tanh
 from linear import Dot
 from utils import timeit
+from workspace import NullWorkspace
+from embeddings import Ids
+
+
+AttentionAux = aux_record('AttentionAux', 'h_out g_t emb_in Wy_dot_h_out Wh_dot_g_t Wh_aux Wy_aux M M_aux Mw_aux Mx MwT alpha alpha_aux')
+MultiAttentionAux = aux_record('MultiAttentionAux', 'h_out g_t emb_in M M_aux alpha alpha_aux')
 
 
 class Attention(ParametrizedBlock):
     def __init__(self, n_hidden):
         self.n_hid = n_hidden
+        self.workspace = NullWorkspace()
 
         Wy = np.random.randn(n_hidden, n_hidden)
         Wh = np.random.randn(n_hidden, n_hidden)
@@ -22,7 +29,10 @@ class Attention(ParametrizedBlock):
         self.parametrize(params, grads)
 
     @timeit
-    def forward(self, (h_out, g_t, emb_in)):
+    def forward(self, (h_out, g_t, emb_in), mask=None):
+        """Attend over the rows of h_out. With `mask` (bool, one value per row)
+        only the rows where it is True are attended to (e.g. one segment of a
+        packed input sequence)."""
         Wy = self.params['Wy']
         Wh = self.params['Wh']
         w = self.params['w']
@@ -33,22 +43,26 @@ class Attention(ParametrizedBlock):
         ((Wy_apply, ), Wy_aux) = Dot.forward((h_out, Wy, ))
         ((Wh_apply, ), Wh_aux) = Dot.forward((g_t, Wh ))
 
-        Wh_dot_g_t_rep = np.repeat(Wh_apply, n_inputs, axis=0)
-
-        Mx = Wy_apply + Wh_dot_g_t_rep
+        Mx = self.workspace.empty(Wy_apply.shape)
+        np.add(Wy_apply, Wh_apply, out=Mx)  # Wh_apply is broadcast over all inputs.
 
         ((M, ), M_aux) = Tanh.forward((Mx, ))
         ((Mw, ), Mw_aux) = Dot.forward((M, w))
 
         MwT = Mw.T
-        
+        if mask is not None:
+            MwT = np.where(mask, MwT, -np.inf)  # Zero attention outside of the mask.
+
         ((alpha, ), alpha_aux) = Softmax.forward((MwT, ))
 
         alphaT = alpha.T
 
-        query = (emb_in * alphaT).sum(axis=0)
+        if isinstance(emb_in, Ids):
+            query = np.bincount(emb_in.ids, weights=alpha[0], minlength=emb_in.n_tokens)
+        else:
+            query = (emb_in * alphaT).sum(axis=0)
 
-        aux = Vars(
+        aux = AttentionAux(
             h_out=h_out,
             g_t=g_t,
             emb_in=emb_in,
@@ -85,8 +99,12 @@ class Attention(ParametrizedBlock):
         Wh_aux = aux['Wh_aux']
         Wy_aux = aux['Wy_aux']
 
-        dalphaT = np.dot(dquery, emb_in.T)
-        demb_in = np.outer(dquery, alpha).T
+        if isinstance(emb_in, Ids):
+            dalphaT = dquery[emb_in.ids]
+            demb_in = None  # One-hot inputs are not differentiable.
+        else:
+            dalphaT = np.dot(dquery, emb_in.T)
+            demb_in = np.outer(dquery, alpha).T
 
         dalpha = dalphaT.T
 
@@ -105,3 +123,111 @@ class Attention(ParametrizedBlock):
         (dg_t, dWh) = Dot.backward(Wh_aux, (dWh_dot_g_t_rep, ))
 
         return (dh_out, dg_t.squeeze(), demb_in)
+
+
+class MultiAttention(ParametrizedBlock):
+    """Several attention heads over the same input computed at once.
+
+    The heads are stacked along the columns of Wy and Wh, so the projection of
+    the whole input for all heads is a single dot product. Returns one query
+    per head, i.e. a matrix of shape (n_heads, emb_size)."""
+    def __init__(self, n_hidden, n_heads):
+        self.n_hid = n_hidden
+        self.n_heads = n_heads
+        self.workspace = NullWorkspace()
+
+        Wy = np.random.randn(n_hidden, n_heads * n_hidden)
+        Wh = np.random.randn(n_hidden, n_heads * n_hidden)
+        w = np.random.randn(n_heads, n_hidden)
+
+        params = Vars(Wh=Wh, Wy=Wy, w=w)
+        grads = Vars(Wh=np.zeros_like(Wh), Wy=np.zeros_like(Wy), w=np.zeros_like(w))
+
+        self.parametrize(params, grads)
+
+    @timeit
+    def forward(self, (h_out, g_t, emb_in), mask=None):
+        """Attend over the rows of h_out. With `mask` (bool, one value per row)
+        only the rows where it is True are attended to (e.g. one segment of a
+        packed input sequence)."""
+        Wy = self.params['Wy']
+        Wh = self.params['Wh']
+        w = self.params['w']
+
+        n_inputs = len(h_out)
+
+        Wy_apply = np.dot(h_out, Wy).reshape((n_inputs, self.n_heads, self.n_hid))
+        Wh_apply = np.dot(g_t, Wh).reshape((self.n_heads, self.n_hid))
+
+        Mx = self.workspace.empty(Wy_apply.shape)
+        np.add(Wy_apply, Wh_apply[np.newaxis, :, :], out=Mx)
+
+        ((M, ), M_aux) = Tanh.forward((Mx, ))
+
+        MwT = (M * w[np.newaxis, :, :]).sum(axis=2).T   # (n_heads, n_inputs)
+        if mask is not None:
+            MwT = np.where(mask, MwT, -np.inf)  # Zero attention outside of the mask.
+
+        ((alpha, ), alpha_aux) = Softmax.forward((MwT, ))
+
+        if isinstance(emb_in, Ids):
+            n_tokens = emb_in.n_tokens
+            flat_ids = (np.arange(self.n_heads)[:, np.newaxis] * n_tokens + emb_in.ids[np.newaxis, :]).ravel()
+            query = np.bincount(flat_ids, weights=alpha.ravel(), minlength=self.n_heads * n_tokens)
+            query = query.reshape((self.n_heads, n_tokens))
+        else:
+            query = np.dot(alpha, emb_in)
+
+        aux = MultiAttentionAux(
+            h_out=h_out,
+            g_t=g_t,
+            emb_in=emb_in,
+            M=M,
+            M_aux=M_aux,
+            alpha=alpha,
+            alpha_aux=alpha_aux
+        )
+
+        return ((query, ), aux)
+
+    @timeit
+    def backward(self, aux, (dquery, )):
+        h_out = aux['h_out']
+        g_t = aux['g_t']
+        emb_in = aux['emb_in']
+        alpha = aux['alpha']
+        alpha_aux = aux['alpha_aux']
+        M = aux['M']
+        M_aux = aux['M_aux']
+        w = self.params['w']
+        Wh = self.params['Wh']
+        Wy = self.params['Wy']
+
+        n_inputs = len(h_out)
+
+        if isinstance(emb_in, Ids):
+            dalpha = dquery[:, emb_in.ids]
+            demb_in = None  # One-hot inputs are not differentiable.
+        else:
+            dalpha = np.dot(dquery, emb_in.T)
+            demb_in = np.dot(alpha.T, dquery)
+
+        (dMwT, ) = Softmax.backward(alpha_aux, (dalpha, ))
+        dMw = dMwT.T
+
+        dM = dMw[:, :, np.newaxis] * w[np.newaxis, :, :]
+        dw = (dMw[:, :, np.newaxis] * M).sum(axis=0)
+
+        (dMx, ) = Tanh.backward(M_aux, (dM, ))
+
+        dWy_apply = dMx.reshape((n_inputs, self.n_heads * self.n_hid))
+        dWh_apply = dMx.sum(axis=0).reshape((self.n_heads * self.n_hid, ))
+
+        dh_out = np.dot(dWy_apply, Wy.T)
+        dg_t = np.dot(Wh, dWh_apply)
+
+        self.grads['Wy'] += np.dot(h_out.T, dWy_apply)
+        self.grads['Wh'] += np.outer(g_t, dWh_apply)
+        self.grads['w'] += dw
+
+        return (dh_out, dg_t, demb_in)
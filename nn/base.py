@@ -13,16 +13,76 @@ class ParametrizedBlock(Block):
     def parametrize_from_layers(self, layers, layer_names):
         params = {}
         grads = {}
+        owners = {}
         for layer_name, layer in zip(layer_names, layers):
             if isinstance(layer, ParametrizedBlock):
                 for param_name in layer.params:
                     key = "%s__%s" % (layer_name, param_name, )
                     params[key] = layer.params[param_name]
                     grads[key] = layer.grads[param_name]
+                    owners[key] = (layer, param_name, )
             else:
                 assert False, "Layer is not a ParametrizedBlock. Perhaps error?"
 
         self.parametrize(Vars(**params), Vars(**grads))
+        self._param_owners = owners
+
+    def flatten(self):
+        """Move all parameters of the block (and its layers) into one contiguous
+        buffer and all gradients into another one (`params.flat`, `grads.flat`).
+        The arrays of the layers become views into these buffers."""
+        params = self.params.flattened()
+        grads = self.grads.flattened()
+
+        mapping = {}
+        for old, new in [(self.params, params), (self.grads, grads)]:
+            for name in old:
+                mapping[id(old[name])] = new[name]
+
+        self._rebind(mapping)
+        self._params = params
+        self._grads = grads
+
+    def _rebind(self, mapping):
+        """Replace arrays in params and grads (also of the layers) by their
+        counterparts in mapping (id of the old array -> new array)."""
+        for vars in [self._params, self._grads]:
+            for name in vars:
+                if id(vars[name]) in mapping:
+                    vars.vars[name] = mapping[id(vars[name])]
+                    vars.flat = None  # The variables now live in the buffer of the owner.
+
+        owners = getattr(self, '_param_owners', None) or {}
+        for layer in set(layer for layer, _ in owners.itervalues()):
+            layer._rebind(mapping)
+
+    def grad_rows(self, param_name):
+        """Rows of the given parameter that may have a nonzero gradient,
+        or None if any row may have it (dense gradient)."""
+        owners = getattr(self, '_param_owners', None)
+        if owners is None:
+            return None
+
+        layer, layer_param_name = owners[param_name]
+        return layer.grad_rows(layer_param_name)
+
+    def grad_axis(self, param_name):
+        """Axis of the given parameter along which `grad_rows` are indexed."""
+        owners = getattr(self, '_param_owners', None)
+        if owners is None:
+            return 0
+
+        layer, layer_param_name = owners[param_name]
+        return layer.grad_axis(layer_param_name)
+
+    def zero_grads(self):
+        """Set all gradients to zero."""
+        owners = getattr(self, '_param_owners', None)
+        if owners is None:
+            self.grads.zero()
+        else:
+            for layer in set(layer for layer, _ in owners.itervalues()):
+                layer.zero_grads()
 
     @property
     def params(self):
@@ -2,17 +2,55 @@ import numpy as np
 
 from base import ParametrizedBlock, Block
 from inits import Normal
-from vars import Vars
+from vars import Vars, aux_record
+
+
+EmbeddingsAux = aux_record('EmbeddingsAux', 'x')
+
+
+class Ids(object):
+    """Token ids standing for one-hot vectors of size n_tokens.
+    Blocks that understand it (LSTM, LinearLayer, Attention) gather rows of
+    their weights instead of multiplying by the dense one-hot matrix. It behaves
+    like an array of shape ids.shape + (n_tokens, )."""
+    def __init__(self, ids, n_tokens):
+        self.ids = np.asarray(ids)
+        self.n_tokens = n_tokens
+
+    @property
+    def shape(self):
+        return self.ids.shape + (self.n_tokens, )
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, ndx):
+        """Index the ids (i.e. all but the last, one-hot dimension)."""
+        return Ids(self.ids[ndx], self.n_tokens)
+
+    def reshape(self, shape):
+        """Reshape the ids (i.e. all but the last, one-hot dimension)."""
+        return Ids(self.ids.reshape(shape), self.n_tokens)
+
+    def dense(self):
+        res = np.zeros(self.shape)
+        res.reshape((-1, self.n_tokens))[np.arange(self.ids.size), self.ids.ravel()] = 1
+
+        return res
 
 
 class OneHot(Block):
-    def __init__(self, n_tokens):
+    def __init__(self, n_tokens, sparse=False):
         self.n_tokens = n_tokens
+        self.sparse = sparse
 
     def size(self):
         return self.n_tokens
 
     def forward(self, (x, )):
+        if self.sparse:
+            return ((Ids(x, self.n_tokens), ), None)
+
         res = np.zeros((len(x), self.n_tokens))
         res[range(len(x)), x] = 1
 
@@ -36,6 +74,8 @@ class Embeddings(ParametrizedBlock):
 
         self.parametrize(params, grads)
 
+        self._touched = []  # Ids whose rows of dW were accumulated to since the last `zero_grads`.
+
     def size(self):
         return self.n_dims
 
@@ -47,7 +87,7 @@ class Embeddings(ParametrizedBlock):
 
         y = W[x]
 
-        aux = Vars(
+        aux = EmbeddingsAux(
             x=x
         )
 
@@ -64,5 +104,17 @@ class Embeddings(ParametrizedBlock):
         x = aux['x']
         dy = grads[0]
 
-        for i in range(len(x)):
-            dW[x[i]] += dy[i]
\ No newline at end of file
+        np.add.at(dW, x, dy)
+        self._touched.append(x)
+
+    def grad_rows(self, param_name):
+        """Rows of W that received a gradient since the last `zero_grads`."""
+        if not self._touched:
+            return np.zeros((0, ), dtype=int)
+
+        return np.unique(np.concatenate(self._touched))
+
+    def zero_grads(self):
+        """Zero only the rows of the gradient that were accumulated to."""
+        self.grads['W'][self.grad_rows('W')] = 0.0
+        self._touched = []
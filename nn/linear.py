@@ -1,10 +1,15 @@
 from base import Block, ParametrizedBlock
 from inits import Normal
-from vars import Vars
+from vars import Vars, aux_record
+from embeddings import Ids
 
 import numpy as np
 
 
+LinearAux = aux_record('LinearAux', 'y x')
+DotAux = aux_record('DotAux', 'A B')
+
+
 class Identity(Block):
     def forward(self, x):
         return x
@@ -26,13 +31,19 @@ class LinearLayer(ParametrizedBlock):
 
         self.parametrize(params, grads)
 
+        self._touched_cols = []  # Output columns accumulated to by `grad_accum_cols` since the last `zero_grads`.
+        self._dense_grads = True  # Whether all columns may be nonzero (after `grad_accum`, or before the first `zero_grads`).
+
     def forward(self, (x, )):
         W = self.params['W']
         b = self.params['b']
 
-        y = np.dot(x, W) + b
+        if isinstance(x, Ids):
+            y = W[x.ids] + b  # Gather the rows selected by the one-hot inputs.
+        else:
+            y = np.dot(x, W) + b
 
-        aux = Vars(
+        aux = LinearAux(
             y=y,
             x=x
         )
@@ -45,19 +56,60 @@ class LinearLayer(ParametrizedBlock):
 
         W = self.params['W']
         self.grad_accum(x, y, dy)
+
+        if isinstance(x, Ids):
+            return (None, )  # One-hot inputs are not differentiable.
+
         res = np.dot(dy, W.T)
 
         return (res, )
 
     def grad_accum(self, x, y, dy):
-        x = x.reshape((-1, x.shape[-1]))
         dy = dy.reshape((-1, dy.shape[-1]))
-
-        dW = np.dot(x.T, dy)
         db = dy.sum(axis=0)
 
-        self.grads['W'] += dW
+        if isinstance(x, Ids):
+            np.add.at(self.grads['W'], x.ids.ravel(), dy)
+        else:
+            x = x.reshape((-1, x.shape[-1]))
+            dW = np.dot(x.T, dy)
+            self.grads['W'] += dW
+
         self.grads['b'] += db
+        self._dense_grads = True
+
+    def grad_accum_cols(self, x, dy, cols):
+        """Accumulate the gradients of only the output columns `cols`, given
+        2D inputs `x` and the gradient `dy` of these columns."""
+        self.grads['W'][:, cols] += np.dot(x.T, dy)
+        self.grads['b'][cols] += dy.sum(axis=0)
+        self._touched_cols.append(cols)
+
+    def grad_rows(self, param_name):
+        """Output columns (along `grad_axis`) that received a gradient since
+        the last `zero_grads`, or None after a dense backward."""
+        if self._dense_grads:
+            return None
+
+        if not self._touched_cols:
+            return np.zeros((0, ), dtype=int)
+
+        return np.unique(np.concatenate(self._touched_cols))
+
+    def grad_axis(self, param_name):
+        return 1 if param_name == 'W' else 0
+
+    def zero_grads(self):
+        """Zero only the columns of the gradients that were accumulated to."""
+        cols = self.grad_rows('W')
+        if cols is None:
+            self.grads.zero()
+        else:
+            self.grads['W'][:, cols] = 0.0
+            self.grads['b'][cols] = 0.0
+
+        self._touched_cols = []
+        self._dense_grads = False
 
 
 
@@ -71,7 +123,7 @@ class Dot(ParametrizedBlock):
         if B.ndim == 1:
             B = B[:, np.newaxis]
 
-        aux = Vars(
+        aux = DotAux(
             A=A,
             B=B
         )
@@ -5,13 +5,19 @@ Based on Karpathy's LSTM: https://gist.github.com/karpathy/587454dc0146a6ae21fc
 """
 import numpy as np
 from base import ParametrizedBlock
-from vars import Vars
+from vars import Vars, aux_record
+from workspace import NullWorkspace
+from embeddings import Ids
 
 from utils import timeit
 
+LSTMAux = aux_record('LSTMAux', 'WLSTM Hout IFOGf IFOG C Ct Hin c0 h0 x_ids resets')
+
+
 class LSTM(ParametrizedBlock):
     def __init__(self, n_in, n_out):
         self.n_cells = n_out
+        self.workspace = NullWorkspace()
 
         WLSTM = np.random.randn(n_in + n_out + 1, 4 * n_out) / np.sqrt(n_in + n_out)
         WLSTM[0,:] = 0 # initialize biases to zero
@@ -23,6 +29,9 @@ class LSTM(ParametrizedBlock):
 
         self.parametrize(params, grads)
 
+        self._touched = []  # Input ids whose rows of the gradient were accumulated to since the last `zero_grads`.
+        self._dense_grads = True  # Whether all rows may be nonzero (dense inputs, or before the first `zero_grads`).
+
     def get_init(self):
         return (np.zeros((self.n_cells, )), np.zeros((self.n_cells, )))
 
@@ -30,61 +39,84 @@ class LSTM(ParametrizedBlock):
         return (np.zeros((self.n_cells, )), np.zeros((self.n_cells, )))
 
     @timeit
-    def forward(self, (x, h0, c0 )):
+    def forward(self, (x, h0, c0 ), resets=None):
         """
         X should be of shape (t,b,input_size), where t = length of sequence, b = batch size
+        or Ids of shape (t,b) (one-hot inputs, their rows of WLSTM are gathered)
+        resets (bool, shape (t,b)) marks ticks that start from the initial state (h0, c0)
+        again, e.g. starts of sequences packed one after another into one row
         """
         WLSTM = self.params['WLSTM']
+        ws = self.workspace
 
         n,b,input_size = x.shape
+        x_ids = x.ids if isinstance(x, Ids) else None
         d = WLSTM.shape[1] / 4 # hidden size
         #if c0 is None: c0 = np.zeros((b,d))
         #if h0 is None: h0 = np.zeros((b,d))
 
         # Perform the LSTM forward pass with x as the input
         xphpb = WLSTM.shape[0] # x plus h plus bias, lol
-        Hin = np.zeros((n, b, xphpb)) # input [1, xt, ht-1] to each tick of the LSTM
-        Hout = np.zeros((n, b, d)) # hidden representation of the LSTM (gated cell content)
-        IFOG = np.zeros((n, b, d * 4)) # input, forget, output, gate (IFOG)
-        IFOGf = np.zeros((n, b, d * 4)) # after nonlinearity
-        C = np.zeros((n, b, d)) # cell content
-        Ct = np.zeros((n, b, d)) # tanh of cell content
+        Wx = WLSTM[1:input_size+1] # input -> gates
+        Wh = WLSTM[input_size+1:] # hidden -> gates
+        Hout = ws.empty((n, b, d)) # hidden representation of the LSTM (gated cell content)
+        IFOG = ws.empty((n, b, d * 4)) # input, forget, output, gate (IFOG)
+        IFOGf = ws.empty((n, b, d * 4)) # after nonlinearity
+        C = ws.empty((n, b, d)) # cell content
+        Ct = ws.empty((n, b, d)) # tanh of cell content
+        # project the inputs of all ticks at once, only the recurrent part is left for the loop
+        if x_ids is None:
+          Hin = ws.empty((n, b, xphpb)) # input [1, xt, ht-1] to each tick of the LSTM (kept for the weight gradient)
+          Hin[:,:,1:input_size+1] = x
+          np.dot(x.reshape((n * b, input_size)), Wx, out=IFOG.reshape((n * b, d * 4)))
+        else:
+          Hin = ws.empty((n, b, 1 + d)) # input [1, ht-1], the one-hot xt is represented by x_ids
+          np.take(Wx, x_ids, axis=0, out=IFOG)
+        Hin[:,:,0] = 1 # bias
+        IFOG += WLSTM[0]
+        h_offset = Hin.shape[2] - d
         for t in xrange(n):
-          # concat [x,h] as input to the LSTM
           prevh = Hout[t-1] if t > 0 else h0
-          Hin[t,:,0] = 1 # bias
-          Hin[t,:,1:input_size+1] = x[t]
-          Hin[t,:,input_size+1:] = prevh
-          # compute all gate activations. dots: (most work is this line)
-          IFOG[t] = Hin[t].dot(WLSTM)
+          if t > 0 and resets is not None:
+            prevh = np.where(resets[t][:,np.newaxis], h0, prevh)
+          Hin[t,:,h_offset:] = prevh
+          # add the recurrent contribution to the gate activations
+          IFOG[t] += prevh.dot(Wh)
           # non-linearities
-          IFOGf[t,:,:3*d] = 1.0/(1.0+np.exp(-IFOG[t,:,:3*d])) # sigmoids; these are the gates
-          IFOGf[t,:,3*d:] = np.tanh(IFOG[t,:,3*d:]) # tanh
+          sig = IFOGf[t,:,:3*d] # sigmoids; these are the gates
+          np.negative(IFOG[t,:,:3*d], out=sig)
+          np.exp(sig, out=sig)
+          sig += 1.0
+          np.reciprocal(sig, out=sig)
+          np.tanh(IFOG[t,:,3*d:], out=IFOGf[t,:,3*d:]) # tanh
           # compute the cell activation
           prevc = C[t-1] if t > 0 else c0
-          C[t] = IFOGf[t,:,:d] * IFOGf[t,:,3*d:] + IFOGf[t,:,d:2*d] * prevc
-          Ct[t] = np.tanh(C[t])
-          Hout[t] = IFOGf[t,:,2*d:3*d] * Ct[t]
-
-        cache = {}
-        cache['WLSTM'] = WLSTM
-        cache['Hout'] = Hout
-        cache['IFOGf'] = IFOGf
-        cache['IFOG'] = IFOG
-        cache['C'] = C
-        cache['Ct'] = Ct
-        cache['Hin'] = Hin
-        cache['c0'] = c0
-        cache['h0'] = h0
-
-        aux = Vars(**cache)
+          if t > 0 and resets is not None:
+            prevc = np.where(resets[t][:,np.newaxis], c0, prevc)
+          np.multiply(IFOGf[t,:,:d], IFOGf[t,:,3*d:], out=C[t])
+          C[t] += IFOGf[t,:,d:2*d] * prevc
+          np.tanh(C[t], out=Ct[t])
+          np.multiply(IFOGf[t,:,2*d:3*d], Ct[t], out=Hout[t])
+
+        aux = LSTMAux(
+            WLSTM=WLSTM,
+            Hout=Hout,
+            IFOGf=IFOGf,
+            IFOG=IFOG,
+            C=C,
+            Ct=Ct,
+            Hin=Hin,
+            c0=c0,
+            h0=h0,
+            x_ids=x_ids,
+            resets=resets
+        )
 
         return ((Hout, C), aux)  # TODO: Do proper gradient backward for C
 
     @timeit
     def backward(self, aux, grads):
-          dH = grads[0].copy()
-          dC = grads[1].copy()
+          ws = self.workspace
 
           WLSTM = aux['WLSTM']
           Hout = aux['Hout']
@@ -95,22 +127,26 @@ class LSTM(ParametrizedBlock):
           Hin = aux['Hin']
           c0 = aux['c0']
           h0 = aux['h0']
+          x_ids = aux['x_ids']
+          resets = aux['resets']
           n,b,d = Hout.shape
-          input_size = WLSTM.shape[0] - d - 1 # -1 due to bias
+          xphpb = WLSTM.shape[0]
+          input_size = xphpb - d - 1 # -1 due to bias
+          Wx = WLSTM[1:input_size+1]
+          Wh = WLSTM[input_size+1:]
 
-          assert dC.shape == C.shape, "%s vs %s" % (dC.shape, C.shape, )
-          assert dH.shape == dC.shape, "%s vs %s" % (dH.shape, dC.shape, )
+          assert grads[1].shape == C.shape, "%s vs %s" % (grads[1].shape, C.shape, )
+          assert grads[0].shape == grads[1].shape, "%s vs %s" % (grads[0].shape, grads[1].shape, )
 
           # backprop the LSTM
-          dIFOG = np.zeros(IFOG.shape)
-          dIFOGf = np.zeros(IFOGf.shape)
-          dWLSTM = np.zeros(WLSTM.shape)
-          dHin = np.zeros(Hin.shape)
-          dC = np.zeros(C.shape) + dC
-          dX = np.zeros((n,b,input_size))
+          dIFOG = ws.empty(IFOG.shape)
+          dIFOGf = ws.empty(IFOGf.shape)
+          dC = ws.empty(C.shape)
+          dC[:] = grads[1]
           dh0 = np.zeros((b, d))
           dc0 = np.zeros((b, d))
-          dHout = dH
+          dHout = ws.empty(Hout.shape)
+          dHout[:] = grads[0]
 
           for t in reversed(xrange(n)):
 
@@ -119,12 +155,19 @@ class LSTM(ParametrizedBlock):
             # backprop tanh non-linearity first then continue backprop
             dC[t] += (1-tanhCt**2) * (IFOGf[t,:,2*d:3*d] * dHout[t])
 
-            if t > 0:
+            reset = resets[t][:,np.newaxis] if t > 0 and resets is not None else None
+            if reset is not None and reset.any():
+              # rows that were reset got the initial state as the previous one
+              dIFOGf[t,:,d:2*d] = np.where(reset, c0, C[t-1]) * dC[t]
+              dprevc = IFOGf[t,:,d:2*d] * dC[t]
+              dC[t-1] += np.where(reset, 0.0, dprevc)
+              dc0 += np.where(reset, dprevc, 0.0)
+            elif t > 0:
               dIFOGf[t,:,d:2*d] = C[t-1] * dC[t]
               dC[t-1] += IFOGf[t,:,d:2*d] * dC[t]
             else:
               dIFOGf[t,:,d:2*d] = c0 * dC[t]
-              dc0 = IFOGf[t,:,d:2*d] * dC[t]
+              dc0 += IFOGf[t,:,d:2*d] * dC[t]
             dIFOGf[t,:,:d] = IFOGf[t,:,3*d:] * dC[t]
             dIFOGf[t,:,3*d:] = IFOGf[t,:,:d] * dC[t]
 
@@ -133,20 +176,72 @@ class LSTM(ParametrizedBlock):
             y = IFOGf[t,:,:3*d]
             dIFOG[t,:,:3*d] = (y*(1.0-y)) * dIFOGf[t,:,:3*d]
 
-            # backprop matrix multiply
-            dWLSTM += np.dot(Hin[t].transpose(), dIFOG[t])
-            dHin[t] = dIFOG[t].dot(WLSTM.transpose())
-
-            # backprop the identity transforms into Hin
-            dX[t] = dHin[t,:,1:input_size+1]
-            if t > 0:
-              dHout[t-1,:] += dHin[t,:,input_size+1:]
+            # backprop the recurrent matrix multiply into the previous hidden state
+            dprevh = dIFOG[t].dot(Wh.transpose())
+            if reset is not None and reset.any():
+              dHout[t-1,:] += np.where(reset, 0.0, dprevh)
+              dh0 += np.where(reset, dprevh, 0.0)
+            elif t > 0:
+              dHout[t-1,:] += dprevh
             else:
-              dh0 += dHin[t,:,input_size+1:]
+              dh0 += dprevh
+
+          # the input and weight gradients of all ticks at once
+          dIFOG_all = dIFOG.reshape((n * b, d * 4))
+          if x_ids is None:
+            dWLSTM = ws.empty(WLSTM.shape)
+            np.dot(Hin.reshape((n * b, xphpb)).transpose(), dIFOG_all, out=dWLSTM)
+            dX = ws.empty((n,b,input_size))
+            np.dot(dIFOG_all, Wx.transpose(), out=dX.reshape((n * b, input_size)))
+
+            self.accum_gradients(dWLSTM)
+          else:
+            dWbh = np.dot(Hin.reshape((n * b, 1 + d)).transpose(), dIFOG_all)
+            dX = None # one-hot inputs are not differentiable
 
-          self.accum_gradients(dWLSTM)
+            self.accum_gradients_sparse(x_ids, dWbh, dIFOG_all)
 
           return (dX, dh0, dc0)
 
     def accum_gradients(self, dWLSTM):
-          self.grads['WLSTM'] += dWLSTM
\ No newline at end of file
+          self.grads['WLSTM'] += dWLSTM
+          self._dense_grads = True
+
+    def accum_gradients_sparse(self, x_ids, dWbh, dIFOG_all):
+          """Accumulate gradients of bias and hidden rows (dWbh) and scatter-add
+          gradients of the input rows selected by x_ids."""
+          dWLSTM = self.grads['WLSTM']
+          d = self.n_cells
+          input_size = dWLSTM.shape[0] - d - 1
+
+          dWLSTM[0] += dWbh[0]
+          dWLSTM[input_size+1:] += dWbh[1:]
+          np.add.at(dWLSTM[1:input_size+1], x_ids.ravel(), dIFOG_all)
+          self._touched.append(x_ids.ravel())
+
+    def grad_rows(self, param_name):
+          """Rows of WLSTM that received a gradient since the last `zero_grads`
+          (bias, hidden and the input rows of the one-hot inputs), or None after
+          a dense input."""
+          if self._dense_grads:
+            return None
+
+          if not self._touched:
+            return np.zeros((0, ), dtype=int)
+
+          n_rows = self.params['WLSTM'].shape[0]
+          input_size = n_rows - self.n_cells - 1
+          x_rows = np.unique(np.concatenate(self._touched)) + 1
+
+          return np.concatenate([[0], x_rows, np.arange(input_size + 1, n_rows)])
+
+    def zero_grads(self):
+          """Zero only the rows of the gradient that were accumulated to."""
+          rows = self.grad_rows('WLSTM')
+          if rows is None:
+            self.grads.zero()
+          else:
+            self.grads['WLSTM'][rows] = 0.0
+
+          self._touched = []
+          self._dense_grads = False
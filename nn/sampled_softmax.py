@@ -0,0 +1,86 @@
+import numpy as np
+
+from base import ParametrizedBlock
+from vars import aux_record
+
+
+SubsetSoftmaxAux = aux_record('SubsetSoftmaxAux', 'x cols p')
+
+
+class Sampler(object):
+    """Draws negative classes for the sampled softmax.
+
+    `p` are the (unnormalized) probabilities of the classes, e.g. unigram
+    frequencies of the tokens; all of them have to be positive."""
+    def __init__(self, p, n_samples):
+        p = np.asarray(p, dtype=float)
+        assert (p > 0).all(), 'All classes need a positive sampling probability.'
+
+        self.p = p / p.sum()
+        self.cdf = np.cumsum(self.p)
+        self.n_samples = n_samples
+
+    def sample(self, positives):
+        """Return (cols, log_q): sorted unique classes consisting of `positives`
+        and `n_samples` draws, and the log of the probability of each of them
+        being drawn, which the sampled softmax subtracts from its scores."""
+        draws = np.searchsorted(self.cdf, np.random.random(self.n_samples) * self.cdf[-1], side='right')
+        draws = np.minimum(draws, len(self.p) - 1)
+        cols = np.unique(np.concatenate([np.asarray(positives, dtype=int).ravel(), draws]))
+
+        # Probability that the class is among the draws: 1 - (1 - p)^n_samples.
+        q = -np.expm1(self.n_samples * np.log1p(-np.minimum(self.p[cols], 1.0 - 1e-12)))
+
+        return cols, np.log(q)
+
+
+class SubsetSoftmax(ParametrizedBlock):
+    """Softmax of a `LinearLayer` evaluated only on the output columns `cols`.
+
+    It shares the parameters of the linear layer. The output has the full size
+    of the layer's output and is zero outside `cols`, while only the H x |cols|
+    part of the weights is used and only these columns of the gradients are
+    updated. With `log_q` (see `Sampler.sample`) it is the sampled softmax, with
+    log_q None it is the exact softmax restricted to a shortlist of classes.
+    `cols` must not contain duplicates."""
+    def __init__(self, linear):
+        self.linear = linear
+
+        self.parametrize(linear.params, linear.grads)
+
+    def forward(self, (x, cols, log_q)):
+        W = self.params['W']
+        b = self.params['b']
+
+        z = np.dot(x, W[:, cols]) + b[cols]
+        if log_q is not None:
+            z -= log_q
+
+        z -= z.max(axis=-1, keepdims=True)
+        p = np.exp(z)
+        p /= p.sum(axis=-1, keepdims=True)
+
+        y = np.zeros(x.shape[:-1] + (len(b), ))
+        y[..., cols] = p
+
+        aux = SubsetSoftmaxAux(
+            x=x,
+            cols=cols,
+            p=p
+        )
+
+        return ((y, ), aux)
+
+    def backward(self, aux, (dy, )):
+        x = aux['x']
+        cols = aux['cols']
+        p = aux['p']
+
+        dp = dy[..., cols]
+        dz = p * (dp - (p * dp).sum(axis=-1, keepdims=True))
+
+        self.linear.grad_accum_cols(x.reshape((-1, x.shape[-1])), dz.reshape((-1, dz.shape[-1])), cols)
+
+        dx = np.dot(dz, self.params['W'][:, cols].T)
+
+        return (dx, None, None)
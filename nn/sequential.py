@@ -6,7 +6,10 @@ import random
 #from dataset import Dataset
 #from nn.tanh import Tanh
 from base import ParametrizedBlock
-from vars import Vars
+from vars import Vars, aux_record
+
+
+SequentialAux = aux_record('SequentialAux', 'yaux')
 
 
 class Sequential(ParametrizedBlock):
@@ -16,14 +19,17 @@ class Sequential(ParametrizedBlock):
 
         params = {}
         grads = {}
+        owners = {}
         for i, layer in enumerate(layers):
             if isinstance(layer, ParametrizedBlock):
                 for param_name in layer.params:
                     key = "%.2d__%s" % (i, param_name, )
                     params[key] = layer.params[param_name]
                     grads[key] = layer.grads[param_name]
+                    owners[key] = (layer, param_name, )
 
         self.parametrize(Vars(**params), Vars(**grads))
+        self._param_owners = owners
 
     def forward(self, (x, )):
         yaux = []
@@ -35,7 +41,7 @@ class Sequential(ParametrizedBlock):
 
             last_y = y
 
-        aux = Vars(
+        aux = SequentialAux(
             yaux=yaux
         )
 
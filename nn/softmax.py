@@ -1,7 +1,10 @@
 import numpy as np
 
 from base import Block
-from vars import Vars
+from vars import aux_record
+
+
+SoftmaxAux = aux_record('SoftmaxAux', 'y')
 
 
 class Softmax(Block):
@@ -13,7 +16,7 @@ class Softmax(Block):
         ndx = ((slice(None), ) * (len(x.shape) - 1)) + (None, )
         res = res / np.sum(res, axis=len(x.shape) - 1)[ndx]
 
-        aux = Vars(
+        aux = SoftmaxAux(
             y=res
         )
 
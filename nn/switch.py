@@ -1,18 +1,21 @@
 import numpy as np
 
 from base import Block
-from vars import Vars
+from vars import aux_record
 from softmax import Softmax
 from activs import Tanh
 from linear import Dot
 
 
+SwitchAux = aux_record('SwitchAux', 'p1 in1 in2')
+
+
 class Switch(Block):
     @classmethod
     def forward(self, (p1, in1, in2)):
         res = p1 * in1 + (1 - p1) * in2
 
-        aux = Vars(
+        aux = SwitchAux(
             p1=p1,
             in1=in1,
             in2=in2
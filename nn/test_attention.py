@@ -1,7 +1,8 @@
 import numpy as np
 from unittest import TestCase, main
 
-from nn.attention import Attention
+from nn.attention import Attention, MultiAttention
+from nn.embeddings import Ids
 from nn.utils import TestParamGradInLayer, check_finite_differences
 from nn.vars import Vars
 
@@ -36,6 +37,87 @@ class TestAttention(TestCase):
         )
         self.assertTrue(check)
 
+    def test_sparse_input(self):
+        for att in [Attention(n_hidden=5), MultiAttention(n_hidden=5, n_heads=3)]:
+            h_out = np.random.randn(11, 5)
+            g_t = np.random.randn(5)
+            emb_in = Ids(np.random.randint(13, size=(11, )), 13)
+
+            ((query, ), aux) = att.forward((h_out, g_t, emb_in))
+            ((query_dense, ), aux_dense) = att.forward((h_out, g_t, emb_in.dense()))
+            self.assertTrue(np.allclose(query, query_dense))
+
+            dquery = np.random.randn(*query.shape)
+            (dh_out, dg_t, demb_in) = att.backward(aux, (dquery, ))
+            (dh_out_dense, dg_t_dense, _) = att.backward(aux_dense, (dquery, ))
+            self.assertIsNone(demb_in)
+            self.assertTrue(np.allclose(dh_out, dh_out_dense))
+            self.assertTrue(np.allclose(dg_t, dg_t_dense))
+
+    def test_mask(self):
+        for att in [Attention(n_hidden=5), MultiAttention(n_hidden=5, n_heads=2)]:
+            h_out = np.random.randn(11, 5)
+            g_t = np.random.randn(5)
+            emb_in = np.random.randn(11, 13)
+            mask = np.zeros(11, dtype=bool)
+            mask[3:7] = True
+
+            ((query, ), aux) = att.forward((h_out, g_t, emb_in), mask=mask)
+            ((query_sub, ), aux_sub) = att.forward((h_out[mask], g_t, emb_in[mask]))
+            self.assertTrue(np.allclose(query, query_sub))
+
+            dquery = np.random.randn(*query.shape)
+            (dh_out, dg_t, demb_in) = att.backward(aux, (dquery, ))
+            (dh_out_sub, dg_t_sub, demb_in_sub) = att.backward(aux_sub, (dquery, ))
+            self.assertTrue(np.allclose(dh_out[mask], dh_out_sub))
+            self.assertTrue(np.allclose(dh_out[~mask], 0))
+            self.assertTrue(np.allclose(dg_t, dg_t_sub))
+            self.assertTrue(np.allclose(demb_in[mask], demb_in_sub))
+
+
+class TestMultiAttention(TestCase):
+    def test_forward(self):
+        att = MultiAttention(n_hidden=5, n_heads=3)
+
+        h_out = np.random.randn(11, 5)
+        g_t = np.random.randn(5)
+        emb_in = np.random.randn(11, 13)
+
+        ((query, ), aux) = att.forward((h_out, g_t, emb_in))
+        self.assertEqual(query.shape, (3, 13, ))
+        self.assertTrue(np.allclose(aux['alpha'].sum(axis=1), 1.0))
+
+    def test_backward(self):
+        att = MultiAttention(n_hidden=5, n_heads=3)
+
+        def gen_input():
+            h_out = np.random.randn(11, 5)
+            g_t = np.random.randn(5)
+            emb_in = np.random.randn(11, 13)
+
+            return (h_out, g_t, emb_in, )
+
+        check = check_finite_differences(
+            att.forward,
+            att.backward,
+            gen_input_fn=gen_input,
+            test_inputs=(0, 1, 2),
+            aux_only=True
+        )
+        self.assertTrue(check)
+
+        for param_name in ['Wy', 'Wh', 'w']:
+            params_shape = att.params[param_name].shape
+
+            checker = TestParamGradInLayer(att, param_name, layer_input=gen_input())
+            check = check_finite_differences(
+                checker.forward,
+                checker.backward,
+                gen_input_fn=lambda: (np.random.randn(*params_shape), ),
+                aux_only=True
+            )
+            self.assertTrue(check, msg='Failed check for: %s' % param_name)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
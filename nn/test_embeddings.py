@@ -1,7 +1,7 @@
 import numpy as np
 from unittest import TestCase, main
 
-from nn.embeddings import Embeddings, OneHot
+from nn.embeddings import Embeddings, OneHot, Ids
 from nn.utils import TestParamGradInLayer, check_finite_differences
 from nn.vars import Vars
 
@@ -12,6 +12,16 @@ class TestOneHot(TestCase):
 
         ((y, ), aux) = hot.forward((np.array([1, 6, 3]), ))
 
+    def test_sparse(self):
+        hot = OneHot(n_tokens=7, sparse=True)
+        dense = OneHot(n_tokens=7)
+
+        ((y, ), aux) = hot.forward((np.array([1, 6, 3]), ))
+        ((y_dense, ), aux) = dense.forward((np.array([1, 6, 3]), ))
+
+        self.assertIsInstance(y, Ids)
+        self.assertEqual(y.shape, (3, 7))
+        self.assertTrue(np.array_equal(y.dense(), y_dense))
 
 
 class TestEmbeddings(TestCase):
@@ -37,6 +47,24 @@ class TestEmbeddings(TestCase):
         )
         self.assertTrue(check)
 
+    def test_sparse_grads(self):
+        emb = Embeddings(n_tokens=10, n_dims=5)
+
+        x = np.array([0, 3, 3, 9])
+        dy = np.random.randn(4, 5)
+        ((y, ), aux) = emb.forward((x, ))
+        emb.backward(aux, (dy, ))
+
+        dW = np.zeros((10, 5))
+        for i in range(len(x)):
+            dW[x[i]] += dy[i]
+        self.assertTrue(np.allclose(emb.grads['W'], dW))
+        self.assertEqual(list(emb.grad_rows('W')), [0, 3, 9])
+
+        emb.zero_grads()
+        self.assertTrue(np.all(emb.grads['W'] == 0.0))
+        self.assertEqual(len(emb.grad_rows('W')), 0)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
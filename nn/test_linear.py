@@ -2,6 +2,7 @@ from unittest import TestCase, main
 import numpy as np
 
 from nn.linear import LinearLayer, Dot
+from nn.embeddings import Ids
 from nn.utils import check_finite_differences, TestParamGradInLayer
 
 
@@ -46,6 +47,22 @@ class TestLinearLayer(TestCase):
         )
         self.assertTrue(check)
 
+    def test_sparse_input(self):
+        lin = LinearLayer(n_in=10, n_out=5)
+
+        x = Ids(np.random.randint(10, size=(4, 3)), 10)
+        dy = np.random.randn(4, 3, 5)
+
+        res = []
+        for inp in [x, x.dense()]:
+            lin.grads.zero()
+            ((y, ), aux) = lin.forward((inp, ))
+            lin.backward(aux, (dy, ))
+            res.append((y, lin.grads['W'].copy(), lin.grads['b'].copy()))
+
+        for a, b in zip(*res):
+            self.assertTrue(np.allclose(a, b))
+
     def test_params(self):
         lin = LinearLayer(n_in=17, n_out=9)
         self.assertIsNotNone(lin.params['W'])
@@ -102,6 +119,22 @@ class TestLinearTransform(TestCase):
         )
         self.assertTrue(check)
 
+    def test_sparse_input(self):
+        lin = LinearLayer(n_in=10, n_out=5)
+
+        x = Ids(np.random.randint(10, size=(4, 3)), 10)
+        dy = np.random.randn(4, 3, 5)
+
+        res = []
+        for inp in [x, x.dense()]:
+            lin.grads.zero()
+            ((y, ), aux) = lin.forward((inp, ))
+            lin.backward(aux, (dy, ))
+            res.append((y, lin.grads['W'].copy(), lin.grads['b'].copy()))
+
+        for a, b in zip(*res):
+            self.assertTrue(np.allclose(a, b))
+
     def test_params(self):
         lin = LinearLayer(n_in=17, n_out=9)
         self.assertIsNotNone(lin.params['W'])
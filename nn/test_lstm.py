@@ -2,6 +2,7 @@ import numpy as np
 from unittest import TestCase, main
 
 from nn.lstm import LSTM
+from nn.embeddings import Ids
 from nn.utils import TestParamGradInLayer, check_finite_differences
 from nn.vars import Vars
 
@@ -45,6 +46,89 @@ class TestLSTM(TestCase):
         )
         self.assertTrue(check)
 
+    def test_sparse_input(self):
+        lstm = LSTM(n_in=10, n_out=7)
+
+        x = Ids(np.random.randint(10, size=(5, 3)), 10)
+        h0 = np.random.randn(3, 7)
+        c0 = np.random.randn(3, 7)
+        dH = np.random.randn(5, 3, 7)
+        dC = np.random.randn(5, 3, 7)
+
+        res = []
+        for inp in [x, x.dense()]:
+            lstm.grads.zero()
+            ((H, C), aux) = lstm.forward((inp, h0, c0))
+            (dX, dh0, dc0) = lstm.backward(aux, (dH, dC))
+            res.append((H, C, dh0, dc0, lstm.grads['WLSTM'].copy()))
+
+        for a, b in zip(*res):
+            self.assertTrue(np.allclose(a, b))
+
+    def test_grad_rows(self):
+        lstm = LSTM(n_in=10, n_out=7)
+        h0 = np.zeros((1, 7))
+
+        lstm.zero_grads()
+        ((H, C), aux) = lstm.forward((Ids([[2], [5], [2]], 10), h0, h0))
+        lstm.backward(aux, (np.random.randn(*H.shape), np.random.randn(*C.shape)))
+
+        rows = lstm.grad_rows('WLSTM')
+        self.assertEqual(list(rows), [0, 3, 6] + range(11, 18))
+        others = np.setdiff1d(np.arange(18), rows)
+        self.assertTrue((lstm.grads['WLSTM'][others] == 0).all())
+
+        lstm.zero_grads()
+        self.assertTrue((lstm.grads['WLSTM'] == 0).all())
+
+        ((H, C), aux) = lstm.forward((Ids([[2]], 10).dense(), h0, h0))
+        lstm.backward(aux, (np.random.randn(*H.shape), np.random.randn(*C.shape)))
+        self.assertIsNone(lstm.grad_rows('WLSTM'))
+
+    def test_resets(self):
+        """Sequences packed into one row with resets give the same results as separately."""
+        lstm = LSTM(n_in=4, n_out=6)
+        h0 = np.random.randn(6)
+        c0 = np.random.randn(6)
+        seqs = [np.random.randn(3, 1, 4), np.random.randn(2, 1, 4), np.random.randn(4, 1, 4)]
+        dHs = [np.random.randn(len(x), 1, 6) for x in seqs]
+        dCs = [np.random.randn(len(x), 1, 6) for x in seqs]
+
+        lstm.grads.zero()
+        res = []
+        dh0_sum = 0.0
+        for x, dH, dC in zip(seqs, dHs, dCs):
+            ((H, C), aux) = lstm.forward((x, h0, c0))
+            (dX, dh0, dc0) = lstm.backward(aux, (dH, dC))
+            res.append((H, C, dX))
+            dh0_sum += dh0
+        dW = lstm.grads['WLSTM'].copy()
+
+        resets = np.zeros((9, 1), dtype=bool)
+        resets[[0, 3, 5]] = True
+        lstm.grads.zero()
+        ((H, C), aux) = lstm.forward((np.concatenate(seqs), h0, c0), resets=resets)
+        (dX, dh0, dc0) = lstm.backward(aux, (np.concatenate(dHs), np.concatenate(dCs)))
+
+        self.assertTrue(np.allclose(H, np.concatenate([r[0] for r in res])))
+        self.assertTrue(np.allclose(C, np.concatenate([r[1] for r in res])))
+        self.assertTrue(np.allclose(dX, np.concatenate([r[2] for r in res])))
+        self.assertTrue(np.allclose(dh0, dh0_sum))
+        self.assertTrue(np.allclose(lstm.grads['WLSTM'], dW))
+
+    def test_backward_resets(self):
+        lstm = LSTM(n_in=3, n_out=4)
+        resets = np.random.random((6, 2)) < 0.3
+
+        check = check_finite_differences(
+            lambda inp: lstm.forward(inp, resets=resets),
+            lstm.backward,
+            gen_input_fn=lambda: (np.random.randn(6, 2, 3), np.random.randn(2, 4), np.random.randn(2, 4)),
+            aux_only=True,
+            test_inputs=(0, 1, 2, )
+        )
+        self.assertTrue(check)
+
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,116 @@
+from unittest import TestCase, main
+import numpy as np
+
+from nn.linear import LinearLayer
+from nn.softmax import Softmax
+from nn.sequential import Sequential
+from nn.sampled_softmax import Sampler, SubsetSoftmax
+from nn.utils import check_finite_differences, TestParamGradInLayer
+
+
+class TestSubsetSoftmax(TestCase):
+    def test_all_columns(self):
+        linear = LinearLayer(n_in=4, n_out=7)
+        full = Sequential([linear, Softmax()])
+        subset = SubsetSoftmax(linear)
+
+        x = np.random.randn(3, 4)
+        ((y_full, ), _) = full.forward((x, ))
+        ((y, ), _) = subset.forward((x, np.arange(7), None))
+
+        self.assertTrue(np.allclose(y, y_full))
+
+    def test_subset(self):
+        linear = LinearLayer(n_in=4, n_out=7)
+        subset = SubsetSoftmax(linear)
+        cols = np.array([1, 4, 5])
+        log_q = np.log([0.5, 0.1, 0.2])
+
+        x = np.random.randn(4)
+        ((y, ), aux) = subset.forward((x, cols, log_q))
+
+        z = np.dot(x, linear.params['W'][:, cols]) + linear.params['b'][cols] - log_q
+        exp_y = np.zeros(7)
+        exp_y[cols] = np.exp(z) / np.exp(z).sum()
+        self.assertTrue(np.allclose(y, exp_y))
+
+        subset.grads.zero()
+        subset.backward(aux, (np.random.randn(7), ))
+        others = [0, 2, 3, 6]
+        self.assertTrue((linear.grads['W'][:, others] == 0).all())
+        self.assertTrue((linear.grads['b'][others] == 0).all())
+
+    def test_grad_cols(self):
+        linear = LinearLayer(n_in=4, n_out=7)
+        subset = SubsetSoftmax(linear)
+        x = np.random.randn(2, 4)
+
+        linear.zero_grads()
+        for cols in [np.array([1, 4]), np.array([4, 6])]:
+            ((y, ), aux) = subset.forward((x, cols, None))
+            subset.backward(aux, (np.random.randn(*y.shape), ))
+
+        self.assertEqual(list(linear.grad_rows('W')), [1, 4, 6])
+        self.assertEqual(linear.grad_axis('W'), 1)
+        self.assertTrue((linear.grads['W'][:, [0, 2, 3, 5]] == 0).all())
+
+        linear.zero_grads()
+        self.assertTrue((linear.grads['W'] == 0).all() and (linear.grads['b'] == 0).all())
+        self.assertEqual(len(linear.grad_rows('W')), 0)
+
+        # The full softmax makes the gradients dense.
+        ((y, ), aux) = linear.forward((x, ))
+        linear.backward(aux, (np.random.randn(*y.shape), ))
+        self.assertIsNone(linear.grad_rows('W'))
+
+    def test_backward(self):
+        linear = LinearLayer(n_in=4, n_out=7)
+        subset = SubsetSoftmax(linear)
+        cols = np.array([0, 2, 3, 6])
+        log_q = np.log([0.3, 0.1, 0.2, 0.9])
+
+        check = check_finite_differences(
+            fwd_fn=subset.forward,
+            bwd_fn=subset.backward,
+            gen_input_fn=lambda: (np.random.randn(5, 4), cols, log_q),
+            aux_only=True
+        )
+        self.assertTrue(check)
+
+        for param_name in ['W', 'b']:
+            checker = TestParamGradInLayer(subset, param_name, (np.random.randn(5, 4), cols, log_q))
+            check = check_finite_differences(
+                fwd_fn=checker.forward,
+                bwd_fn=checker.backward,
+                gen_input_fn=lambda: (checker.gen(), ),
+                aux_only=True
+            )
+            self.assertTrue(check)
+
+
+class TestSampler(TestCase):
+    def test_sample(self):
+        sampler = Sampler(np.arange(1, 21), n_samples=5)
+
+        cols, log_q = sampler.sample([0, 3, 3])
+
+        self.assertTrue(0 in cols and 3 in cols)
+        self.assertTrue((np.diff(cols) > 0).all())
+        self.assertEqual(cols.shape, log_q.shape)
+        self.assertTrue(np.allclose(np.exp(log_q), 1 - (1 - sampler.p[cols])**5))
+
+    def test_distribution(self):
+        np.random.seed(0)
+        p = np.array([1.0, 2.0, 7.0])
+        sampler = Sampler(p, n_samples=1)
+
+        counts = np.zeros(3)
+        for i in range(2000):
+            cols, _ = sampler.sample([])
+            counts[cols] += 1
+
+        self.assertTrue(np.allclose(counts / counts.sum(), p / p.sum(), atol=0.05))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,163 @@
+import numpy as np
+from unittest import TestCase, main
+
+from nn.embeddings import Embeddings
+from nn.linear import LinearLayer
+from nn.sequential import Sequential
+from nn.update_rule import Adam, AdaMax, LazyAdam, Momentum, VanillaSGD
+from nn.vars import Vars
+
+
+def adam_reference(theta, g, m, v, t, alpha=0.002, beta1=0.9, beta2=0.999, eps=1e-8):
+    m[:] = beta1 * m + (1 - beta1) * g
+    v[:] = beta2 * v + (1 - beta2) * g**2
+    mhat = m / (1 - beta1**t)
+    vhat = v / (1 - beta2**t)
+    theta -= alpha * mhat / (np.sqrt(vhat) + eps)
+
+
+class TestUpdateRules(TestCase):
+    def make_vars(self, flat):
+        params = Vars(a=np.random.randn(4, 3), b=np.random.randn(5))
+        grads = Vars.create_from(params)
+        if flat:
+            params = params.flattened()
+            grads = grads.flattened()
+
+        return params, grads
+
+    def test_adam(self):
+        for flat in [False, True]:
+            params, grads = self.make_vars(flat)
+            ref = dict((name, params[name].copy()) for name in params)
+            ref_m = dict((name, np.zeros_like(params[name])) for name in params)
+            ref_v = dict((name, np.zeros_like(params[name])) for name in params)
+
+            adam = Adam(params, grads)
+            for t in range(1, 6):
+                for name in grads:
+                    grads[name][:] = np.random.randn(*grads[name].shape)
+                    adam_reference(ref[name], grads[name], ref_m[name], ref_v[name], t)
+                adam.update()
+
+            for name in params:
+                self.assertTrue(np.allclose(params[name], ref[name]))
+
+    def test_clip_norm(self):
+        for rule_cls in [VanillaSGD, Momentum, AdaMax, Adam]:
+            for flat in [False, True]:
+                np.random.seed(3)
+                params1, grads1 = self.make_vars(flat)
+                params2, grads2 = self.make_vars(flat)
+                params2.load(params1.dump())
+
+                rule1 = rule_cls(params1, grads1, clip_norm=1.0)
+                rule2 = rule_cls(params2, grads2)
+                for i in range(3):
+                    for name in grads1:
+                        grads1[name][:] = np.random.randn(*grads1[name].shape)
+                    g_norm = grads1.norm()
+                    for name in grads1:
+                        grads2[name][:] = grads1[name] / g_norm  # Clipped to norm 1.0 by hand.
+
+                    rule1.update()
+                    rule2.update()
+
+                    self.assertTrue(np.allclose(grads1.norm(), g_norm), 'Gradient must not be modified.')
+
+                for name in params1:
+                    self.assertTrue(np.allclose(params1[name], params2[name]), rule_cls.__name__)
+
+    def test_momentum(self):
+        params, grads = self.make_vars(True)
+        orig = params.flat.copy()
+        grads.flat[:] = 1.0
+
+        rule = Momentum(params, grads, lr=0.1, momentum=0.5)
+        rule.update()
+        rule.update()
+
+        self.assertTrue(np.allclose(params.flat, orig - 0.1 - 0.15))
+
+
+class TestLazyAdam(TestCase):
+    def test_dense_rows_same_as_adam(self):
+        W = np.random.randn(6, 3)
+        params1, grads1 = Vars(W=W.copy()), Vars(W=np.zeros_like(W))
+        params2, grads2 = Vars(W=W.copy()), Vars(W=np.zeros_like(W))
+
+        adam = Adam(params1, grads1)
+        lazy = LazyAdam(params2, grads2, rows_fn=lambda name: np.arange(6))
+        for i in range(5):
+            g = np.random.randn(*W.shape)
+            grads1['W'][:] = g
+            grads2['W'][:] = g
+            adam.update()
+            lazy.update()
+
+        self.assertTrue(np.allclose(params1['W'], params2['W']))
+
+    def test_embeddings(self):
+        emb = Embeddings(n_tokens=10, n_dims=4)
+        W_orig = emb.params['W'].copy()
+        lazy = LazyAdam(emb.params, emb.grads, rows_fn=emb.grad_rows)
+
+        for x in [np.array([1, 3, 3]), np.array([3, 7])]:
+            emb.zero_grads()
+            ((y, ), aux) = emb.forward((x, ))
+            emb.backward(aux, (np.ones_like(y), ))
+            lazy.update()
+
+        touched = [1, 3, 7]
+        untouched = [i for i in range(10) if not i in touched]
+        self.assertTrue(np.array_equal(emb.params['W'][untouched], W_orig[untouched]))
+        self.assertFalse(np.any(np.isclose(emb.params['W'][touched], W_orig[touched])))
+        self.assertEqual(list(lazy.t_rows['W']), [0, 1, 0, 2, 0, 0, 0, 1, 0, 0])
+
+        # First update of a row has the same magnitude as the first step of Adam.
+        self.assertTrue(np.allclose(emb.params['W'][7], W_orig[7] - lazy.alpha, atol=1e-6))
+
+    def test_flat_model(self):
+        model = Sequential([Embeddings(n_tokens=10, n_dims=4), LinearLayer(n_in=4, n_out=3)])
+        model.flatten()
+        dense = Sequential([Embeddings(n_tokens=10, n_dims=4), LinearLayer(n_in=4, n_out=3)])
+        dense.params.load(model.params.dump())
+
+        lazy = LazyAdam(model.params, model.grads, rows_fn=model.grad_rows)
+        adam = Adam(dense.params, dense.grads)
+        W_orig = model.params['00__W'].copy()
+
+        for x in [np.array([1, 3, 3]), np.array([3, 7])]:
+            dy = np.random.randn(len(x), 3)
+            for block, rule in [(model, lazy), (dense, adam)]:
+                block.zero_grads()
+                ((y, ), aux) = block.forward((x, ))
+                block.backward(aux, (dy, ))
+                rule.update()
+
+        self.assertEqual(list(lazy.t_rows['00__W']), [0, 1, 0, 2, 0, 0, 0, 1, 0, 0])
+        self.assertTrue(np.array_equal(model.params['00__W'][[0, 2, 4, 5, 6, 8, 9]], W_orig[[0, 2, 4, 5, 6, 8, 9]]))
+        for name in ['01__W', '01__b']:  # Dense parameters are updated as by Adam.
+            self.assertTrue(np.allclose(model.params[name], dense.params[name]))
+
+    def test_scalar_param(self):
+        params1 = Vars(a=np.array(0.5), W=np.random.randn(3, 2)).flattened()
+        params2 = Vars(a=np.array(0.5), W=params1['W'].copy())
+        grads1 = Vars.create_from(params1)
+        grads2 = Vars.create_from(params2)
+
+        lazy = LazyAdam(params1, grads1, rows_fn=lambda name: None)
+        adam = Adam(params2, grads2)
+        for i in range(3):
+            for name in grads1:
+                grads1[name][...] = grads2[name][...] = np.random.randn(*grads1[name].shape)
+            lazy.update()
+            adam.update()
+
+        self.assertEqual(lazy.t_rows['a'], 3)
+        for name in params1:
+            self.assertTrue(np.allclose(params1[name], params2[name]))
+
+
+if __name__ == "__main__":
+    main()
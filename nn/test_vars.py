@@ -0,0 +1,77 @@
+import numpy as np
+from unittest import TestCase, main
+
+from nn.vars import Vars, aux_record
+from nn.sequential import Sequential
+from nn.linear import LinearLayer
+from nn.softmax import Softmax
+from nn.update_rule import Adam
+
+
+class TestVars(TestCase):
+    def test_flattened(self):
+        v = Vars(a=np.random.randn(3, 4), b=np.random.randn(5))
+        f = v.flattened()
+
+        self.assertEqual(f.flat.shape, (17, ))
+        self.assertTrue(np.array_equal(f['a'], v['a']))
+        self.assertTrue(np.array_equal(f['b'], v['b']))
+
+        f.flat[:] = 1.0
+        self.assertTrue(np.all(f['a'] == 1.0))
+
+        g = Vars.create_from(f)
+        self.assertIsNotNone(g.flat)
+        self.assertTrue(np.all(g['a'] == 0.0))
+
+        g['b'] += 2.0
+        self.assertTrue(np.allclose(g.norm(), np.sqrt(5 * 4.0)))
+
+        f.increment_by(g, factor=-0.5)
+        self.assertTrue(np.all(f['a'] == 1.0))
+        self.assertTrue(np.all(f['b'] == 0.0))
+
+        f.zero()
+        self.assertTrue(np.all(f.flat == 0.0))
+
+    def test_flatten_block(self):
+        np.random.seed(0)
+        seq1 = Sequential([LinearLayer(n_in=5, n_out=4), Softmax()])
+        np.random.seed(0)
+        seq2 = Sequential([LinearLayer(n_in=5, n_out=4), Softmax()])
+        seq2.flatten()
+
+        # The layer works with views into the flat buffer.
+        layer = seq2.layers[0]
+        self.assertTrue(np.shares_memory(layer.params['W'], seq2.params.flat))
+        self.assertTrue(np.shares_memory(layer.grads['W'], seq2.grads.flat))
+
+        x = np.random.randn(3, 5)
+        dy = np.random.randn(3, 4)
+        for seq in [seq1, seq2]:
+            adam = Adam(seq.params, seq.grads)
+            for i in range(3):
+                seq.grads.zero()
+                ((y, ), aux) = seq.forward((x, ))
+                seq.backward(aux, (dy, ))
+                adam.update()
+
+        for name in seq1.params:
+            self.assertTrue(np.allclose(seq1.params[name], seq2.params[name]))
+
+
+class TestAuxRecord(TestCase):
+    def test_access(self):
+        Rec = aux_record('Rec', 'x y')
+        rec = Rec(x=1, y=np.arange(3))
+
+        self.assertEqual(rec['x'], 1)
+        self.assertEqual(rec.x, 1)
+        self.assertIs(rec['y'], rec.y)
+        self.assertEqual(rec[0], 1)
+        self.assertTrue('y' in rec)
+        self.assertFalse('z' in rec)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+import numpy as np
+from unittest import TestCase, main
+
+from nn.workspace import Workspace
+from nn.lstm import LSTM
+
+
+class TestWorkspace(TestCase):
+    def test_reuse(self):
+        ws = Workspace()
+        a = ws.zeros((3, 4))
+        b = ws.empty((3, 4))
+        self.assertIsNot(a, b)
+
+        ws.reset()
+        c = ws.empty((3, 4))
+        d = ws.zeros((3, 4))
+        self.assertTrue(c is a or c is b)
+        self.assertTrue(d is a or d is b)
+        self.assertTrue(np.all(d == 0.0))
+        self.assertEqual(ws.n_buffers(), 2)
+
+    def test_release(self):
+        ws = Workspace()
+        a = ws.empty((2, ))
+        mark = ws.mark()
+        b = ws.empty((2, ))
+
+        ws.release(mark)
+        c = ws.empty((2, ))
+        self.assertIs(c, b)
+        self.assertIsNot(ws.empty((2, )), a)  # `a` stays reserved.
+        self.assertEqual(ws.n_buffers(), 3)
+
+    def test_lstm(self):
+        lstm = LSTM(n_in=5, n_out=7)
+
+        x = np.random.randn(11, 3, 5)
+        h0 = np.random.randn(3, 7)
+        c0 = np.random.randn(3, 7)
+        dH = np.random.randn(11, 3, 7)
+        dC = np.random.randn(11, 3, 7)
+
+        ((H1, C1), aux) = lstm.forward((x, h0, c0))
+        dX1, dh01, dc01 = lstm.backward(aux, (dH, dC))
+        H1, dX1 = H1.copy(), dX1.copy()
+
+        lstm.workspace = ws = Workspace()
+        for i in range(3):
+            ws.reset()
+            ((H2, C2), aux) = lstm.forward((x, h0, c0))
+            dX2, dh02, dc02 = lstm.backward(aux, (dH, dC))
+            if i == 0:
+                n_buffers = ws.n_buffers()
+
+        self.assertEqual(ws.n_buffers(), n_buffers)
+        self.assertTrue(np.allclose(H1, H2))
+        self.assertTrue(np.allclose(dX1, dX2))
+        self.assertTrue(np.allclose(dh01, dh02))
+        self.assertTrue(np.allclose(dc01, dc02))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,24 +3,87 @@ import numpy as np
 from vars import Vars
 
 
-class VanillaSGD(object):
-    def __init__(self, params, grads, lr=0.1):
+class UpdateRule(object):
+    """Base of the update rules.
+
+    The updates are done in place with `out=` operations on preallocated
+    scratch buffers; when params and grads are flat (see `Vars.flattened`)
+    each operation is done once on the whole buffer.
+
+    If clip_norm is set, the gradient is scaled so that its global L2 norm
+    (over all variables) is at most clip_norm. The scale is folded into the
+    scalar factors of the update, the gradient itself is not modified."""
+    def __init__(self, params, grads, clip_norm=0.0):
         self.params = params
         self.grads = grads
+        self.clip_norm = clip_norm
+
+        self.scratch = Vars.create_from(params)
+
+    def is_flat(self):
+        return self.params.flat is not None and self.grads.flat is not None
+
+    def slots(self, *state):
+        """Yield (theta, g, scratch, *state) for the flat buffers or for each variable."""
+        all_vars = (self.params, self.grads, self.scratch) + state
+        if self.is_flat():
+            yield tuple(vars.flat for vars in all_vars)
+        else:
+            for param_name in self.params:
+                yield tuple(vars[param_name] for vars in all_vars)
+
+    def grad_scale(self, g_norm=None):
+        """Factor the gradient is multiplied by due to global norm clipping."""
+        if not self.clip_norm:
+            return 1.0
+
+        if g_norm is None:
+            g_norm = self.grads.norm()
+
+        if g_norm > self.clip_norm:
+            return self.clip_norm / g_norm
+
+        return 1.0
+
+
+class VanillaSGD(UpdateRule):
+    def __init__(self, params, grads, lr=0.1, clip_norm=0.0):
+        super(VanillaSGD, self).__init__(params, grads, clip_norm=clip_norm)
+        self.lr = lr
+
+    def update(self):
+        step = -self.lr * self.grad_scale()
+
+        for theta, g, scratch in self.slots():
+            np.multiply(g, step, out=scratch)
+            theta += scratch
+
+
+class Momentum(UpdateRule):
+    """SGD with (heavy ball) momentum."""
+    def __init__(self, params, grads, lr=0.1, momentum=0.9, clip_norm=0.0):
+        super(Momentum, self).__init__(params, grads, clip_norm=clip_norm)
         self.lr = lr
+        self.momentum = momentum
+
+        self.velocity = Vars.create_from(params)
 
     def update(self):
-        self.params.increment_by(self.grads, factor=-self.lr)
+        step = -self.lr * self.grad_scale()
 
+        for theta, g, scratch, velocity in self.slots(self.velocity):
+            velocity *= self.momentum
+            np.multiply(g, step, out=scratch)
+            velocity += scratch
+            theta += velocity
 
-class AdaMax(object):
+
+class AdaMax(UpdateRule):
     #def __init__(self, params, grads, alpha=0.002, beta1=0.9, beta2=0.999):
-    def __init__(self, params, grads, alpha=0.0002, beta1=0.1, beta2=0.001):
-        self.params = params
-        self.grads = grads
+    def __init__(self, params, grads, alpha=0.0002, beta1=0.1, beta2=0.001, clip_norm=0.0):
+        super(AdaMax, self).__init__(params, grads, clip_norm=clip_norm)
 
         self.m = Vars.create_from(params)
-        self.u_comp = Vars.create_from(params)
         self.u = 0.0
         self.t = 0
 
@@ -28,31 +91,32 @@ class AdaMax(object):
         self.beta1 = beta1
         self.beta2 = beta2
 
-    def update_var(self, theta, g, m):
-        m[:] = self.beta1 * m + (1 - self.beta1) * g
-        theta[:] = theta[:] - (self.alpha / (1 - np.power(self.beta1, self.t))) * m / self.u
+    def update_var(self, theta, g, scratch, m, g_scale):
+        # m = beta1 * m + (1 - beta1) * g
+        m *= self.beta1
+        np.multiply(g, (1 - self.beta1) * g_scale, out=scratch)
+        m += scratch
+
+        # theta -= alpha / (1 - beta1^t) * m / u
+        step = self.alpha / (1 - np.power(self.beta1, self.t)) / self.u
+        np.multiply(m, step, out=scratch)
+        theta -= scratch
 
     def update(self):
         self.t += 1
-        g_norm = 0.0
-        for param_name in self.params:
-            g_norm += np.sum(self.grads[param_name]**2)
-        g_norm = np.sqrt(g_norm)
 
-        self.u = max(self.beta2 * self.u, g_norm)
-        for param_name in self.params:
-            self.update_var(
-                theta=self.params[param_name],
-                g=self.grads[param_name],
-                m=self.m[param_name]
-            )
+        g_norm = self.grads.norm()
+        g_scale = self.grad_scale(g_norm)
+
+        self.u = max(self.beta2 * self.u, g_norm * g_scale)
+        for theta, g, scratch, m in self.slots(self.m):
+            self.update_var(theta, g, scratch, m, g_scale)
 
 
-class Adam(object):
-    def __init__(self, params, grads, alpha=0.002, beta1=0.9, beta2=0.999, eps=1e-8):
+class Adam(UpdateRule):
+    def __init__(self, params, grads, alpha=0.002, beta1=0.9, beta2=0.999, eps=1e-8, clip_norm=0.0):
         #def __init__(self, params, grads, alpha=0.0002, beta1=0.1, beta2=0.001, eps=1e-8):
-        self.params = params
-        self.grads = grads
+        super(Adam, self).__init__(params, grads, clip_norm=clip_norm)
 
         self.m = Vars.create_from(params)
         self.v = Vars.create_from(params)
@@ -63,22 +127,103 @@ class Adam(object):
         self.beta2 = beta2
         self.eps = eps
 
-    def update_var(self, theta, g, m, v):
-        m[:] = self.beta1 * m + (1 - self.beta1) * g
-        v[:] = self.beta2 * v + (1 - self.beta2) * g**2
+    def update_var(self, theta, g, scratch, m, v, g_scale=1.0):
+        # m = beta1 * m + (1 - beta1) * g
+        m *= self.beta1
+        np.multiply(g, (1 - self.beta1) * g_scale, out=scratch)
+        m += scratch
+
+        # v = beta2 * v + (1 - beta2) * g^2
+        v *= self.beta2
+        np.multiply(g, g, out=scratch)
+        scratch *= (1 - self.beta2) * g_scale**2
+        v += scratch
+
+        # alpha * mhat / (sqrt(vhat) + eps) with the bias corrections folded into
+        # the step size: alpha * sqrt(c2) / c1 * m / (sqrt(v) + eps * sqrt(c2))
+        c1 = 1 - np.power(self.beta1, self.t)
+        c2 = np.sqrt(1 - np.power(self.beta2, self.t))
+        np.sqrt(v, out=scratch)
+        scratch += self.eps * c2
+        np.divide(m, scratch, out=scratch)
+        scratch *= self.alpha * c2 / c1
+        theta -= scratch
+
+    def update(self):
+        self.t += 1
+
+        g_scale = self.grad_scale()
+        for theta, g, scratch, m, v in self.slots(self.m, self.v):
+            self.update_var(theta, g, scratch, m, v, g_scale)
+
+
+class LazyAdam(Adam):
+    """Adam that updates only the rows of parameters that got a gradient.
+
+    `rows_fn(param_name)` returns the indices of rows with a gradient (e.g.
+    `ParametrizedBlock.grad_rows`) or None for a dense parameter, which is
+    updated as in Adam. The moments of the other rows are left untouched and
+    each row is bias-corrected by the number of its own updates. The rows are
+    indexed along `axis_fn(param_name)` (e.g. `ParametrizedBlock.grad_axis`,
+    the output columns of a `LinearLayer`), along the first axis by default.
+
+    The parameters may be flat (see `Vars.flattened`), e.g. of a flattened
+    composite block with `rows_fn=block.grad_rows`; they are then updated
+    variable by variable."""
+    def __init__(self, params, grads, rows_fn, axis_fn=None, **kwargs):
+        super(LazyAdam, self).__init__(params, grads, **kwargs)
+
+        self.rows_fn = rows_fn
+        self.axes = {}
+        self.t_rows = {}  # Number of updates of each row (a 0-d array for 0-d parameters).
+        for param_name in params:
+            axis = axis_fn(param_name) if axis_fn is not None else 0
+            self.axes[param_name] = axis
+            self.t_rows[param_name] = np.zeros(params[param_name].shape[axis:axis + 1], dtype=int)
+
+    def update_rows(self, theta, g, m, v, t_rows, rows, axis=0, g_scale=1.0):
+        if axis:
+            # Views with the rows along the first axis; the updates write through.
+            theta, g, m, v = [np.moveaxis(arr, axis, 0) for arr in (theta, g, m, v)]
+
+        t_rows[rows] += 1
+        t = t_rows[rows].reshape((-1, ) + (1, ) * (theta.ndim - 1))
+
+        g = g[rows] * g_scale
+        m_rows = self.beta1 * m[rows] + (1 - self.beta1) * g
+        v_rows = self.beta2 * v[rows] + (1 - self.beta2) * g**2
+        m[rows] = m_rows
+        v[rows] = v_rows
 
-        mhat = m / (1 - np.power(self.beta1, self.t))
-        vhat = v / (1 - np.power(self.beta2, self.t))
+        mhat = m_rows / (1 - np.power(self.beta1, t))
+        vhat = v_rows / (1 - np.power(self.beta2, t))
 
-        theta[:] = theta[:] - (self.alpha * mhat / (np.sqrt(vhat) + self.eps))
+        theta[rows] -= self.alpha * mhat / (np.sqrt(vhat) + self.eps)
 
     def update(self):
         self.t += 1
 
+        g_scale = self.grad_scale()
         for param_name in self.params:
-            self.update_var(
-                theta=self.params[param_name],
-                g=self.grads[param_name],
-                m=self.m[param_name],
-                v=self.v[param_name]
-            )
\ No newline at end of file
+            rows = self.rows_fn(param_name)
+            if rows is None:
+                self.t_rows[param_name] += 1
+                self.update_var(
+                    theta=self.params[param_name],
+                    g=self.grads[param_name],
+                    scratch=self.scratch[param_name],
+                    m=self.m[param_name],
+                    v=self.v[param_name],
+                    g_scale=g_scale
+                )
+            else:
+                self.update_rows(
+                    theta=self.params[param_name],
+                    g=self.grads[param_name],
+                    m=self.m[param_name],
+                    v=self.v[param_name],
+                    t_rows=self.t_rows[param_name],
+                    rows=rows,
+                    axis=self.axes[param_name],
+                    g_scale=g_scale
+                )
@@ -1,4 +1,23 @@
 import numpy as np
+from collections import namedtuple
+
+
+def aux_record(typename, field_names):
+    """Create a light-weight record type for the forward caches (aux) of blocks.
+    It is a namedtuple (no per-instance dict, names are not sorted on creation)
+    whose fields can also be read by name as `aux['name']`, like from Vars."""
+    base = namedtuple(typename, field_names)
+
+    def __getitem__(self, item):
+        if isinstance(item, basestring):
+            return getattr(self, item)
+        return tuple.__getitem__(self, item)
+
+    def __contains__(self, item):
+        """Is field with the given name contained?"""
+        return item in self._fields
+
+    return type(typename, (base, ), dict(__slots__=(), __getitem__=__getitem__, __contains__=__contains__))
 
 
 class Vars(object):
@@ -7,6 +26,7 @@ class Vars(object):
         assert not args
 
         self.vars = kwargs
+        self.flat = None  # Contiguous buffer the variables are views of (see `flattened`).
         self.var_names = []
         for var_name, var_val in sorted(kwargs.items(), key=lambda (n, v,): n):
             self.var_names.append(var_name)
@@ -21,6 +41,7 @@ class Vars(object):
 
     def __setitem__(self, item, val):
         """Set variable with the given name to the given value."""
+        assert self.flat is None or val is self.vars.get(item), 'Cannot replace a variable of flat Vars.'
         self.vars[item]= val
         if not item in self.var_names:
             self.var_names.append(item)
@@ -34,12 +55,37 @@ class Vars(object):
 
     @staticmethod
     def create_from(vars):
+        if vars.flat is not None:
+            res = vars.flattened()
+            res.flat.fill(0.0)
+            return res
+
         data = {}
         for var in vars:
             data[var] = np.zeros_like(vars[var])
 
         return Vars(**data)
 
+    def flattened(self):
+        """Copy the variables into one contiguous buffer (available as `flat`)
+        and return Vars whose variables are views into it."""
+        size = sum(self.vars[param_name].size for param_name in self)
+        flat = np.empty((size, ))
+
+        data = {}
+        offset = 0
+        for param_name in self:
+            val = self.vars[param_name]
+            view = flat[offset:offset + val.size].reshape(val.shape)
+            view[...] = val
+            data[param_name] = view
+            offset += val.size
+
+        res = Vars(**data)
+        res.flat = flat
+
+        return res
+
 
     def values(self):
         """Get a list of values of all variables in alphabetical order."""
@@ -51,14 +97,32 @@ class Vars(object):
 
     def zero(self):
         """Set all variable values to zero."""
+        if self.flat is not None:
+            self.flat.fill(0.0)
+            return
+
         for param_name in self:
             self.vars[param_name].flat[:] = 0
 
+    def norm(self):
+        """L2 norm of all variables together."""
+        if self.flat is not None:
+            return np.sqrt(np.dot(self.flat, self.flat))
+
+        return np.sqrt(sum(np.sum(self.vars[param_name]**2) for param_name in self))
+
     def increment_by(self, params_inst, factor=1.0, clip=0.0):
         """Increment all values of variables by their value in params_inst.
         It is useful for updating variables by their gradients."""
         assert self.var_names == params_inst.var_names, "%s vs. %s" % (self.var_names, params_inst.var_names, )
 
+        if self.flat is not None and params_inst.flat is not None:
+            grad = params_inst.flat
+            if clip:
+                np.clip(grad, -clip, clip, out=grad)
+            self.flat += factor * grad
+            return
+
         for param_name in self:
             grad = params_inst[param_name]
             if clip:
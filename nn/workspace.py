@@ -0,0 +1,72 @@
+import numpy as np
+from collections import defaultdict
+
+
+class NullWorkspace(object):
+    """Allocates a new array on every request (the default of the blocks)."""
+    def empty(self, shape):
+        return np.empty(shape)
+
+    def zeros(self, shape):
+        return np.zeros(shape)
+
+    def reset(self):
+        pass
+
+    def mark(self):
+        return None
+
+    def release(self, mark):
+        pass
+
+
+class Workspace(NullWorkspace):
+    """Pool of reusable buffers keyed by shape.
+
+    Buffers handed out by `empty`/`zeros` stay reserved until `reset` returns
+    all of them to the pool. When the same sequence of shapes is requested
+    after each reset (e.g. in every training step), no new arrays are allocated
+    after the first step.
+
+    The owner has to call `reset` only when no array handed out since the last
+    reset (e.g. in a forward cache) is needed anymore."""
+    def __init__(self):
+        self._free = defaultdict(list)
+        self._used = []
+
+    def empty(self, shape):
+        shape = tuple(shape)
+        free = self._free[shape]
+        if free:
+            res = free.pop()
+        else:
+            res = np.empty(shape)
+        self._used.append(res)
+
+        return res
+
+    def zeros(self, shape):
+        res = self.empty(shape)
+        res.fill(0.0)
+
+        return res
+
+    def reset(self):
+        for arr in self._used:
+            self._free[arr.shape].append(arr)
+        self._used = []
+
+    def mark(self):
+        """Current position in the buffers handed out since the last reset (see `release`)."""
+        return len(self._used)
+
+    def release(self, mark):
+        """Return the buffers handed out after `mark` to the pool. None of them
+        may be used anymore."""
+        for arr in self._used[mark:]:
+            self._free[arr.shape].append(arr)
+        del self._used[mark:]
+
+    def n_buffers(self):
+        """Total number of buffers owned by the workspace."""
+        return len(self._used) + sum(len(free) for free in self._free.itervalues())
@@ -2,26 +2,33 @@ import random
 from collections import deque, defaultdict
 
 import numpy as np
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import seaborn as sbt
-sbt.set()
-
-from nn import LSTM, OneHot, Sequential, LinearLayer, Softmax, Sigmoid, Vars, ParametrizedBlock, VanillaSGD, Adam
-from nn.attention import Attention
+
+from nn import LSTM, OneHot, Ids, Sequential, LinearLayer, Softmax, Sigmoid, ParametrizedBlock, VanillaSGD, Adam, LazyAdam, aux_record
+from nn.attention import Attention, MultiAttention
+from nn.sampled_softmax import Sampler, SubsetSoftmax
 from nn.switch import Switch
+from nn.workspace import Workspace, NullWorkspace
 from db import DB
 from seq_loss import SeqLoss
 from data_calc import DataCalc
+from data_pipeline import Prefetcher
+from data_shards import ShardReader
+from evaluator import BackgroundEvaluator
+from learning_curve import DecimatedHistory, PlotWriter
 import metrics
 
 
+NTONAux = aux_record('NTONAux', 'H_aux gen_n gen_aux')
+NTONCheckpointAux = aux_record('NTONCheckpointAux', 'H_aux gen_n checkpoints H E clf_subset shortlist')
+NTONStepAux = aux_record('NTONStepAux', 'h_t rnn_result_t query_t db_result_t p1 y_t')
+
+
 class NTON(ParametrizedBlock):
-    def __init__(self, n_tokens, n_cells, db, emb, max_gen=10):
+    def __init__(self, n_tokens, n_cells, db, emb, max_gen=10, n_queries=1, use_workspace=False, n_sampled=0, sampling_p=None, shortlist_ids=None, checkpoint_every=0):
         self.n_tokens = n_tokens
         self.n_cells = n_cells
         self.max_gen = max_gen
+        self.n_queries = n_queries  # Number of queries sent to the database in each step (e.g. 2 for DB2).
 
         self.db = db
         self.emb = emb
@@ -33,11 +40,30 @@ class NTON(ParametrizedBlock):
             LinearLayer(n_in=n_cells, n_out=n_tokens),
             Softmax()
         ])
+        # Scores only some columns of the output layer (sharing its parameters).
+        self.subset_clf = SubsetSoftmax(self.output_rnn_clf.layers[0])
+        # With n_sampled > 0, training (`forward` with targets) uses sampled softmax
+        # with n_sampled negatives drawn from sampling_p (uniform by default).
+        self.sampler = None
+        if n_sampled:
+            self.sampler = Sampler(sampling_p if sampling_p is not None else np.ones(n_tokens), n_sampled)
+        # Shortlist decoding: if shortlist_ids (e.g. the most frequent tokens) are given,
+        # `forward` without targets scores only them, the question tokens, [EOS] and
+        # the tokens returned by the database. Set to None for exact decoding.
+        self.shortlist_ids = shortlist_ids
+        # Gradient checkpointing: with checkpoint_every = k > 0 `forward` keeps only the
+        # inputs (y_tm1, h_tm1, c_tm1) of every k-th decoder step instead of the caches
+        # of all steps, and `backward` recomputes the steps segment by segment. The
+        # gradients are exactly the same.
+        self.checkpoint_every = checkpoint_every
         self.output_switch_p = Sequential([
             LinearLayer(n_in=n_cells, n_out=1),
             Sigmoid()
         ])
-        self.att = Attention(n_hidden=n_cells)
+        if n_queries == 1:
+            self.att = Attention(n_hidden=n_cells)
+        else:
+            self.att = MultiAttention(n_hidden=n_cells, n_heads=n_queries)
 
         self.param_layers, self.param_layers_names = zip(*[
             (self.output_switch_p, 'switch'),
@@ -47,58 +73,113 @@ class NTON(ParametrizedBlock):
             (self.input_rnn, 'in_rnn'),
         ])
 
+        # With a workspace the buffers of the recurrent layers and attention are reused
+        # between examples; the aux of `forward` is then valid only until the next `forward`.
+        self.workspace = Workspace() if use_workspace else NullWorkspace()
+        for layer in [self.input_rnn, self.output_rnn, self.att]:
+            layer.workspace = self.workspace
+
         self.print_widths = defaultdict(dict)
 
         self.parametrize_from_layers(self.param_layers, self.param_layers_names)
+        self.flatten()  # All parameters (and gradients) in one buffer for vectorized updates.
+
+    def forward(self, (E, eos_token), no_print=False, targets=None):
+        self.workspace.reset()
+
+        # Sampled softmax in training: one sample of negatives for the whole answer.
+        clf_subset = None
+        if targets is not None and self.sampler is not None:
+            clf_subset = self.sampler.sample(targets)
+
+        shortlist = None
+        if targets is None and self.shortlist_ids is not None:
+            shortlist = reduce(np.union1d, [self.shortlist_ids, token_ids(E), token_ids(eos_token)])
 
-    def forward(self, (E, eos_token), no_print=False):
         h0, c0 = self.input_rnn.get_init()
-        ((H, C ), H_aux) = self.input_rnn.forward((E[:, np.newaxis, :], h0, c0, ))   # Process input sequence.
+        E_in = E.reshape((-1, 1)) if isinstance(E, Ids) else E[:, np.newaxis, :]
+        ((H, C ), H_aux) = self.input_rnn.forward((E_in, h0, c0, ))   # Process input sequence.
         H = H[:, 0]
         C = C[:, 0]
 
         h_tm1 = H[-1]       # Initial state of the output RNN is equal to the input RNN.
         c_tm1 = C[-1]
 
-        y_tm1 = eos_token   # Prepare initial input symbol for generating.
+        x_t = eos_token   # Prepare initial input symbol for generating.
 
         Y = []
         y = []
         gen_aux = []
+        checkpoints = []
         for i in range(self.max_gen):   # Generate maximum `max_gen` words.
-            ((y_tm1, h_tm1, c_tm1), aux_t) = self.forward_gen_step((y_tm1, h_tm1, c_tm1, H, E))
+            if self.checkpoint_every and i % self.checkpoint_every == 0:
+                checkpoints.append((x_t, h_tm1, c_tm1))
 
-            Y.append(y_tm1.squeeze())
-            gen_aux.append(aux_t)
+            mark = self.workspace.mark()
+            ((y_t, h_tm1, c_tm1), aux_t) = self.forward_gen_step((x_t, h_tm1, c_tm1, H, E), no_print=no_print, clf_subset=clf_subset, shortlist=shortlist)
+
+            if self.checkpoint_every:
+                # Only the outputs of the step are kept; its buffers are reused by the next one.
+                y_t, h_tm1, c_tm1 = y_t.copy(), h_tm1.copy(), c_tm1.copy()
+                self.workspace.release(mark)
+            else:
+                gen_aux.append(aux_t)
+
+            Y.append(y_t.squeeze())
 
             #prev_y_ndx = np.random.choice(self.n_tokens, p=y_t)
-            y_decoded_token = y_tm1.argmax()
+            y_decoded_token = y_t.argmax()
             y.append(y_decoded_token)
 
+            # Feed back the output distribution, or the decoded token when the input is given as ids.
+            x_t = Ids(y_decoded_token, self.n_tokens) if isinstance(eos_token, Ids) else y_t
+
         Y = np.array(Y)
         y = np.array(y)
 
-        return ((Y, y), Vars(
+        if self.checkpoint_every:
+            return ((Y, y), NTONCheckpointAux(
+                H_aux=H_aux,
+                gen_n=len(y),
+                checkpoints=checkpoints,
+                H=H,
+                E=E,
+                clf_subset=clf_subset,
+                shortlist=shortlist
+            ))
+
+        return ((Y, y), NTONAux(
             H_aux=H_aux,
             gen_n=len(y),
             gen_aux=gen_aux
         ))
 
-    def forward_gen_step(self, (y_tm1, h_tm1, c_tm1, H, E)):
-        ((h_t, c_t), h_t_aux_curr) = self.output_rnn.forward((y_tm1[np.newaxis, np.newaxis, :], h_tm1, c_tm1))
+    def forward_gen_step(self, (y_tm1, h_tm1, c_tm1, H, E), no_print=False, clf_subset=None, shortlist=None):
+        """One step of the decoder. `clf_subset` is None (the full output softmax)
+        or (cols, log_q) for `SubsetSoftmax`. With `shortlist` (token ids) only
+        these and the tokens with a nonzero database result are scored."""
+        x_t = y_tm1.reshape((1, 1)) if isinstance(y_tm1, Ids) else y_tm1[np.newaxis, np.newaxis, :]
+        ((h_t, c_t), h_t_aux_curr) = self.output_rnn.forward((x_t, h_tm1, c_tm1))
         h_t = h_t[0][0]
         c_t = c_t[0][0]
 
-        ((rnn_result_t, ), rnn_result_aux_curr) = self.output_rnn_clf.forward((h_t, ))  # Get RNN LM result.
-
         ((query_t, ), query_t_aux_curr) = self.att.forward((H, h_t, E, ))      # Get the result from database.
-        ((db_result_t, ), db_result_t_aux_curr) = self.db.forward((query_t, ))
+        queries_t = (query_t, ) if self.n_queries == 1 else tuple(query_t)     # All queries go to the database in one call.
+        ((db_result_t, ), db_result_t_aux_curr) = self.db.forward(queries_t)
+
+        if shortlist is not None:
+            clf_subset = (np.union1d(shortlist, np.flatnonzero(db_result_t)), None)
+
+        if clf_subset is None:
+            ((rnn_result_t, ), rnn_result_aux_curr) = self.output_rnn_clf.forward((h_t, ))  # Get RNN LM result.
+        else:
+            ((rnn_result_t, ), rnn_result_aux_curr) = self.subset_clf.forward((h_t, ) + tuple(clf_subset))
 
         ((p1, ), switch_p_aux_curr) = self.output_switch_p.forward((h_t, ))    # Get the value of switch between RNN and database.
         ((y_t, ), aux_y_t) = Switch.forward((p1, rnn_result_t, db_result_t))   # Get switched output.
         y_t = y_t.squeeze()
 
-        aux = Vars(
+        aux = NTONStepAux(
             h_t=h_t_aux_curr,
             rnn_result_t=rnn_result_aux_curr,
             query_t=query_t_aux_curr,
@@ -107,20 +188,26 @@ class NTON(ParametrizedBlock):
             y_t=aux_y_t,
         )
 
-        self.forward_gen_step_debug(**locals())
+        if not no_print:
+            self.forward_gen_step_debug(**locals())
 
         return ((y_t, h_t, c_t), aux)
 
     def backward_gen_step(self, aux, (dy_t, dh_t, dc_t)):
         (dp1, drnn_result_t, ddb_result_t, ) =      Switch.backward(aux['y_t'], (dy_t , ))
         (dh_t_1, ) = self.output_switch_p.backward(aux['p1'], (dp1, ))
-        (dh_t_2, ) =  self.output_rnn_clf.backward(aux['rnn_result_t'], (drnn_result_t, ))
-        (dquery_t, )           =  self.db.backward(aux['db_result_t'], (ddb_result_t, ))
+        clf = self.subset_clf if 'cols' in aux['rnn_result_t'] else self.output_rnn_clf
+        (dh_t_2, ) =  clf.backward(aux['rnn_result_t'], (drnn_result_t, ))[:1]
+        dqueries_t             =  self.db.backward(aux['db_result_t'], (ddb_result_t, ))
+        dquery_t = dqueries_t[0] if self.n_queries == 1 else np.array(dqueries_t)
         (dH_t, dh_t_3, dE_t, ) = self.att.backward(aux['query_t'], (dquery_t, ))
 
         (dx_t, dh_tm1, dc_tm1, ) = self.output_rnn.backward(aux['h_t'], ((dh_t + dh_t_1 + dh_t_2 + dh_t_3)[None, None, :], dc_t[None, None, :], ))
 
-        return (dx_t[0, 0], dh_tm1[0], dc_tm1[0], dH_t, dE_t, )
+        if dx_t is not None:
+            dx_t = dx_t[0, 0]
+
+        return (dx_t, dh_tm1[0], dc_tm1[0], dH_t, dE_t, )
 
 
     def forward_gen_step_debug(self_, y_t, db_result_t, rnn_result_t, query_t_aux_curr, p1, **kwargs):
@@ -154,39 +241,85 @@ class NTON(ParametrizedBlock):
 
     def backward(self, aux, (grads, _)):
         H_aux = aux['H_aux']
-        gen_aux = aux['gen_aux']
 
         dh_tp1, dc_tp1 = self.output_rnn.get_init_grad()
         dx_tp1 = np.zeros_like(grads[0])
-        dH = None
-        dE = None
-        for i in reversed(range(aux['gen_n'])):
-            (dx_tp1, dh_tp1, dc_tp1, dH_t, dE_t) = self.backward_gen_step(gen_aux[i], (dx_tp1 + grads[i], dh_tp1, dc_tp1))
+        if 'checkpoints' in aux:
+            (dx_tp1, dh_tp1, dc_tp1, dH, dE) = self.backward_checkpointed(aux, grads, (dx_tp1, dh_tp1, dc_tp1))
+        else:
+            (dx_tp1, dh_tp1, dc_tp1, dH, dE) = self.backward_steps(aux['gen_aux'], grads[:aux['gen_n']], (dx_tp1, dh_tp1, dc_tp1), None, None)
+
+        dH[-1] += dh_tp1.squeeze()  # Output RNN back to Input RNN last state.
+        dC = self.workspace.zeros(dH.shape)
+        dC[-1] += dc_tp1.squeeze()
+        dH = dH[:, np.newaxis, :]
+        dC = dC[:, np.newaxis, :]
+        (dE_2, dh0, dc0) = self.input_rnn.backward(H_aux, (dH, dC))
+
+        if dE is not None:
+            dE += dE_2[:, 0, :]
+
+        return (dE, dx_tp1)
+
+    def backward_steps(self, gen_aux, grads, (dx_tp1, dh_tp1, dc_tp1), dH, dE):
+        """Backward through the decoder steps with caches `gen_aux` (in reverse
+        order) given the gradients of the state after the last of them. The
+        gradients w.r.t. H and E are added to dH and dE (allocated if None)."""
+        for i in reversed(range(len(gen_aux))):
+            dy_t = grads[i] if dx_tp1 is None else dx_tp1 + grads[i]
+            (dx_tp1, dh_tp1, dc_tp1, dH_t, dE_t) = self.backward_gen_step(gen_aux[i], (dy_t, dh_tp1, dc_tp1))
 
             if dH is None:
-                dH = dH_t.copy()
+                dH = self.workspace.empty(dH_t.shape)
+                dH[:] = dH_t
             else:
                 dH += dH_t
 
-            if dE is None:
-                dE = dE_t.copy()
+            if dE_t is None:    # One-hot input ids are not differentiable.
+                pass
+            elif dE is None:
+                dE = self.workspace.empty(dE_t.shape)
+                dE[:] = dE_t
             else:
                 dE += dE_t
 
-        dH[-1] += dh_tp1.squeeze()  # Output RNN back to Input RNN last state.
-        dC = np.zeros_like(dH)
-        dC[-1] += dc_tp1.squeeze()
-        dH = dH[:, np.newaxis, :]
-        dC = dC[:, np.newaxis, :]
-        (dE_2, dh0, dc0) = self.input_rnn.backward(H_aux, (dH, dC))
+        return (dx_tp1, dh_tp1, dc_tp1, dH, dE)
 
-        dE += dE_2[:, 0, :]
+    def backward_checkpointed(self, aux, grads, (dx_tp1, dh_tp1, dc_tp1)):
+        """`backward_steps` of all decoder steps, recomputing the caches of one
+        segment of `checkpoint_every` steps at a time from its checkpoint. The
+        buffers of the segment go back to the workspace after its backward."""
+        H = aux['H']
+        E = aux['E']
+        dH = self.workspace.zeros(H.shape)
+        dE = None if isinstance(E, Ids) else self.workspace.zeros(E.shape)
 
-        return (dE, dx_tp1)
+        for k in reversed(range(len(aux['checkpoints']))):
+            start = k * self.checkpoint_every
+            end = min(start + self.checkpoint_every, aux['gen_n'])
+
+            mark = self.workspace.mark()
+            (x_t, h_tm1, c_tm1) = aux['checkpoints'][k]
+            gen_aux = []
+            for i in range(start, end):
+                ((y_t, h_tm1, c_tm1), aux_t) = self.forward_gen_step((x_t, h_tm1, c_tm1, H, E), no_print=True, clf_subset=aux['clf_subset'], shortlist=aux['shortlist'])
+                gen_aux.append(aux_t)
+                x_t = Ids(y_t.argmax(), self.n_tokens) if isinstance(x_t, Ids) else y_t
+
+            (dx_tp1, dh_tp1, dc_tp1, dH, dE) = self.backward_steps(gen_aux, grads[start:end], (dx_tp1, dh_tp1, dc_tp1), dH, dE)
+
+            # The state gradients may live in the buffers of the segment.
+            dx_tp1 = None if dx_tp1 is None else dx_tp1.copy()
+            dh_tp1 = dh_tp1.copy()
+            dc_tp1 = dc_tp1.copy()
+            self.workspace.release(mark)
+
+        return (dx_tp1, dh_tp1, dc_tp1, dH, dE)
 
     def zero_grads(self):
+        # Layers with sparse gradients (e.g. `Embeddings`) zero only the rows they accumulated to.
         for layer in self.param_layers:
-            layer.grads.zero()
+            layer.zero_grads()
 
     def update_params(self, lr):
         self.params.increment_by(self.grads, factor=-lr)
@@ -198,11 +331,7 @@ class NTON(ParametrizedBlock):
             layer.params.increment_by(layer.grads, factor=-lr)
 
     def decode(self, Y):
-        res = []
-        for i in range(len(Y)):
-            res.append(self.db.vocab.rev(Y[i].argmax()))
-
-        return res
+        return self.db.vocab.decode(Y.argmax(axis=1)[np.newaxis, :])[0]
 
     def prepare_data_signle(self, (q, a)):
         x_q = self.db.words_to_ids(q)
@@ -211,165 +340,247 @@ class NTON(ParametrizedBlock):
         return (x_q, x_a)
 
 
-def plot(losses, eval_index, (train_wers, train_accs), (test_wers, test_accs), plot_filename):
-    """Plot learning curve."""
-    pal = sbt.color_palette()
-    col1 = pal[0]
-    col2 = pal[2]
-    fig, ax1 = plt.subplots(linewidth=1)
-
-    plots = []
-    plot_labels = []
-    plots.append(ax1.plot(2**np.array(losses), '-', linewidth=1, color=col1)[0])
-    plot_labels.append('Perplexity')
-    #ax1.set_xlabel('Example')
-    #ax1.set_ylabel('Avg loss', color=col1)
-    #ax1.legend()
-
-    ax2 = ax1.twinx()
-
-    #plots.append(ax2.plot(eval_index, train_wers, 'o-', label='Train WER', markersize=2, linewidth=1)[0])
-    #plot_labels.append('Train WER')
-    #plots.append(ax2.plot(eval_index, train_accs, 'o-', label='Train Acc', markersize=2, linewidth=1)[0])
-    #plot_labels.append('Train Acc')
-    plots.append(ax2.plot(eval_index, test_wers, 'o-', label='Test WER', markersize=2, linewidth=1)[0])
-    plot_labels.append('Test WER')
-    plots.append(ax2.plot(eval_index, test_accs, 'o-', label='Test Acc', markersize=2, linewidth=1)[0])
-    plot_labels.append('Test Acc')
-
-    #ax2.legend()
-
-    fig.legend(plots, plot_labels, 'upper right')
-    #legend = plt.legend(loc='upper right')
-
-    #ax1.set_ylim([0.0, 1.0])
-
-    #ax2 = ax1.twinx()
-    #ax2.plot(m_ppx, '-o', linewidth=1, color=col2)
-    #ax2.set_ylabel('Perplexity', color=col2)
+def token_ids(x):
+    """Ids of the tokens in one-hot input `x` (dense or `Ids`)."""
+    if isinstance(x, Ids):
+        return x.ids.ravel()
 
-    plt.savefig(plot_filename)
+    return x.reshape((-1, x.shape[-1])).argmax(axis=1)
 
 
 def main(**kwargs):
     eval_step = kwargs.pop('eval_step')
+    sparse_input = kwargs.pop('sparse_input')
+    n_data_workers = kwargs.pop('n_data_workers')
+    train_shards = kwargs.pop('train_shards')
+    n_eval_examples = kwargs.pop('n_eval_examples')
+    task = dict(max_num=100, task_seed=kwargs.pop('task_seed'))
     np.set_printoptions(edgeitems=3,infstr='inf',
                         linewidth=200, nanstr='nan', precision=4,
                         suppress=False, threshold=1000, formatter={'float': lambda x: "%.1f" % x})
-    calc = DataCalc(max_num=100)
-    data_train = calc.gen_data(test_data=False)
-    data_test = calc.gen_data(test_data=True)
-
+    # The answer templates of DataCalc are drawn from its random state, so the task
+    # is given by max_num and task_seed (also for pre-generated shards).
+    calc = DataCalc(max_num=task['max_num'], random_state=np.random.RandomState(task['task_seed']))
     db = DB(calc.get_db(), calc.get_vocab())
     db.vocab.freeze()
 
-    #q = db.get_vector('1+3')
-    #a = db.vocab.rev(db.forward((q, ))[0][0].argmax())
-    #print a
-    emb = OneHot(n_tokens=len(db.vocab))
+    # The generators produce arrays of token ids directly; training examples are
+    # generated ahead of the trainer in background processes. The trainer takes
+    # one example at a time, so they are neither bucketed nor padded. The one-hot
+    # encoding (`emb.forward`) stays in the trainer: with --sparse_input it only
+    # wraps the ids, and dense one-hot matrices would cost more to send through
+    # the queues than to build.
+    prefetcher = None
+    if train_shards:
+        # Pre-generated examples (see data_shards.py), reshuffled in every epoch.
+        shards = ShardReader(train_shards)
+        assert shards.task() == task, 'Shards were generated for a different task: %s (expected %s).' % (shards.task(), task)
+        assert shards.vocab() in (None, [db.vocab.rev(i) for i in range(len(db.vocab))]), 'Shards have a different vocabulary.'
+        data_train = shards.examples(seed=0)
+    else:
+        prefetcher = Prefetcher(lambda random_state: calc.gen_data(test_data=False, vocab=db.vocab, random_state=random_state), n_workers=n_data_workers, batched=False)
+        data_train = prefetcher.examples()
+
+    try:
+        data_test = calc.gen_data(test_data=True, vocab=db.vocab)
+
+        shortlist = kwargs.pop('shortlist')
+        sampling_p = None
+        shortlist_ids = None
+        if kwargs['n_sampled'] or shortlist:
+            counts = token_counts(db, data_train, 1000)
+            if kwargs['n_sampled']:
+                sampling_p = counts
+            if shortlist:
+                shortlist_ids = np.sort(np.argsort(-counts, kind='mergesort')[:shortlist])
+
+        #q = db.get_vector('1+3')
+        #a = db.vocab.rev(db.forward((q, ))[0][0].argmax())
+        #print a
+        emb = OneHot(n_tokens=len(db.vocab), sparse=sparse_input)
+
+        nton = NTON(
+            n_tokens=len(db.vocab),
+            db=db,
+            emb=emb,
+            use_workspace=True,
+            sampling_p=sampling_p,
+            shortlist_ids=shortlist_ids,
+            **kwargs
+        )
 
-    nton = NTON(
-        n_tokens=len(db.vocab),
-        db=db,
-        emb=emb,
-        **kwargs
-    )
+        if kwargs['n_sampled'] or sparse_input:
+            # Only the sampled columns of the output layer and the rows of the input tokens
+            # of the LSTMs get gradients, so only they are updated (and zeroed by `zero_grads`).
+            update_rule = LazyAdam(nton.params, nton.grads, rows_fn=nton.grad_rows, axis_fn=nton.grad_axis)
+        else:
+            update_rule = Adam(nton.params, nton.grads)
+
+        eval_nton(nton, emb, db, 'prep_test', data_test, 1)
+
+        # Snapshots of the parameters are evaluated on a fixed held-out set in a
+        # background process, so the evaluation does not slow down the training.
+        test_examples = [next(data_test) for i in range(n_eval_examples)]
+        evaluator = BackgroundEvaluator(nton, lambda model: evaluate(model, emb, db, test_examples))
+        plot_writer = PlotWriter()  # The learning curve is drawn in a background process.
+
+        # data_train = [
+        #     ("i would like chinese food", "ok chong is good"),
+        #     ("what about indian", "ok taj is good"),
+        #     ("give me czech", "go to hospoda"),
+        #     ("i like english food", "go to tavern")
+        # ]
+
+        avg_loss = deque(maxlen=20)
+        losses = DecimatedHistory(max_len=1000)  # Bounded, so plotting costs the same at any time.
+        train_wers = []
+        train_accs = []
+        test_wers = []
+        test_accs = []
+        eval_index = []
+        for epoch in xrange(10000000):
+            x_q, x_a = next(data_train)
+
+            nton.zero_grads()
+
+            # Prepare input.
+            ((x_q_emb, ), _) = emb.forward((x_q, ))
+            ((symbol_dec, ), _) = emb.forward(([db.vocab['[EOS]']], ))
+            symbol_dec = symbol_dec[0]
+
+            ((Y, y), aux) = nton.forward((x_q_emb, symbol_dec), targets=x_a)
+            ((loss, ), loss_aux) = SeqLoss.forward((Y, np.array(list(x_a) + [-1] * (len(y) - len(x_a))), ))
+            (dY, ) = SeqLoss.backward(loss_aux, 1.0)
+
+            nton.backward(aux, (dY, None ))
+            #nton.update_params(lr=0.1)
+            update_rule.update()
+
+            avg_loss.append(loss)
+
+            #x_a_hat_str = " ".join(nton.decode(Y))
+            x_a_hat_str = " ".join(db.vocab.rev(x) for x in y)
+            x_a_str = " ".join(db.vocab.rev(x) for x in x_a)
+
+            mean_loss = np.mean(avg_loss)
+            losses.add(mean_loss)
+
+            nton.print_step('loss',
+                            'loss %.4f' % mean_loss,
+                            'example %d' % epoch,
+                            "%s" % Y[np.arange(min(len(x_a), len(Y))), x_a[:min(len(x_a), len(Y))]],
+                            " ".join([db.vocab.rev(x) for x in x_q]), '->', x_a_hat_str,
+                            "(%s)" % x_a_str,
+                            "%s" % ("*" if x_a_str == x_a_hat_str else "")
+            )
+            print
+
+            if epoch % eval_step == 0 and epoch > 0:
+                #train_wer, train_acc = eval_nton(nton, emb, db, 'train', data_train, 200)
+                evaluator.submit(epoch)  # Skipped if the evaluator is behind.
+
+            for step, res in evaluator.results():
+                print_metrics('test@%d' % step, res)
+                if 'exact_wer' in res:
+                    print_metrics('test-exact@%d' % step, dict((key[len('exact_'):], val) for key, val in res.items() if key.startswith('exact_')))
+
+                #train_wers.append(train_wer)
+                #train_accs.append(train_acc)
+                test_wers.append(res['wer'])
+                test_accs.append(res['acc'])
+                eval_index.append(step)
+
+            if epoch % 100 == 0:
+                plot_writer.update(losses.points(), eval_index, (train_wers, train_accs), (test_wers, test_accs), 'lcurve.png')
+    finally:
+        if prefetcher is not None:
+            prefetcher.close()
+
+
+def token_counts(db, data, n_examples):
+    """Add-one smoothed counts of the tokens in `n_examples` (question, answer) pairs
+    of token ids from `data`."""
+    res = np.ones((len(db.vocab), ))
+    for i in xrange(n_examples):
+        x_q, x_a = next(data)
+        res += np.bincount(np.concatenate([x_q, x_a]), minlength=len(res))
 
-    update_rule = Adam(nton.params, nton.grads)
+    return res
 
-    eval_nton(nton, emb, db, 'prep_test', data_test, 1)
 
-    # data_train = [
-    #     ("i would like chinese food", "ok chong is good"),
-    #     ("what about indian", "ok taj is good"),
-    #     ("give me czech", "go to hospoda"),
-    #     ("i like english food", "go to tavern")
-    # ]
+def decode_answers(nton, emb, db, questions):
+    """Answers (arrays of token ids without [EOS]) decoded by `nton` for the
+    questions (arrays of token ids)."""
+    ((symbol_dec, ), _) = emb.forward(([db.vocab['[EOS]']], ))
+    symbol_dec = symbol_dec[0]
 
-    avg_loss = deque(maxlen=20)
-    losses = []
-    train_wers = []
-    train_accs = []
-    test_wers = []
-    test_accs = []
-    eval_index = []
-    for epoch in xrange(10000000):
-        x_q, x_a = nton.prepare_data_signle(next(data_train))
+    hyps = []
+    for x_q in questions:
+        ((x_q_emb, ), _) = emb.forward((x_q, ))
+        ((Y, y), aux) = nton.forward((x_q_emb, symbol_dec))
 
-        nton.zero_grads()
+        if 0 in y:
+            y = y[:np.where(y == 0)[0][0]]
 
-        # Prepare input.
-        ((x_q_emb, ), _) = emb.forward((x_q, ))
-        ((symbol_dec, ), _) = emb.forward(([db.vocab['[EOS]']], ))
-        symbol_dec = symbol_dec[0]
+        hyps.append(y)
 
-        ((Y, y), aux) = nton.forward((x_q_emb, symbol_dec))
-        ((loss, ), loss_aux) = SeqLoss.forward((Y, np.array(list(x_a) + [-1] * (len(y) - len(x_a))), ))
-        (dY, ) = SeqLoss.backward(loss_aux, 1.0)
+    return hyps
 
-        nton.backward(aux, (dY, None ))
-        #nton.update_params(lr=0.1)
-        update_rule.update()
 
-        avg_loss.append(loss)
+def eval_metrics(refs, hyps):
+    """Mean WER, accuracy, PER and corpus BLEU of the hypotheses."""
+    return dict(
+        wer=np.mean(metrics.calculate_wers(refs, hyps)),
+        acc=np.mean(metrics.accuracies(refs, hyps)),
+        per=np.mean(metrics.pers(refs, hyps)),
+        bleu=metrics.corpus_bleu(refs, hyps, smoothing='exp'),
+    )
 
-        #x_a_hat_str = " ".join(nton.decode(Y))
-        x_a_hat_str = " ".join(db.vocab.rev(x) for x in y)
-        x_a_str = " ".join(db.vocab.rev(x) for x in x_a)
 
-        mean_loss = np.mean(avg_loss)
-        losses.append(mean_loss)
+def evaluate(nton, emb, db, examples):
+    """Metrics (see `eval_metrics`) of `nton` on the (x_q, x_a) examples. With a
+    shortlist, also of exact decoding (keys prefixed with 'exact_') to measure
+    what the shortlist costs."""
+    refs = [x_a for _, x_a in examples]
+    res = eval_metrics(refs, decode_answers(nton, emb, db, [x_q for x_q, _ in examples]))
 
-        nton.print_step('loss',
-                        'loss %.4f' % mean_loss,
-                        'example %d' % epoch,
-                        "%s" % Y[np.arange(min(len(x_a), len(Y))), x_a[:min(len(x_a), len(Y))]],
-                        " ".join([db.vocab.rev(x) for x in x_q]), '->', x_a_hat_str,
-                        "(%s)" % x_a_str,
-                        "%s" % ("*" if x_a_str == x_a_hat_str else "")
-        )
-        print
+    if nton.shortlist_ids is not None:
+        shortlist_ids, nton.shortlist_ids = nton.shortlist_ids, None
+        try:
+            exact = eval_metrics(refs, decode_answers(nton, emb, db, [x_q for x_q, _ in examples]))
+        finally:
+            nton.shortlist_ids = shortlist_ids
+
+        res.update(('exact_%s' % key, val) for key, val in exact.items())
 
-        if epoch % eval_step == 0 and epoch > 0:
-            #train_wer, train_acc = eval_nton(nton, emb, db, 'train', data_train, 200)
-            test_wer, test_acc = eval_nton(nton, emb, db, 'test', data_test, 30)
+    return res
 
-            #train_wers.append(train_wer)
-            #train_accs.append(train_acc)
-            test_wers.append(test_wer)
-            test_accs.append(test_acc)
-            eval_index.append(epoch)
 
-        if epoch % 100 == 0:
-            plot(losses, eval_index, (train_wers, train_accs), (test_wers, test_accs), 'lcurve.png')
+def print_metrics(data_label, res):
+    print '### Evaluation(%s): ' % data_label,
+    print '  %15.15s %.2f' % ("WER:", res['wer']),
+    print '  %15.15s %.2f' % ("Accuracy:", res['acc']),
+    print '  %15.15s %.2f' % ("PER:", res['per']),
+    print '  %15.15s %.2f' % ("BLEU:", res['bleu']),
+    print
 
 
 def eval_nton(nton, emb, db, data_label, data, n_examples):
     print '### Evaluation(%s): ' % data_label
-    wers = []
-    acc = []
+    refs = []
+    hyps = []
     for i in xrange(n_examples):
-        x_q, x_a = nton.prepare_data_signle(next(data))
-        ((x_q_emb, ), _) = emb.forward((x_q, ))
-        ((symbol_dec, ), _) = emb.forward(([db.vocab['[EOS]']], ))
-        symbol_dec = symbol_dec[0]
+        x_q, x_a = next(data)
         print "Q:", " ".join([db.vocab.rev(x) for x in x_q])
         print "A:", " ".join([db.vocab.rev(x) for x in x_a])
-        ((Y, y), aux) = nton.forward((x_q_emb, symbol_dec))
-
-        if 0 in y:
-            y = y[:np.where(y == 0)[0][0]]
-
-        wers.append(metrics.calculate_wer(x_a, y))
-        acc.append(metrics.accuracy(x_a, y))
 
-    print '### Evaluation(%s): ' % data_label,
-    print '  %15.15s %.2f' % ("WER:", np.mean(wers)),
-    print '  %15.15s %.2f' % ("Accuracy:", np.mean(acc)),
-    print
+        refs.append(x_a)
+        hyps.extend(decode_answers(nton, emb, db, [x_q]))
 
-    return np.mean(wers), np.mean(acc)
+    res = eval_metrics(refs, hyps)
+    print_metrics(data_label, res)
 
+    return res['wer'], res['acc']
 
 
 if __name__ == '__main__':
@@ -380,6 +591,14 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('--n_cells', type=int, default=50)
     parser.add_argument('--eval_step', type=int, default=1000)
+    parser.add_argument('--n_eval_examples', type=int, default=1000, help='Size of the held-out set evaluated in the background.')
+    parser.add_argument('--n_sampled', type=int, default=0, help='Train the output layer with sampled softmax with this many negatives (0 = full softmax).')
+    parser.add_argument('--shortlist', type=int, default=0, help='Decode with a shortlist of this many most frequent tokens (0 = score all tokens).')
+    parser.add_argument('--n_data_workers', type=int, default=2, help='Number of processes preparing the training data.')
+    parser.add_argument('--train_shards', default=None, help='Train on examples pre-generated by data_shards.py into this directory.')
+    parser.add_argument('--task_seed', type=int, default=0, help='Seed of the task (answer templates of DataCalc); shards must be generated with the same one.')
+    parser.add_argument('--sparse_input', action='store_true', help='Feed one-hot inputs as token ids (decoder gets the decoded token).')
+    parser.add_argument('--checkpoint_every', type=int, default=0, help='Keep the decoder state only every this many steps and recompute the rest in backward (0 = keep all caches).')
     #parser.add_argument('--n_words', type=int, default=100)
     #parser.add_argument('--n_db', type=int, default=10)
 
@@ -394,6 +613,6 @@ if __name__ == '__main__':
 #    - more db lookups needed per query
 #    - larger db
 #  x Adding Adam learning rule.
-#  - Evaluation
-#    - BLEU, WER, PER.
+#  x Evaluation
+#    x BLEU, WER, PER.
 #  x Add gradient checks for NTON.
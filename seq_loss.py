@@ -1,31 +1,48 @@
 import numpy as np
 
-from nn import Block, Vars
+from nn import Block, aux_record
+
+
+SeqLossAux = aux_record('SeqLossAux', 'y_hat y_true grad')
+SoftmaxSeqLossAux = aux_record('SoftmaxSeqLossAux', 'grad')
+
+
+def targets(y_hat, y_true):
+    """Flatten the (possibly batched and padded) outputs for the loss.
+
+    `y_hat` is (..., n_classes) and `y_true` has the shape of `y_hat` without
+    the last axis; the positions with y_true == -1 are padding. Returns
+    (y_hat as 2D, row indices of the non-padded positions, their labels, number
+    of positions the loss is averaged over)."""
+    y_true = np.asarray(y_true)
+    assert y_hat.shape[:-1] == y_true.shape, 'Outputs do not match.'
+
+    y_hat2d = y_hat.reshape((-1, y_hat.shape[-1]))
+    y_true = y_true.ravel()
+    rows = np.nonzero(y_true != -1)[0]
+
+    return y_hat2d, rows, y_true[rows], max(len(y_true), 1)
 
 
 class SeqLoss(Block):
+    """Mean negative log likelihood of labels `y_true` under probabilities `y_hat`.
+    Works on whole (padded) batches at once, see `targets`."""
     #epsilon = 1e-7
 
     @classmethod
     def forward(self, (y_hat, y_true)):
-        assert len(y_hat) == len(y_true), 'Outputs do not match.'
-
-        res = 0.0
-        grad = np.zeros_like(y_hat)
-        for i, (yi_hat, yi_true) in enumerate(zip(y_hat, y_true)):
-            if yi_true == -1:
-                continue
+        y_hat2d, rows, labels, n = targets(y_hat, y_true)
 
-            res += - np.log(yi_hat[yi_true])
-            grad[i, yi_true] = - 1.0 / (yi_hat[yi_true])
+        p = y_hat2d[rows, labels]
+        res = - np.log(p).sum() / n
 
-        res /= len(y_hat)
-        grad /= len(y_hat)
+        grad = np.zeros_like(y_hat2d)
+        grad[rows, labels] = - 1.0 / p / n
 
-        aux = Vars(
+        aux = SeqLossAux(
             y_hat=y_hat,
             y_true=y_true,
-            grad=grad
+            grad=grad.reshape(y_hat.shape)
         )
 
         return ((res, ), aux)
@@ -35,4 +52,36 @@ class SeqLoss(Block):
         return (aux['grad'] * dy, )
 
 
+class SoftmaxSeqLoss(Block):
+    """Softmax followed by `SeqLoss` fused into one block.
+
+    Takes unnormalized scores (logits) instead of probabilities. The loss is
+    computed from log-softmax (logsumexp of the shifted scores), so it does not
+    overflow for confident outputs, and the gradient is directly
+    softmax - onehot, without going through 1 / p and the softmax Jacobian."""
+    @classmethod
+    def forward(self, (x, y_true)):
+        x2d, rows, labels, n = targets(x, y_true)
+
+        shifted = x2d - x2d.max(axis=1, keepdims=True)
+        p = np.exp(shifted)
+        s = p.sum(axis=1, keepdims=True)
+        p /= s
+
+        # log p[label] = shifted[label] - log(sum(exp(shifted)))
+        res = (np.log(s[rows, 0]) - shifted[rows, labels]).sum() / n
+
+        grad = np.zeros_like(x2d)
+        grad[rows] = p[rows]
+        grad[rows, labels] -= 1.0
+        grad /= n
+
+        aux = SoftmaxSeqLossAux(
+            grad=grad.reshape(x.shape)
+        )
+
+        return ((res, ), aux)
 
+    @classmethod
+    def backward(self, aux, dy):
+        return (aux['grad'] * dy, )
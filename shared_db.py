@@ -0,0 +1,159 @@
+"""
+Read-only database and vocabulary shared by many worker processes.
+
+`publish` writes the arrays of a built `DB` (and of its vocabulary) as flat
+.npy files into a directory. `SharedDB` attaches to such a directory with
+`np.load(mmap_mode='r')`, so all processes on a machine share the same
+pages of the OS page cache and nothing is copied or pickled when a worker
+starts.
+
+Layout of the published directory:
+  vocab_bytes, vocab_offsets   -- words concatenated, word i is
+                                  vocab_bytes[vocab_offsets[i]:vocab_offsets[i + 1]]
+  vocab_hash, vocab_hash_ids   -- sorted 64-bit hashes of words and their ids
+  fwd_indptr, fwd_indices      -- map of the fast lookup in CSR form (key -> results)
+  rev_indptr, rev_indices      -- its reverse in CSR form (result -> keys)
+  keys, results                -- ids of the key and the result of each fact
+"""
+import hashlib
+import os
+
+import numpy as np
+
+from db import DB
+from lazy_seq import LazySeq
+
+
+ARRAY_NAMES = [
+    'vocab_bytes', 'vocab_offsets', 'vocab_hash', 'vocab_hash_ids',
+    'fwd_indptr', 'fwd_indices', 'rev_indptr', 'rev_indices',
+    'keys', 'results',
+]
+
+
+def _to_bytes(word):
+    if isinstance(word, unicode):
+        return word.encode('utf-8')
+    return word
+
+
+def word_hash(word):
+    """Stable (across processes and runs) 64-bit hash of the word."""
+    return np.frombuffer(hashlib.md5(_to_bytes(word)).digest()[:8], dtype=np.int64)[0]
+
+
+def publish(db, path):
+    """Write the arrays of `db` and its vocabulary into directory `path`."""
+    if not os.path.exists(path):
+        os.makedirs(path)
+
+    n = len(db.vocab)
+    words = [_to_bytes(db.vocab.rev(i)) for i in range(n)]
+
+    vocab_offsets = np.zeros((n + 1, ), dtype=np.int64)
+    vocab_offsets[1:] = np.cumsum([len(word) for word in words])
+    vocab_bytes = np.frombuffer("".join(words), dtype=np.uint8)
+
+    hashes = np.array([word_hash(word) for word in words], dtype=np.int64)
+    hash_order = np.argsort(hashes, kind='mergesort')
+
+    arrays = dict(
+        vocab_bytes=vocab_bytes,
+        vocab_offsets=vocab_offsets,
+        vocab_hash=hashes[hash_order],
+        vocab_hash_ids=hash_order.astype(np.int64),
+        fwd_indptr=db.fwd_indptr,
+        fwd_indices=db.fwd_indices,
+        rev_indptr=db.rev_indptr,
+        rev_indices=db.rev_indices,
+        keys=db.keys,
+        results=db.results,
+    )
+    for name in ARRAY_NAMES:
+        np.save(os.path.join(path, '%s.npy' % name), arrays[name])
+
+
+def attach(path):
+    """Memory-map all published arrays from directory `path` (read-only)."""
+    return dict((name, np.load(os.path.join(path, '%s.npy' % name), mmap_mode='r')) for name in ARRAY_NAMES)
+
+
+class SharedVocab(object):
+    """Read-only vocabulary backed by memory-mapped arrays.
+    Behaves as a frozen `Vocab`."""
+    frozen = True
+
+    def __init__(self, arrays):
+        self._bytes = arrays['vocab_bytes']
+        self._offsets = arrays['vocab_offsets']
+        self._hash = arrays['vocab_hash']
+        self._hash_ids = arrays['vocab_hash_ids']
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self.rev(i)
+
+    def __contains__(self, word):
+        return self._find(word) is not None
+
+    def __getitem__(self, word):
+        res = self._find(word)
+        if res is None:
+            raise KeyError(word)
+
+        return res
+
+    def _find(self, word):
+        word = _to_bytes(word)
+        h = word_hash(word)
+        lo = np.searchsorted(self._hash, h, side='left')
+        hi = np.searchsorted(self._hash, h, side='right')
+        for i in range(lo, hi):  # More than one candidate only on hash collision.
+            word_id = int(self._hash_ids[i])
+            if self.rev(word_id) == word:
+                return word_id
+
+        return None
+
+    def freeze(self):
+        pass
+
+    def add(self, word):
+        return self[word]
+
+    def add_words(self, words):
+        return np.array([self[word] for word in words], dtype=int)
+
+    def rev(self, word_id):
+        return self._bytes[self._offsets[word_id]:self._offsets[word_id + 1]].tostring()
+
+
+class SharedDB(DB):
+    """`DB` attached to arrays published by `publish`.
+    Nothing is built in the constructor, the process only maps the files."""
+    def __init__(self, path, impl='fast'):
+        arrays = attach(path)
+
+        self.vocab = SharedVocab(arrays)
+
+        self.fwd_indptr = arrays['fwd_indptr']
+        self.fwd_indices = arrays['fwd_indices']
+        self.rev_indptr = arrays['rev_indptr']
+        self.rev_indices = arrays['rev_indices']
+
+        self.keys = arrays['keys']
+        self.results = arrays['results']
+
+        # The (key, result) word pairs, decoded from the fact arrays on access.
+        self.content = LazySeq(len(self.keys), self._fact)
+
+        self._entries_a = None  # Built from the facts on first use.
+        self._entries_c = None
+
+        self.set_impl(impl)
+
+    def _fact(self, i):
+        return (self.vocab.rev(self.keys[i]), self.vocab.rev(self.results[i]))
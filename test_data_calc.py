@@ -1,6 +1,10 @@
 import unittest
+import numpy as np
 
 from data_calc import DataCalc
+from data_calc2 import DataCalc2
+from db import DB
+from db2 import DB2
 
 
 class TestDataCalc(unittest.TestCase):
@@ -23,6 +27,45 @@ class TestDataCalc(unittest.TestCase):
             print "A:", " ".join(a)
             print
 
+    def test_ids(self):
+        for calc_cls, db_cls in [(DataCalc, DB), (DataCalc2, DB2)]:
+            d = calc_cls(percent_qa=0.3)
+            db = db_cls(d.get_db(), d.get_vocab())
+
+            np.random.seed(2)
+            words = d.gen_data(test_data=True)
+            words = [next(words) for i in range(50)]
+
+            np.random.seed(2)
+            ids = d.gen_data(test_data=True, vocab=db.vocab)
+            ids = [next(ids) for i in range(50)]
+
+            for (q, a), (x_q, x_a) in zip(words, ids):
+                self.assertEqual(list(db.words_to_ids(q)), list(x_q))
+                self.assertEqual(list(db.words_to_ids(a)), list(x_a))
+                self.assertEqual(a[-1], '[EOS]')
+
+    def test_vocab_and_facts(self):
+        for calc_cls in [DataCalc, DataCalc2]:
+            d = calc_cls(n_words=10, max_num=7)
+            vocab = list(d.get_vocab())
+            facts = list(d.get_db())
+
+            self.assertEqual(len(set(vocab)), len(vocab))
+            self.assertEqual(vocab, [d.get_vocab()[i] for i in range(len(vocab))])
+            self.assertEqual(facts, [d.get_db()[i] for i in range(len(facts))])
+            self.assertEqual(len(facts), 7 * 7)
+            for fact in facts:
+                self.assertTrue(all(word in vocab for word in fact))
+
+        d = DataCalc(n_words=10, max_num=7)
+        self.assertEqual(d._word(d._q_pos(3, 5)), '3+5')
+        self.assertEqual(d._word(d._a_pos(3, 5)), '8')
+        self.assertEqual(d._word(d._eos_pos()), '[EOS]')
+
+        d = DataCalc2(n_words=10, max_num=7)
+        self.assertEqual(d._word(d._num_pos(12)), '12')
+        self.assertEqual(d._word(d._eos_pos()), '[EOS]')
 
 
 if __name__ == '__main__':
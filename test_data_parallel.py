@@ -0,0 +1,56 @@
+import unittest
+import numpy as np
+
+from data_calc import DataCalc
+from data_calc2 import DataCalc2
+from data_parallel import stream_random_state, gen_examples
+from db import DB
+
+
+class TestDataParallel(unittest.TestCase):
+    def setUp(self):
+        self.calc = DataCalc(max_num=5, n_words=20, percent_qa=0.2, random_state=np.random.RandomState(0))
+        self.db = DB(self.calc.get_db(), self.calc.get_vocab())
+
+    def make_data(self, random_state):
+        return self.calc.gen_data(vocab=self.db.vocab, random_state=random_state)
+
+    def assertSameExamples(self, examples1, examples2):
+        self.assertEqual(len(examples1), len(examples2))
+        for (q1, a1), (q2, a2) in zip(examples1, examples2):
+            self.assertEqual(list(q1), list(q2))
+            self.assertEqual(list(a1), list(a2))
+
+    def test_streams(self):
+        self.assertEqual(stream_random_state(3, 1).randint(1 << 30, size=5).tolist(), stream_random_state(3, 1).randint(1 << 30, size=5).tolist())
+        self.assertNotEqual(stream_random_state(0, 1).randint(1 << 30, size=5).tolist(), stream_random_state(1, 0).randint(1 << 30, size=5).tolist())
+
+    def test_reproducible(self):
+        state = np.random.get_state()[1].copy()
+        serial = gen_examples(self.make_data, 95, seed=3, n_workers=1, chunk_size=10)
+        parallel = gen_examples(self.make_data, 95, seed=3, n_workers=3, chunk_size=10)
+
+        self.assertSameExamples(serial, parallel)
+        self.assertTrue((np.random.get_state()[1] == state).all())  # The global state is not used.
+
+        # Chunk k is the beginning of stream k.
+        data = self.make_data(stream_random_state(3, 9))
+        self.assertSameExamples(serial[90:], [next(data) for i in range(5)])
+
+        other = gen_examples(self.make_data, 95, seed=4, n_workers=3, chunk_size=10)
+        self.assertNotEqual([list(q) for q, _ in other], [list(q) for q, _ in serial])
+
+    def test_explicit_random_state(self):
+        for calc_cls in [DataCalc, DataCalc2]:
+            calc1 = calc_cls(random_state=np.random.RandomState(1))
+            calc2 = calc_cls(random_state=np.random.RandomState(1))
+            self.assertEqual(calc1.a_tpls, calc2.a_tpls)
+
+            data1 = calc1.gen_data()
+            data2 = calc2.gen_data()
+            for i in range(20):
+                self.assertEqual(next(data1), next(data2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import unittest
+import numpy as np
+
+from data_calc import DataCalc
+from db import DB
+from data_parallel import stream_random_state
+from data_pipeline import Prefetcher, make_batch, unbatch, bucketed_batches, BucketBatchSampler, pack_sequences
+
+
+class TestDataPipeline(unittest.TestCase):
+    def setUp(self):
+        self.calc = DataCalc(max_num=5, n_words=20)
+        self.db = DB(self.calc.get_db(), self.calc.get_vocab())
+
+    def make_data(self, random_state=None):
+        return self.calc.gen_data(vocab=self.db.vocab, random_state=random_state)
+
+    def test_make_batch(self):
+        examples = [(np.array([1, 2, 3]), np.array([4])), (np.array([5]), np.array([6, 7]))]
+
+        batch = make_batch(examples)
+
+        self.assertEqual(batch.q.tolist(), [[1, 2, 3], [5, -1, -1]])
+        self.assertEqual(batch.a.tolist(), [[4, -1], [6, 7]])
+        for (x_q, x_a), (exp_q, exp_a) in zip(unbatch(batch), examples):
+            self.assertEqual(list(x_q), list(exp_q))
+            self.assertEqual(list(x_a), list(exp_a))
+
+    def test_buckets(self):
+        batches = bucketed_batches(self.make_data(), batch_size=4, n_bucket_batches=5)
+        batches = [next(batches) for i in range(5)]
+
+        # Batches of one bucket do not overlap in question lengths.
+        ranges = sorted((b.q_lens.min(), b.q_lens.max()) for b in batches)
+        for (lo1, hi1), (lo2, hi2) in zip(ranges, ranges[1:]):
+            self.assertTrue(hi1 <= lo2)
+
+    def test_deterministic(self):
+        res = []
+        for i in range(2):
+            with Prefetcher(self.make_data, n_workers=3, batch_size=4, seed=7) as prefetcher:
+                res.append([next(prefetcher) for k in range(12)])
+
+        for b1, b2 in zip(*res):
+            self.assertEqual(b1.q.tolist(), b2.q.tolist())
+            self.assertEqual(b1.a.tolist(), b2.a.tolist())
+
+        # Workers have different seeds.
+        self.assertNotEqual(res[0][0].q.tolist(), res[0][1].q.tolist())
+
+    def test_examples(self):
+        with Prefetcher(self.make_data, n_workers=2, batch_size=3) as prefetcher:
+            examples = prefetcher.examples()
+            for i in range(10):
+                x_q, x_a = next(examples)
+                self.assertTrue((x_q >= 0).all() and (x_a >= 0).all())
+                self.assertEqual(x_a[-1], self.db.vocab['[EOS]'])
+
+    def test_unbatched(self):
+        with Prefetcher(self.make_data, n_workers=2, batch_size=3, seed=5, batched=False) as prefetcher:
+            examples = prefetcher.examples()
+            res = [next(examples) for i in range(6)]
+
+        # Batches of the workers in turn, each in the order of the worker's stream.
+        for worker_id, batch in [(0, res[:3]), (1, res[3:])]:
+            data = self.make_data(stream_random_state(5, worker_id))
+            for x_q, x_a in batch:
+                exp_q, exp_a = next(data)
+                self.assertEqual(list(x_q), list(exp_q))
+                self.assertEqual(list(x_a), list(exp_a))
+
+
+class TestBuckets(unittest.TestCase):
+    def test_bucket_batch_sampler(self):
+        lengths = np.random.randint(1, 12, size=100)
+        sampler = BucketBatchSampler(lengths, boundaries=[3, 6, 9], batch_size=8, seed=1)
+
+        for epoch in range(2):
+            seen = []
+            for batch in sampler:
+                self.assertTrue(len(batch) <= 8)
+                self.assertEqual(len(set(np.searchsorted([3, 6, 9], lengths[batch], side='right'))), 1)
+                seen.extend(batch)
+
+            self.assertEqual(sorted(seen), range(100))
+
+    def test_pack_sequences(self):
+        seqs = [[1, 2, 3], [4], [5, 6], [7, 8, 9, 10], [11]]
+
+        packed = pack_sequences(seqs, max_len=5)
+
+        self.assertEqual(packed.tokens.shape, (3, 5))
+        for k, seq in enumerate(seqs):
+            row = np.nonzero((packed.segments == k).any(axis=1))[0][0]
+            self.assertEqual(list(packed.tokens[row][packed.segments[row] == k]), seq)
+            self.assertTrue(packed.resets[row][packed.segments[row] == k][0])
+            self.assertEqual(packed.resets[row][packed.segments[row] == k].sum(), 1)
+
+        self.assertEqual((packed.segments == -1).sum(), packed.tokens.size - 11)
+        self.assertTrue((packed.tokens[packed.segments == -1] == -1).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from data_calc import DataCalc
+from db import DB
+from data_parallel import stream_random_state
+from data_shards import write_shards, ShardReader, pack, main
+
+
+class TestDataShards(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+        self.calc = DataCalc(max_num=5, n_words=20)
+        self.db = DB(self.calc.get_db(), self.calc.get_vocab())
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def make_data(self, random_state=None):
+        return self.calc.gen_data(vocab=self.db.vocab, random_state=random_state)
+
+    def test_pack(self):
+        tokens, offsets = pack([[1, 2], [], [3]])
+
+        self.assertEqual(tokens.dtype, np.int32)
+        self.assertEqual(list(tokens), [1, 2, 3])
+        self.assertEqual(list(offsets), [0, 2, 2, 3])
+
+    def test_write_read(self):
+        write_shards(self.make_data, 50, self.path, n_shards=3, n_workers=2, seed=4)
+
+        reader = ShardReader(self.path)
+        self.assertEqual(len(reader), 50)
+        self.assertEqual(len(reader.shards), 3)
+
+        # Shard k is generated from stream k of the seed.
+        data = self.make_data(stream_random_state(4, 1))
+        for i in range(17, 34):
+            x_q, x_a = next(data)
+            self.assertEqual(list(reader[i][0]), list(x_q))
+            self.assertEqual(list(reader[i][1]), list(x_a))
+
+    def test_examples(self):
+        write_shards(self.make_data, 20, self.path, n_shards=2, seed=0)
+        reader = ShardReader(self.path)
+
+        examples = list(reader.examples(n_epochs=2, seed=1))
+        self.assertEqual(len(examples), 40)
+
+        all_q = sorted(tuple(reader[i][0]) for i in range(20))
+        for epoch in [examples[:20], examples[20:]]:
+            self.assertEqual(sorted(tuple(x_q) for x_q, _ in epoch), all_q)
+
+        self.assertEqual([list(x_q) for x_q, _ in examples], [list(x_q) for x_q, _ in reader.examples(n_epochs=2, seed=1)])
+
+    def test_batches(self):
+        write_shards(self.make_data, 30, self.path, n_shards=2, seed=0)
+        reader = ShardReader(self.path)
+
+        batches = list(reader.batches(batch_size=8, n_epochs=1))
+
+        batch = reader.take([3, 25, 0])
+        for k, i in enumerate([3, 25, 0]):
+            x_q, x_a = reader[i]
+            self.assertEqual(list(batch.q[k, :batch.q_lens[k]]), list(x_q))
+            self.assertEqual(list(batch.a[k, :batch.a_lens[k]]), list(x_a))
+            self.assertTrue((batch.q[k, batch.q_lens[k]:] == -1).all())
+
+        self.assertEqual(sum(len(batch.q) for batch in batches), 30)
+        ranges = sorted((b.q_lens.min(), b.q_lens.max()) for b in batches)
+        for (lo1, hi1), (lo2, hi2) in zip(ranges, ranges[1:]):
+            self.assertTrue(hi1 <= lo2)
+
+    def test_main(self):
+        main(self.path, 10, n_shards=2, n_workers=2, max_num=5, test_data=False, seed=1, task_seed=3)
+        reader = ShardReader(self.path)
+
+        self.assertEqual(reader.task(), dict(max_num=5, task_seed=3))
+        calc = DataCalc(max_num=5, random_state=np.random.RandomState(3))
+        self.assertEqual(reader.vocab(), ['[EOS]'] + list(calc.get_vocab()))
+
+
+if __name__ == '__main__':
+    unittest.main()
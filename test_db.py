@@ -37,6 +37,19 @@ class TestDB(TestCase):
         self.assertEqual(db.vocab.rev(db.forward((db.get_vector('4+0'), ))[0][0].argmax()), '4')
 
 
+    def test_maps(self):
+        db = DB(self.content + [('chinese', 'chong')], self.vocab)
+        chinese, chong, taj = db.vocab['chinese'], db.vocab['chong'], db.vocab['taj']
+
+        self.assertEqual(list(db.fwd_indices[db.fwd_indptr[chinese]:db.fwd_indptr[chinese + 1]]), [chong])
+        self.assertEqual(list(db.rev_indices[db.rev_indptr[chong]:db.rev_indptr[chong + 1]]), [chinese, chong])
+        self.assertEqual(db.fwd_indptr[taj + 1] - db.fwd_indptr[taj], 1)  # Only itself.
+
+        self.assertIsNone(db._entries_a)  # The dense entries are built only when needed.
+        self.assertEqual(db.entries_a.shape, (5, len(db.vocab)))
+        self.assertEqual(list(np.flatnonzero(db.entries_a[0])), [chinese, chong])
+        self.assertEqual(list(np.flatnonzero(db.entries_c[0])), [chong])
+
     def test_backward(self):
         db = DB(self.content, self.vocab, impl='normal')
         db_fast = DB(self.content, self.vocab, impl='fast')
@@ -0,0 +1,34 @@
+from unittest import TestCase, main
+import numpy as np
+
+from db import DB
+from db_sharded import ShardedDB
+from data_calc import DataCalc
+
+
+class TestShardedDB(TestCase):
+    def test_same_as_db(self):
+        data = DataCalc(max_num=10)
+        db = DB(data.get_db(), data.get_vocab(), impl='fast')
+
+        for n_shards in [1, 3]:
+            with ShardedDB(data.get_db(), data.get_vocab(), n_shards=n_shards) as sdb:
+                self.assertEqual(sdb.vocab.rev(sdb.forward((sdb.get_vector('5+3'), ))[0][0].argmax()), '8')
+
+                for i in range(20):
+                    x = np.random.randn(len(db.vocab))
+                    if i % 2:
+                        x[np.random.rand(len(x)) < 0.9] = 0.0  # Sparse queries, as from attention over one-hot inputs.
+
+                    ((y1, ), aux1) = db.forward((x, ))
+                    ((y2, ), aux2) = sdb.forward((x, ))
+                    self.assertTrue(np.array_equal(y1, y2))
+
+                    dy = np.random.randn(*y1.shape)
+                    (dx1, ) = db.backward(aux1, (dy, ))
+                    (dx2, ) = sdb.backward(aux2, (dy, ))
+                    self.assertTrue(np.array_equal(dx1, dx2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+import unittest
+import numpy as np
+
+from evaluator import BackgroundEvaluator
+from nn import LinearLayer
+
+
+def _sum_params(model):
+    return model.params.flat.sum()
+
+
+class TestBackgroundEvaluator(unittest.TestCase):
+    def setUp(self):
+        self.model = LinearLayer(n_in=3, n_out=4)
+        self.model.flatten()
+
+    def test_snapshots(self):
+        with BackgroundEvaluator(self.model, _sum_params) as evaluator:
+            expected = []
+            for step in range(5):
+                self.model.params.flat[:] = np.random.randn(self.model.params.flat.size)
+                if evaluator.submit(step):
+                    expected.append((step, self.model.params.flat.sum()))
+
+                self.model.params.flat[:] = 0.0  # Training goes on; the snapshot is not affected.
+
+            res = evaluator.results(wait=True)
+
+        self.assertEqual([step for step, _ in res], [step for step, _ in expected])
+        for (_, val), (_, exp_val) in zip(res, expected):
+            self.assertAlmostEqual(val, exp_val)
+
+    def test_not_blocking(self):
+        with BackgroundEvaluator(self.model, _sum_params) as evaluator:
+            self.assertEqual(evaluator.results(), [])
+            evaluator.submit(0)
+            self.assertEqual(len(evaluator.results(wait=True)), 1)
+            self.assertEqual(evaluator.results(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,20 @@
+from unittest import TestCase, main
+
+from lazy_seq import LazySeq
+
+
+class TestLazySeq(TestCase):
+    def test_seq(self):
+        seq = LazySeq(4, lambda i: i * i)
+
+        self.assertEqual(len(seq), 4)
+        self.assertEqual(list(seq), [0, 1, 4, 9])
+        self.assertEqual(list(seq), [0, 1, 4, 9])  # Can be iterated repeatedly.
+        self.assertEqual(seq[2], 4)
+        self.assertEqual(seq[-1], 9)
+        self.assertRaises(IndexError, seq.__getitem__, 4)
+        self.assertRaises(IndexError, seq.__getitem__, -5)
+
+
+if __name__ == '__main__':
+    main()
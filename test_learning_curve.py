@@ -0,0 +1,74 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from learning_curve import DecimatedHistory, PlotWriter, plot
+
+
+def _write_args(path, *args):
+    with open(path, 'a') as f_out:
+        print >>f_out, repr(args)
+
+
+class TestDecimatedHistory(unittest.TestCase):
+    def test_short(self):
+        history = DecimatedHistory(max_len=8)
+        for val in [1.0, 2.0, 3.0]:
+            history.add(val)
+
+        index, values = history.points()
+        self.assertEqual(list(index), [0, 1, 2])
+        self.assertEqual(list(values), [1.0, 2.0, 3.0])
+
+    def test_decimation(self):
+        history = DecimatedHistory(max_len=8)
+        vals = np.random.randn(1000)
+        for val in vals:
+            history.add(val)
+
+        index, values = history.points()
+        stride = history.stride
+        self.assertTrue(4 <= len(history) < 8)
+        self.assertEqual(len(history), 1000 // stride)
+        # Each point is the mean of `stride` consecutive values.
+        for k in range(len(history)):
+            self.assertAlmostEqual(values[k], vals[k * stride:(k + 1) * stride].mean())
+            self.assertAlmostEqual(index[k], k * stride + (stride - 1) / 2.0)
+
+
+class TestPlotWriter(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_writer(self):
+        out_file = os.path.join(self.path, 'args.txt')
+        with PlotWriter(_write_args) as writer:
+            self.assertTrue(writer.update(out_file, 1))
+            for i in range(10):
+                writer.update(out_file, 2)  # Dropped while the previous plot waits.
+
+        with open(out_file) as f_in:
+            lines = f_in.read().splitlines()
+
+        self.assertTrue(1 <= len(lines) <= 11)
+        self.assertEqual(lines[0], repr((1, )))
+
+    def test_plot(self):
+        plot_file = os.path.join(self.path, 'lcurve.png')
+        history = DecimatedHistory(max_len=10)
+        for i in range(100):
+            history.add(1.0 / (i + 1))
+
+        with PlotWriter() as writer:
+            writer.update(history.points(), [10, 50], ([], []), ([0.5, 0.3], [0.4, 0.6]), plot_file)
+
+        self.assertTrue(os.path.getsize(plot_file) > 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,9 @@
 import unittest
+from collections import Counter
 
-from metrics import calculate_wer
+import numpy as np
+
+from metrics import calculate_wer, accuracy, calculate_wers, corpus_wer, accuracies, edit_distances, ngram_stats, corpus_bleu, pers
 
 class TestMetrics(unittest.TestCase):
     def test_wer(self):
@@ -9,5 +12,93 @@ class TestMetrics(unittest.TestCase):
         self.assertEqual(calculate_wer([0, 1, 2], [1, 2, 0]), 2.0 / 3)
 
 
+def random_pairs(n):
+    refs = [np.random.randint(0, 4, np.random.randint(1, 9)) for i in range(n)]
+    hyps = [np.random.randint(0, 4, np.random.randint(0, 11)) for i in range(n)]
+
+    return refs, hyps
+
+
+class TestBatchedMetrics(unittest.TestCase):
+    def test_wers(self):
+        refs, hyps = random_pairs(300)
+
+        res = calculate_wers(refs, hyps)
+
+        self.assertEqual(list(res), [calculate_wer(ref, hyp) for ref, hyp in zip(refs, hyps)])
+
+    def test_batch_size(self):
+        refs, hyps = random_pairs(50)
+
+        self.assertEqual(list(edit_distances(refs, hyps, batch_size=7)), list(edit_distances(refs, hyps)))
+
+    def test_edit_distances_empty(self):
+        self.assertEqual(list(edit_distances([[], [1, 2], []], [[3, 4], [], []])), [2, 2, 0])
+
+    def test_corpus_wer(self):
+        self.assertEqual(corpus_wer([[0, 1, 2], [3]], [[0, 1], [4]]), 2.0 / 4)
+
+    def test_accuracies(self):
+        refs, hyps = random_pairs(300)
+
+        res = accuracies(refs, hyps)
+
+        self.assertEqual(list(res), [accuracy(ref, hyp) for ref, hyp in zip(refs, hyps)])
+
+
+def ngrams(seq, n):
+    return Counter(tuple(seq[i:i + n]) for i in range(len(seq) - n + 1))
+
+
+class TestBLEU(unittest.TestCase):
+    def test_ngram_stats(self):
+        refs, hyps = random_pairs(200)
+
+        matches, totals = ngram_stats(refs, hyps, max_n=4)
+
+        for k, (ref, hyp) in enumerate(zip(refs, hyps)):
+            for n in range(1, 5):
+                ref_counts = ngrams(list(ref), n)
+                hyp_counts = ngrams(list(hyp), n)
+                self.assertEqual(totals[k, n - 1], sum(hyp_counts.values()))
+                self.assertEqual(matches[k, n - 1], sum(min(c, ref_counts[g]) for g, c in hyp_counts.items()))
+
+    def test_ngram_stats_large_ids(self):
+        # Different bigrams that would get the same polynomial hash with multiplier 1000003.
+        matches, totals = ngram_stats([[1, 0]], [[0, 1000003]], max_n=2)
+        self.assertEqual(matches.tolist(), [[1, 0]])
+        self.assertEqual(totals.tolist(), [[2, 1]])
+
+        # Keys that do not fit into 64 bits are grouped by sorting the rows.
+        refs = [[2**40, 5, 2**40, 5], [7, 2**40]]
+        hyps = [[5, 2**40, 5, 7], [7, 2**40, 7]]
+        matches, totals = ngram_stats(refs, hyps, max_n=3)
+        self.assertEqual(matches.tolist(), [[3, 2, 1], [2, 1, 0]])
+        self.assertEqual(totals.tolist(), [[4, 3, 2], [3, 2, 1]])
+
+    def test_corpus_bleu(self):
+        refs = [[1, 2, 3, 4, 5], [6, 7, 8, 9]]
+
+        self.assertAlmostEqual(corpus_bleu(refs, refs), 1.0)
+        self.assertEqual(corpus_bleu(refs, [[1, 2], [9, 8]]), 0.0)
+
+        hyps = [[1, 2, 3, 5], [9, 6, 8, 7]]
+        # Precisions 8/8, 2/6, 1/4, 0/2 -> only smoothed BLEU is nonzero.
+        self.assertEqual(corpus_bleu(refs, hyps), 0.0)
+        bp = np.exp(1 - 9.0 / 8)
+        self.assertAlmostEqual(corpus_bleu(refs, hyps, smoothing='epsilon'), bp * (1.0 * 2 / 6 * 1 / 4 * 0.1 / 2)**0.25)
+        self.assertAlmostEqual(corpus_bleu(refs, hyps, smoothing='add1'), bp * (1.0 * 3 / 7 * 2 / 5 * 1 / 3)**0.25)
+        self.assertAlmostEqual(corpus_bleu(refs, hyps, smoothing='exp'), bp * (1.0 * 2 / 6 * 1 / 4 * 0.5 / 2)**0.25)
+        self.assertAlmostEqual(corpus_bleu(refs, hyps, max_n=2), bp * (1.0 * 2 / 6)**0.5)
+
+    def test_pers(self):
+        refs = [[1, 2, 3], [1, 1, 2, 2], [5]]
+        hyps = [[3, 2, 1], [1, 2, 7, 8, 9], []]
+
+        res = pers(refs, hyps)
+
+        self.assertTrue(np.allclose(res, [0.0, 1 - (2.0 - 1) / 4, 1.0]))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,9 +2,12 @@ import unittest
 import numpy as np
 
 from data_calc import DataCalc
+from data_calc2 import DataCalc2
 from db import DB
-from nn import OneHot
-from nton import NTON
+from db2 import DB2
+from nn import OneHot, LazyAdam
+from nton import NTON, evaluate
+from evaluator import BackgroundEvaluator
 from nn.utils import check_finite_differences, TestParamGradInLayer
 
 
@@ -108,6 +111,303 @@ class TestNTON(unittest.TestCase):
             )
             self.assertTrue(check, msg='Failed check for: %s' % param_name)
 
+    def test_backward_gen_multi_query(self):
+        calc = DataCalc2(max_num=5, n_words=20)
+        db = DB2(calc.get_db(), calc.get_vocab())
+        n_words = len(db.vocab)
+
+        emb = OneHot(n_tokens=len(db.vocab))
+
+        nton = NTON(
+            n_tokens=len(db.vocab),
+            db=db,
+            emb=emb,
+            n_cells=5,
+            n_queries=2
+        )
+        nton.print_step = lambda *args, **kwargs: None
+        shapes = [
+            (n_words, ),
+            (nton.n_cells,),
+            (nton.n_cells,),
+            (6, nton.n_cells),
+            (6, n_words)
+        ]
+        check = check_finite_differences(
+            nton.forward_gen_step,
+            nton.backward_gen_step,
+            gen_input_fn=lambda: tuple(np.random.randn(*shp) for shp in shapes),
+            aux_only=True,
+            n_times=10
+        )
+        self.assertTrue(check)
+
+    def test_backward_sparse_input(self):
+        calc = DataCalc(max_num=5, n_words=50)
+        db = DB(calc.get_db(), calc.get_vocab())
+
+        emb = OneHot(n_tokens=len(db.vocab), sparse=True)
+
+        nton = NTON(
+            n_tokens=len(db.vocab),
+            db=db,
+            emb=emb,
+            n_cells=5
+        )
+        nton.print_step = lambda *args, **kwargs: None
+        ((dec_sym, ), _) = emb.forward(([db.vocab['[EOS]']], ))
+
+        ((E, ), _) = emb.forward((np.random.randint(1, len(db.vocab), (5, )), ))
+        ((Y, y), aux) = nton.forward((E, dec_sym[0]))
+        self.assertEqual(Y.shape, (nton.max_gen, len(db.vocab)))
+        (dE, _) = nton.backward(aux, (np.ones_like(Y), None))
+        self.assertIsNone(dE)
+
+        for param_name in ['switch__00__W', 'out_rnn_clf__00__b']:
+            params_shape = nton.params[param_name].shape
+
+            checker = TestParamGradInLayer(nton, param_name, layer_input=(E, dec_sym[0]))
+            check = check_finite_differences(
+                checker.forward,
+                checker.backward,
+                gen_input_fn=lambda: (np.random.randn(*params_shape), ),
+                aux_only=True,
+                test_outputs=(0, ),
+                n_times=10
+            )
+            self.assertTrue(check, msg='Failed check for: %s' % param_name)
+
+    def test_backward_gen_sampled(self):
+        calc = DataCalc(max_num=5, n_words=50)
+        db = DB(calc.get_db(), calc.get_vocab())
+        n_words = len(db.vocab)
+
+        emb = OneHot(n_tokens=len(db.vocab))
+
+        nton = NTON(
+            n_tokens=len(db.vocab),
+            db=db,
+            emb=emb,
+            n_cells=5,
+            n_sampled=5
+        )
+        nton.print_step = lambda *args, **kwargs: None
+        clf_subset = nton.sampler.sample([1, 2])
+        shapes = [
+            (n_words, ),
+            (nton.n_cells,),
+            (nton.n_cells,),
+            (6, nton.n_cells),
+            (6, n_words)
+        ]
+        check = check_finite_differences(
+            lambda inp: nton.forward_gen_step(inp, clf_subset=clf_subset),
+            nton.backward_gen_step,
+            gen_input_fn=lambda: tuple(np.random.randn(*shp) for shp in shapes),
+            aux_only=True,
+            n_times=10
+        )
+        self.assertTrue(check)
+
+    def test_sampled_training(self):
+        calc = DataCalc(max_num=5, n_words=50)
+        db = DB(calc.get_db(), calc.get_vocab())
+        emb = OneHot(n_tokens=len(db.vocab), sparse=True)
+
+        nton = NTON(
+            n_tokens=len(db.vocab),
+            db=db,
+            emb=emb,
+            n_cells=5,
+            n_sampled=3
+        )
+        nton.print_step = lambda *args, **kwargs: None
+        ((dec_sym, ), _) = emb.forward(([db.vocab['[EOS]']], ))
+        ((E, ), _) = emb.forward((np.random.randint(1, len(db.vocab), (5, )), ))
+        targets = np.array([4, 7, 0])
+
+        nton.zero_grads()
+        ((Y, y), aux) = nton.forward((E, dec_sym[0]), targets=targets)
+        nton.backward(aux, (np.ones_like(Y), None))
+
+        cols = aux['gen_aux'][0]['rnn_result_t']['cols']
+        self.assertTrue(set(targets) <= set(cols))
+        others = np.setdiff1d(np.arange(len(db.vocab)), cols)
+        self.assertTrue((nton.grads['out_rnn_clf__00__W'][:, others] == 0).all())
+        self.assertEqual(list(nton.grad_rows('out_rnn_clf__00__W')), list(cols))
+
+        # Only the sampled columns of the output layer are updated and zeroed.
+        W_orig = nton.params['out_rnn_clf__00__W'].copy()
+        LazyAdam(nton.params, nton.grads, rows_fn=nton.grad_rows, axis_fn=nton.grad_axis).update()
+        W = nton.params['out_rnn_clf__00__W']
+        self.assertTrue(np.array_equal(W[:, others], W_orig[:, others]))
+        self.assertFalse(np.any(W[:, cols] == W_orig[:, cols]))
+
+        nton.zero_grads()
+        self.assertTrue((nton.grads.flat == 0.0).all())
+
+        # Without targets (evaluation) the full softmax is used.
+        ((Y, y), aux) = nton.forward((E, dec_sym[0]))
+        self.assertFalse('cols' in aux['gen_aux'][0]['rnn_result_t'])
+
+    def test_shortlist(self):
+        calc = DataCalc(max_num=5, n_words=50)
+        db = DB(calc.get_db(), calc.get_vocab())
+        n_words = len(db.vocab)
+        emb = OneHot(n_tokens=n_words, sparse=True)
+
+        nton = NTON(
+            n_tokens=n_words,
+            db=db,
+            emb=emb,
+            n_cells=5
+        )
+        nton.print_step = lambda *args, **kwargs: None
+        ((dec_sym, ), _) = emb.forward(([db.vocab['[EOS]']], ))
+        ((E, ), _) = emb.forward((np.random.randint(1, n_words, (5, )), ))
+
+        ((Y_exact, y_exact), _) = nton.forward((E, dec_sym[0]))
+
+        # Shortlist of all tokens gives the exact result.
+        nton.shortlist_ids = np.arange(n_words)
+        ((Y, y), _) = nton.forward((E, dec_sym[0]))
+        self.assertTrue(np.allclose(Y, Y_exact))
+        self.assertTrue((y == y_exact).all())
+
+        nton.shortlist_ids = np.array([3, 5])
+        ((Y, y), aux) = nton.forward((E, dec_sym[0]))
+        for step_aux in aux['gen_aux']:
+            cols = set(step_aux['rnn_result_t']['cols'])
+            db_nonzero = np.flatnonzero(step_aux['db_result_t']['w'])
+            self.assertTrue(set([3, 5, db.vocab['[EOS]']]) | set(E.ids) | set(db_nonzero) == cols)
+
+        # Training (with targets) is not affected by the shortlist.
+        ((Y, y), aux) = nton.forward((E, dec_sym[0]), targets=np.array([1, 2]))
+        self.assertFalse('cols' in aux['gen_aux'][0]['rnn_result_t'])
+
+    def test_background_evaluation(self):
+        calc = DataCalc(max_num=5, n_words=50)
+        db = DB(calc.get_db(), calc.get_vocab())
+        emb = OneHot(n_tokens=len(db.vocab), sparse=True)
+
+        nton = NTON(
+            n_tokens=len(db.vocab),
+            db=db,
+            emb=emb,
+            n_cells=5,
+            shortlist_ids=np.array([3, 5])
+        )
+        nton.print_step = lambda *args, **kwargs: None
+        data = calc.gen_data(vocab=db.vocab)
+        examples = [next(data) for i in range(10)]
+
+        with BackgroundEvaluator(nton, lambda model: evaluate(model, emb, db, examples)) as evaluator:
+            evaluator.submit(1)
+            expected = evaluate(nton, emb, db, examples)
+            nton.params.flat[:] = 0.0
+
+            ((step, res), ) = evaluator.results(wait=True)
+
+        self.assertEqual(step, 1)
+        self.assertEqual(sorted(res), sorted(expected))
+        self.assertTrue('exact_wer' in res)
+        for key in res:
+            self.assertAlmostEqual(res[key], expected[key])
+
+    def test_workspace(self):
+        calc = DataCalc(max_num=5, n_words=50)
+        db = DB(calc.get_db(), calc.get_vocab())
+        emb = OneHot(n_tokens=len(db.vocab))
+
+        ntons = []
+        for use_workspace in [False, True]:
+            np.random.seed(1)
+            nton = NTON(
+                n_tokens=len(db.vocab),
+                db=db,
+                emb=emb,
+                n_cells=5,
+                use_workspace=use_workspace
+            )
+            nton.print_step = lambda *args, **kwargs: None
+            ntons.append(nton)
+
+        ((dec_sym, ), _) = emb.forward(([db.vocab['[EOS]']], ))
+        for i in range(3):
+            ((E, ), _) = emb.forward((np.random.randint(1, len(db.vocab), (5, )), ))
+
+            res = []
+            for nton in ntons:
+                nton.zero_grads()
+                ((Y, y), aux) = nton.forward((E, dec_sym[0]))
+                (dE, _) = nton.backward(aux, (np.ones_like(Y), None))
+                res.append((Y.copy(), dE.copy(), [g.copy() for g in nton.grads.values()]))
+
+            self.assertTrue(np.allclose(res[0][0], res[1][0]))
+            self.assertTrue(np.allclose(res[0][1], res[1][1]))
+            for g1, g2 in zip(res[0][2], res[1][2]):
+                self.assertTrue(np.allclose(g1, g2))
+
+    def test_checkpointing(self):
+        calc = DataCalc(max_num=5, n_words=50)
+        db = DB(calc.get_db(), calc.get_vocab())
+
+        for sparse, use_workspace, n_sampled in [(False, False, 0), (False, True, 0), (True, True, 4)]:
+            emb = OneHot(n_tokens=len(db.vocab), sparse=sparse)
+            ((dec_sym, ), _) = emb.forward(([db.vocab['[EOS]']], ))
+            dec_sym = dec_sym[0]
+
+            for checkpoint_every in [1, 3, 10]:
+                ntons = []
+                for nton_checkpoint_every in [0, checkpoint_every]:
+                    np.random.seed(1)
+                    nton = NTON(
+                        n_tokens=len(db.vocab),
+                        db=db,
+                        emb=emb,
+                        n_cells=5,
+                        max_gen=7,
+                        use_workspace=use_workspace,
+                        n_sampled=n_sampled,
+                        checkpoint_every=nton_checkpoint_every
+                    )
+                    nton.print_step = lambda *args, **kwargs: None
+                    ntons.append(nton)
+
+                ((E, ), _) = emb.forward((np.random.randint(1, len(db.vocab), (5, )), ))
+                targets = np.array([3, 1, 4, 1, 5])
+                dY = np.random.randn(7, len(db.vocab))
+
+                res = []
+                for nton in ntons:
+                    np.random.seed(2)  # The same sample for the sampled softmax.
+                    nton.zero_grads()
+                    ((Y, y), aux) = nton.forward((E, dec_sym), targets=targets)
+                    (dE, dx) = nton.backward(aux, (dY, None))
+                    res.append((Y.copy(), None if dE is None else dE.copy(), nton.grads.flat.copy()))
+
+                self.assertTrue('checkpoints' in aux)
+                self.assertEqual(len(aux['checkpoints']), -(-7 // checkpoint_every))
+                self.assertTrue(np.array_equal(res[0][0], res[1][0]))
+                self.assertTrue(res[0][1] is None and res[1][1] is None or np.array_equal(res[0][1], res[1][1]))
+                self.assertTrue(np.array_equal(res[0][2], res[1][2]))
+
+        # The workspace does not grow with the length of the answer.
+        emb = OneHot(n_tokens=len(db.vocab), sparse=True)
+        ((dec_sym, ), _) = emb.forward(([db.vocab['[EOS]']], ))
+        n_forward = []
+        n_backward = []
+        for max_gen in [4, 16, 64]:
+            nton = NTON(n_tokens=len(db.vocab), db=db, emb=emb, n_cells=5, max_gen=max_gen, use_workspace=True, checkpoint_every=2)
+            nton.print_step = lambda *args, **kwargs: None
+            ((Y, y), aux) = nton.forward((emb.forward(([1, 2, 3], ))[0][0], dec_sym[0]))
+            n_forward.append(nton.workspace.n_buffers())
+            nton.backward(aux, (np.ones_like(Y), None))
+            n_backward.append(nton.workspace.n_buffers() - n_forward[-1])
+
+        self.assertEqual(len(set(n_forward)), 1)
+        self.assertEqual(len(set(n_backward)), 1)
+
 
 if __name__ == '__main__':
     np.random.seed(0)
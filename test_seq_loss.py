@@ -3,7 +3,9 @@ import numpy as np
 
 from nn.utils import check_finite_differences
 
-from seq_loss import SeqLoss
+from nn import Softmax
+
+from seq_loss import SeqLoss, SoftmaxSeqLoss
 
 
 class TestSeqLoss(TestCase):
@@ -32,7 +34,70 @@ class TestSeqLoss(TestCase):
             )
         )
 
+    def test_batch_padded(self):
+        y_hat = np.random.dirichlet([1, 1, 1], (5, 4))
+        y_true = np.random.randint(3, size=(5, 4))
+        y_true[3:, 1] = -1
+        y_true[1:, 2] = -1
+
+        ((res, ), aux) = SeqLoss.forward((y_hat, y_true))
+        (grad, ) = SeqLoss.backward(aux, 1.0)
+
+        exp_res = 0.0
+        exp_grad = np.zeros_like(y_hat)
+        for t in range(5):
+            for b in range(4):
+                if y_true[t, b] != -1:
+                    exp_res -= np.log(y_hat[t, b, y_true[t, b]])
+                    exp_grad[t, b, y_true[t, b]] = -1.0 / y_hat[t, b, y_true[t, b]]
+
+        self.assertTrue(np.allclose(res, exp_res / 20))
+        self.assertTrue(np.allclose(grad, exp_grad / 20))
+
+
+class TestSoftmaxSeqLoss(TestCase):
+    def test_forward(self):
+        x = np.random.randn(6, 3, 5)
+        y_true = np.random.randint(5, size=(6, 3))
+        y_true[4:, 0] = -1
+
+        ((res, ), _) = SoftmaxSeqLoss.forward((x, y_true))
+        ((p, ), _) = Softmax.forward((x, ))
+        ((exp_res, ), _) = SeqLoss.forward((p, y_true))
+
+        self.assertTrue(np.allclose(res, exp_res))
+
+    def test_backward_is_p_minus_onehot(self):
+        x = np.random.randn(4, 5)
+        y_true = np.array([1, -1, 0, 4])
+
+        ((res, ), aux) = SoftmaxSeqLoss.forward((x, y_true))
+        (grad, ) = SoftmaxSeqLoss.backward(aux, 1.0)
 
+        ((p, ), _) = Softmax.forward((x, ))
+        exp_grad = p.copy()
+        exp_grad[[0, 2, 3], [1, 0, 4]] -= 1.0
+        exp_grad[1] = 0.0
+
+        self.assertTrue(np.allclose(grad, exp_grad / 4))
+
+    def test_large_scores(self):
+        x = np.array([[1000.0, 0.0], [0.0, -1000.0]])
+
+        ((res, ), _) = SoftmaxSeqLoss.forward((x, np.array([1, 1])))
+
+        self.assertTrue(np.isfinite(res))
+        self.assertTrue(np.allclose(res, (1000.0 + 1000.0) / 2))
+
+    def test_backward(self):
+        self.assertTrue(
+            check_finite_differences(
+                SoftmaxSeqLoss.forward,
+                SoftmaxSeqLoss.backward,
+                gen_input_fn=lambda: (np.random.randn(7, 2, 4), np.random.randint(-1, 4, size=(7, 2))),
+                aux_only=True
+            )
+        )
 
 
 if __name__ == '__main__':
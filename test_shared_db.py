@@ -0,0 +1,74 @@
+from unittest import TestCase, main
+import multiprocessing
+import shutil
+import tempfile
+
+import numpy as np
+
+from db import DB
+from shared_db import publish, SharedDB
+from data_calc import DataCalc
+
+
+def _lookup_in_worker((path, word)):
+    db = SharedDB(path)
+    return db.vocab.rev(db.forward((db.get_vector(word), ))[0][0].argmax())
+
+
+class TestSharedDB(TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def test_same_as_db(self):
+        data = DataCalc(max_num=10)
+        db = DB(data.get_db(), data.get_vocab(), impl='fast')
+        publish(db, self.path)
+
+        sdb = SharedDB(self.path)
+
+        self.assertEqual(len(sdb.vocab), len(db.vocab))
+        for word in db.vocab:
+            self.assertEqual(sdb.vocab[word], db.vocab[word])
+            self.assertEqual(sdb.vocab.rev(db.vocab[word]), word)
+        self.assertFalse('not-a-word' in sdb.vocab)
+        self.assertEqual(list(sdb.content), list(data.get_db()))
+        self.assertRaises(KeyError, sdb.vocab.add, 'not-a-word')
+
+        for i in range(20):
+            x = np.random.randn(len(db.vocab))
+
+            ((y1, ), aux1) = db.forward((x, ))
+            ((y2, ), aux2) = sdb.forward((x, ))
+            self.assertTrue(np.array_equal(y1, y2))
+
+            dy = np.random.randn(*y1.shape)
+            (dx1, ) = db.backward(aux1, (dy, ))
+            (dx2, ) = sdb.backward(aux2, (dy, ))
+            self.assertTrue(np.array_equal(dx1, dx2))
+
+    def test_normal_impl(self):
+        data = DataCalc(max_num=5)
+        db = DB(data.get_db(), data.get_vocab(), impl='normal')
+        publish(db, self.path)
+
+        sdb = SharedDB(self.path, impl='normal')
+        self.assertTrue(np.array_equal(sdb.entries_a, db.entries_a))
+        self.assertTrue(np.array_equal(sdb.entries_c, db.entries_c))
+
+    def test_workers(self):
+        data = DataCalc(max_num=10)
+        publish(DB(data.get_db(), data.get_vocab()), self.path)
+
+        pool = multiprocessing.Pool(2)
+        res = pool.map(_lookup_in_worker, [(self.path, '5+3'), (self.path, '1+6')])
+        pool.close()
+        pool.join()
+
+        self.assertEqual(res, ['8', '7'])
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,12 @@
-from unittest import TestCase
+import os
+import shutil
+import tempfile
+import unittest
 
 from vocab import Vocab
 
 
-class TestVocab(TestCase):
+class TestVocab(unittest.TestCase):
     def test_add(self):
         v = Vocab()
         v.add('a')
@@ -17,3 +20,58 @@ class TestVocab(TestCase):
 
         self.assertEqual(v.rev(3), 'd')
         self.assertEqual(v.rev(0), 'a')
+
+    def test_iter(self):
+        v = Vocab()
+        for word in ['x', 'b', 'a', 'b']:
+            v.add(word)
+
+        self.assertEqual(list(v), ['x', 'b', 'a'])
+
+    def test_encode_decode(self):
+        v = Vocab()
+        sentences = [['a', 'b', 'c'], [], ['c', 'd']]
+
+        ids, lens = v.encode(sentences)
+
+        self.assertEqual(ids.tolist(), [[0, 1, 2], [-1, -1, -1], [2, 3, -1]])
+        self.assertEqual(lens.tolist(), [3, 0, 2])
+        self.assertEqual(v.decode(ids), sentences)
+        self.assertEqual(v.decode(ids, lens), sentences)
+        self.assertEqual(list(v.add_words(['d', 'e'])), [3, 4])
+
+        v.freeze()
+        with self.assertRaises(KeyError):
+            v.encode([['f']])
+
+    def test_decode_empty(self):
+        v = Vocab()
+        ids, lens = v.encode([[], []])
+
+        self.assertEqual(ids.shape, (2, 0))
+        self.assertEqual(v.decode(ids), [[], []])
+        self.assertEqual(v.decode(ids, lens), [[], []])
+        self.assertEqual(v.decode(v.encode([])[0]), [])
+
+    def test_save_load(self):
+        v = Vocab()
+        for word in ['[EOS]', 'w001', u'\u017e', '1+2', '']:
+            v.add(word)
+        v.freeze()
+
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp_dir, 'vocab.npz')
+            v.save(path)
+            v2 = Vocab.load(path)
+        finally:
+            shutil.rmtree(tmp_dir)
+
+        self.assertEqual(list(v2), ['[EOS]', 'w001', u'\u017e'.encode('utf-8'), '1+2', ''])
+        self.assertEqual(v2['1+2'], 3)
+        self.assertEqual(v2.rev(4), '')
+        self.assertTrue(v2.frozen)
+
+
+if __name__ == '__main__':
+    unittest.main()
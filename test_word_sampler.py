@@ -0,0 +1,31 @@
+import unittest
+import numpy as np
+
+from word_sampler import WordSampler
+
+
+class TestWordSampler(unittest.TestCase):
+    def test_same_as_choice(self):
+        p = np.random.dirichlet(np.ones(30))
+        sampler = WordSampler(p)
+
+        np.random.seed(5)
+        res = sampler.sample(100)
+
+        np.random.seed(5)
+        exp_res = [np.random.choice(30, p=p) for i in range(100)]
+
+        self.assertEqual(list(res), exp_res)
+
+    def test_distribution(self):
+        p = np.array([0.1, 0.0, 0.6, 0.3])
+        sampler = WordSampler(p)
+
+        res = sampler.sample(20000, random_state=np.random.RandomState(0))
+
+        self.assertEqual(len(sampler), 4)
+        self.assertTrue(np.allclose(np.bincount(res, minlength=4) / 20000.0, p, atol=0.02))
+
+
+if __name__ == '__main__':
+    unittest.main()
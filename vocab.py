@@ -1,11 +1,17 @@
+import numpy as np
+
+
 class Vocab(dict):
+    """Mapping word -> id (the dict itself) with the words stored contiguously
+    in the order of their ids, so iteration, `rev` and bulk decoding do not need
+    a reverse dict or sorting."""
     def __init__(self):
-        self._rev = dict()
+        self._words = []
+        self._table = None  # Cached numpy array of the words for bulk decoding.
         self.frozen = False
 
     def __iter__(self):
-        for k, v in sorted(self.items(), key=lambda x: x[1]):
-            yield k
+        return iter(self._words)
 
     def freeze(self):
         self.frozen = True
@@ -17,9 +23,74 @@ class Vocab(dict):
 
             val = len(self)
             self[word] = val
-            self._rev[val] = word
+            self._words.append(word)
+            self._table = None
 
         return self[word]
 
     def rev(self, word_id):
-        return self._rev[word_id]
\ No newline at end of file
+        return self._words[word_id]
+
+    def add_words(self, words):
+        """Array of ids of the words (new words are added as by `add`)."""
+        if self.frozen:
+            return np.array(map(self.__getitem__, words), dtype=int)  # Lookups without Python calls.
+
+        return np.fromiter((self.add(word) for word in words), dtype=int, count=len(words))
+
+    def encode(self, sentences, pad_value=-1):
+        """Ids of words of all sentences as a (n_sentences, max_len) array padded
+        with `pad_value`, and the lengths of the sentences."""
+        lens = np.fromiter((len(sentence) for sentence in sentences), dtype=int, count=len(sentences))
+        flat = [word for sentence in sentences for word in sentence]
+
+        res = np.empty((len(sentences), lens.max() if len(lens) else 0), dtype=int)
+        res.fill(pad_value)
+        res[np.arange(res.shape[1]) < lens[:, np.newaxis]] = self.add_words(flat)
+
+        return res, lens
+
+    def words_table(self):
+        """Numpy array of all words indexed by their ids."""
+        if self._table is None:
+            self._table = np.empty((len(self._words), ), dtype=object)
+            self._table[:] = self._words
+
+        return self._table
+
+    def decode(self, ids, lens=None):
+        """Lists of words of the rows of `ids` (2D array of ids, e.g. from `encode`).
+        Each row is cut to its length in `lens`, or at the first negative id (padding)."""
+        ids = np.asarray(ids)
+        if lens is None:
+            lens = (ids >= 0).cumprod(axis=1).sum(axis=1)  # Number of ids before the first negative one.
+
+        words = self.words_table()[np.maximum(ids, 0)]
+
+        return [list(row[:n]) for row, n in zip(words, lens)]
+
+    def save(self, path):
+        """Save the words into a binary file (utf-8 bytes of all words concatenated
+        and their offsets)."""
+        words = [word.encode('utf-8') if isinstance(word, unicode) else word for word in self._words]
+        offsets = np.zeros((len(words) + 1, ), dtype=np.int64)
+        offsets[1:] = np.cumsum([len(word) for word in words])
+
+        with open(path, 'wb') as f_out:
+            np.savez(f_out, data=np.frombuffer("".join(words), dtype=np.uint8), offsets=offsets, frozen=self.frozen)
+
+    @classmethod
+    def load(cls, path):
+        """Load the vocabulary saved by `save` (words are loaded as byte strings)."""
+        with open(path, 'rb') as f_in:
+            arrays = np.load(f_in)
+            data = arrays['data'].tostring()
+            offsets = arrays['offsets']
+            frozen = bool(arrays['frozen'])
+
+        res = cls()
+        res._words = [data[start:end] for start, end in zip(offsets[:-1], offsets[1:])]
+        res.update(zip(res._words, xrange(len(res._words))))
+        res.frozen = frozen
+
+        return res
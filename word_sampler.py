@@ -0,0 +1,22 @@
+import numpy as np
+
+
+class WordSampler(object):
+    """Draws word ids from a fixed distribution `p`.
+
+    The CDF is computed once and whole batches of ids are drawn with one
+    `searchsorted`. It is the same computation `np.random.choice(len(p), p=p)`
+    does on every call, so n ids drawn at once equal n ids drawn by consecutive
+    `np.random.choice` calls from the same random state."""
+    def __init__(self, p):
+        cdf = np.cumsum(p, dtype=float)
+        cdf /= cdf[-1]
+
+        self.cdf = cdf
+
+    def __len__(self):
+        return len(self.cdf)
+
+    def sample(self, n, random_state=np.random):
+        """Array of `n` word ids."""
+        return self.cdf.searchsorted(random_state.random_sample(n), side='right')